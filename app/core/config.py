@@ -1,12 +1,92 @@
-from typing import ClassVar
+from typing import Any, Dict, Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
         DB_URL:str
+        DB_ECHO: bool = False
+        DB_POOL_SIZE: int = 10
+        DB_MAX_OVERFLOW: int = 10
+        DB_POOL_TIMEOUT_S: float = 30.0
+        DB_POOL_RECYCLE_S: int = 1800
+        SEARCH_FAST_PATH: bool = True  # serve /query vector searches from the asyncpg pool
+        SEARCH_POOL_MIN_SIZE: int = 2
+        SEARCH_POOL_MAX_SIZE: int = 10
+        SEARCH_STATEMENT_CACHE_SIZE: int = 256
+        DB_SLOW_QUERY_MS: float = 500.0
+        METRICS_MULTIPROC_DIR: str = ""  # prefork workers' metric snapshots, default a temp dir
+        METRICS_PUBLISH_S: float = 5.0
+        DB_SLOW_QUERY_SAMPLE_RATE: float = 1.0  # fraction of slow statements logged
         GROQ_API:str
-        GROQ_TRANSCRIPTION_URL:ClassVar[str] = "https://api.groq.com/openai/v1/audio/transcriptions"
-        MAX_AUDIO_SIZE_MB :ClassVar[int]= 10      
-        MAX_AUDIO_DURATION_MIN :ClassVar[int]= 20  
+        GROQ_TRANSCRIPTION_URL: str = "https://api.groq.com/openai/v1/audio/transcriptions"
+        TRANSCRIPTION_MODEL: str = "whisper-large-v3-turbo"
+        TRANSCRIPTION_CONCURRENCY: int = 4
+        TRANSCRIPTION_SEGMENT_SEC: float = 600
+        TRANSCRIPTION_OVERLAP_SEC: float = 2
+        TRANSCRIPTION_MAX_RETRIES: int = 4
+        TRANSCRIPTION_BACKOFF_SEC: float = 0.5
+        EMBED_BACKEND: str = "bge-small-en-v1.5"  # see app/core/embedding_backends.py
+        EMBED_BACKENDS: Dict[str, Dict[str, Any]] = {}  # extra backends, by name
+        EMBED_BACKEND_POLL_S: float = 5.0  # how soon processes follow a migration's swap
+        EMBED_MAX_BATCH_SIZE: int = 64
+        EMBED_MAX_WAIT_MS: float = 5.0
+        EMBED_WORKERS: int = 1
+        EMBED_CACHE_DIR: str = "models"  # pinned model cache, shared by restarts
+        EMBED_LOCAL_FILES_ONLY: bool = False  # never download; the cache must be filled
+        EMBED_THREADS: Optional[int] = None  # ONNX Runtime threads, defaults to all cores
+        EMBED_WARMUP: bool = True  # run an inference before reporting ready
+        HEALTH_DB_TIMEOUT_S: float = 2.0
+        REEMBED_BATCH_SIZE: int = 256  # chunks re-embedded per transaction
+        REEMBED_PAUSE_S: float = 0.1  # between batches, to leave room for live traffic
+        SERVER_HOST: str = "127.0.0.1"
+        SERVER_PORT: int = 8000
+        SERVER_WORKERS: int = 0  # prefork workers (python main.py), 0 for one per core
+        SERVER_GRACEFUL_TIMEOUT_S: float = 30.0
+        SERVER_MAX_REQUESTS: int = 0  # recycle a worker after this many requests, 0 never
+        QUERY_CACHE_MAX_ENTRIES: int = 10_000
+        QUERY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+        QUERY_CACHE_TTL_S: float = 3600.0
+        RESULT_CACHE_MAX_ENTRIES: int = 10_000  # 0 disables the result cache
+        RESULT_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+        RESULT_CACHE_TTL_S: float = 300.0
+        RESULT_CACHE_REDIS_URL: str = ""  # shared tier, needed with several workers
+        CHUNK_MAX_TOKENS: int = 256  # bge-small truncates at 512
+        CHUNK_OVERLAP_TOKENS: int = 32
+        INGEST_BATCH_SIZE: int = 64
+        INGEST_QUEUE_SIZE: int = 4
+        INGEST_DEDUP: bool = True  # clone the chunks of byte-identical earlier uploads
+        UPSERT_METHOD: str = "copy"
+        HYBRID_CANDIDATES: int = 40  # pgvector's default hnsw.ef_search
+        HYBRID_RRF_K: int = 60
+        HYBRID_TEXT_MATCHES: int = 1000  # full-text matches ranked per hybrid query
+        HNSW_EF_SEARCH: int = 40
+        HNSW_MAX_EF_SEARCH: int = 1000
+        HNSW_ITERATIVE_SCAN: str = ""  # "relaxed_order" needs pgvector >= 0.8
+        SEARCH_EXACT_MAX_ROWS: int = 20_000
+        SEARCH_FILTERED_MAX_SELECTIVITY: float = 0.5
+        PLAN_CACHE_TTL_S: float = 60.0
+        DOC_ROUTING: bool = True  # rank documents by their centroids first
+        DOC_ROUTE_DOCUMENTS: int = 20  # documents whose chunks are then compared
+        DOC_SECTION_CENTROIDS: int = 4  # extra centroids per long document, 0 for none
+        DOC_SECTION_MIN_CHUNKS: int = 32
+        VECTOR_INDEX_MODE: str = "full"  # "halfvec" / "binary" need pgvector >= 0.7
+        VECTOR_RERANK_OVERSAMPLE: int = 4  # binary usually needs ~10
+        CHUNK_PARTITIONING: str = ""  # "hash" or "list" on owner_id, fixed at table creation
+        CHUNK_HASH_PARTITIONS: int = 16
+        JOB_WORKER_CONCURRENCY: int = 2  # jobs run at once per `python -m app.worker`
+        JOB_POLL_INTERVAL_S: float = 1.0
+        JOB_MAX_ATTEMPTS: int = 5
+        JOB_RETRY_BACKOFF_S: float = 5.0
+        JOB_RETRY_MAX_BACKOFF_S: float = 600.0
+        JOB_HEARTBEAT_S: float = 10.0
+        JOB_STALE_AFTER_S: float = 120.0  # running jobs without a heartbeat are requeued
+        JOB_PAYLOAD_DIR: str = "job_payloads"  # queued uploads; shared by the API and workers
+        PARSE_WORKERS: Optional[int] = None  # defaults to the CPU count
+        PARSE_CONCURRENCY: Dict[str, int] = {"pdf": 4, "image": 2}
+        PDF_PAGES_PER_TASK: int = 8
+        PDF_MAX_INFLIGHT_TASKS: int = 4
+        MAX_UPLOAD_BYTES: int = 100 * 1024 * 1024
+        MAX_REQUEST_BYTES: int = 500 * 1024 * 1024
+        UPLOAD_SPOOL_THRESHOLD: int = 8 * 1024 * 1024
             
         class Config:
             env_file = ".env"
@@ -1,15 +1,29 @@
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
-from app.models import Base, Document, Chunk
+from app.core import metrics
+from app.core.document_index import create_document_index
+from app.core.partitioning import create_partitions
+from app.core.vector_codec import register_vector_codecs
+from app.core.vector_index import create_vector_index
+from app.models import Base, Document, Chunk, EMBEDDING_DIM, TEXT_TSV_EXPRESSION
+import logging
+import random
+import time
 
-from sqlalchemy import text as sql_text
+from sqlalchemy import event, text as sql_text
+
+logger = logging.getLogger(__name__)
 
 
 engine = create_async_engine(
     settings.DB_URL,
-    echo=True,
+    echo=settings.DB_ECHO,
     future=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT_S,
+    pool_recycle=settings.DB_POOL_RECYCLE_S,
 )
 
 AsyncSessionLocal: sessionmaker[AsyncSession] = sessionmaker(  # type: ignore
@@ -19,11 +33,74 @@ AsyncSessionLocal: sessionmaker[AsyncSession] = sessionmaker(  # type: ignore
 )  # type: ignore
 
 
+@event.listens_for(engine.sync_engine, "connect")
+def _register_vector_codecs(dbapi_connection, connection_record):
+    if engine.dialect.driver != "asyncpg":
+        return
+
+    async def register(conn):
+        try:
+            await register_vector_codecs(conn)
+        except ValueError:
+            # pgvector isn't installed yet; init_db() drops these connections.
+            logger.debug("vector type not found, skipping codec registration")
+
+    dbapi_connection.run_async(register)
+
+
+_STATEMENT_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "COPY"}
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._statement_start = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_statement_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    operation = (statement.lstrip()[:16].split(None, 1) or [""])[0].upper()
+    if operation not in _STATEMENT_OPERATIONS:
+        operation = "OTHER"
+    metrics.DB_STATEMENT_SECONDS.labels(operation).observe(elapsed)
+
+    if elapsed * 1000 >= settings.DB_SLOW_QUERY_MS:
+        metrics.DB_SLOW_STATEMENTS.labels(operation).inc()
+        if random.random() < settings.DB_SLOW_QUERY_SAMPLE_RATE:
+            logger.warning(
+                "slow query (%.0f ms): %s", elapsed * 1000, " ".join(statement.split())[:2000]
+            )
+
+
+metrics.registry.gauge(
+    "db_pool_size", "Connections kept in the pool.", lambda: engine.pool.size()
+)
+metrics.registry.gauge(
+    "db_pool_checked_out", "Connections in use.", lambda: engine.pool.checkedout()
+)
+metrics.registry.gauge(
+    "db_pool_overflow",
+    "Connections opened beyond pool_size.",
+    lambda: max(engine.pool.overflow(), 0),
+)
+
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
 
 
+async def get_asyncpg_connection(session: AsyncSession):
+    """Return the asyncpg connection behind the session's current transaction."""
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    return raw.driver_connection
+
+
 async def init_vector_schema(conn: AsyncConnection):
     """Ensure pgvector extension and create tables."""
     await conn.execute(sql_text("CREATE EXTENSION IF NOT EXISTS vector;"))
@@ -31,16 +108,30 @@ async def init_vector_schema(conn: AsyncConnection):
 
 
 async def create_hnsw_index(
-    conn: AsyncConnection, m: int = 16, ef_construction: int = 64
+    conn: AsyncConnection,
+    m: int = 16,
+    ef_construction: int = 64,
+    mode: str = settings.VECTOR_INDEX_MODE,
 ):
     """Create a HNSW index for fast ANN search (cosine distance)."""
-    await conn.execute(
+    await create_vector_index(conn, mode, m, ef_construction)
+
+
+async def check_embedding_dim(conn: AsyncConnection):
+    """Fail if `chunks.embedding` was created (or migrated) for another dimension."""
+    result = await conn.execute(
         sql_text(
-            "CREATE INDEX IF NOT EXISTS idx_chunks_embedding_hnsw "
-            "ON chunks USING hnsw (embedding vector_cosine_ops) "
-            f"WITH (m = {m}, ef_construction = {ef_construction});"
+            "SELECT atttypmod FROM pg_attribute "
+            "WHERE attrelid = 'chunks'::regclass AND attname = 'embedding'"
         )
     )
+    dim = result.scalar_one()
+    if dim != EMBEDDING_DIM:
+        raise RuntimeError(
+            f"chunks.embedding has {dim} dimensions but EMBED_BACKEND="
+            f"{settings.EMBED_BACKEND!r} has {EMBEDDING_DIM}; set EMBED_BACKEND "
+            "to the backend the corpus was embedded with."
+        )
 
 
 async def init_db():
@@ -48,15 +139,50 @@ async def init_db():
         # 1. Make sure pgvector is available
         await conn.execute(sql_text("CREATE EXTENSION IF NOT EXISTS vector;"))
 
-        # 2. Create all ORM tables
+        # 2. Create all ORM tables (and the chunks partitions, if enabled)
         await conn.run_sync(Base.metadata.create_all)
+        await create_partitions(conn)
 
     # 3. Open a new connection (after tables exist) to create the index
+    async with engine.begin() as conn:
+        await create_hnsw_index(conn)
+
+    # 4. Tables created before hybrid search lack the full-text column
     async with engine.begin() as conn:
         await conn.execute(
             sql_text(
-                "CREATE INDEX IF NOT EXISTS idx_chunks_embedding_hnsw "
-                "ON chunks USING hnsw (embedding vector_cosine_ops) "
-                "WITH (m = 16, ef_construction = 64);"
+                "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS text_tsv tsvector "
+                f"GENERATED ALWAYS AS ({TEXT_TSV_EXPRESSION}) STORED;"
             )
         )
+        await conn.execute(
+            sql_text(
+                "CREATE INDEX IF NOT EXISTS idx_chunks_text_tsv "
+                "ON chunks USING gin (text_tsv);"
+            )
+        )
+        # ... and the embedding backend of each chunk
+        await conn.execute(
+            sql_text("ALTER TABLE chunks ADD COLUMN IF NOT EXISTS embedding_model text;")
+        )
+        await check_embedding_dim(conn)
+        # ... and the upload each document was ingested from
+        await conn.execute(
+            sql_text(
+                "ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_sha256 text, "
+                "ADD COLUMN IF NOT EXISTS parser_version text;"
+            )
+        )
+        await conn.execute(
+            sql_text(
+                "CREATE INDEX IF NOT EXISTS idx_documents_content_sha256 "
+                "ON documents (content_sha256, parser_version);"
+            )
+        )
+
+    # 5. Per-document centroids, backfilled for existing chunks
+    async with engine.begin() as conn:
+        await create_document_index(conn)
+
+    # 6. Connections opened before pgvector existed lack the vector codec
+    await engine.dispose()
@@ -0,0 +1,106 @@
+"""
+Per-document centroid vectors (`document_embeddings`) for routing
+document-level queries.
+
+Every document has a centroid (section 0), the mean of its chunk
+embeddings. Documents with at least `DOC_SECTION_MIN_CHUNKS` chunks also
+get `DOC_SECTION_CENTROIDS` sub-centroids over contiguous runs of chunks,
+so a long document that matches in one place is still found. Cosine
+distance ignores magnitude, so means need no normalizing.
+
+Rows are recomputed from a document's chunks by
+`refresh_document_embeddings`, in the transaction that changed them.
+"""
+
+from typing import List, Optional
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.core.config import settings
+
+INDEX_NAME = "idx_document_embeddings_hnsw"
+INDEX_SQL = (
+    f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+    "ON document_embeddings USING hnsw (embedding vector_cosine_ops);"
+)
+
+
+def _refresh_sql(
+    where_sql: str, column: str = "embedding", table: str = "document_embeddings"
+) -> str:
+    centroids = f"""
+        SELECT document_id, 0, min(owner_id), count(*), avg({column})
+        FROM chunks
+        WHERE {where_sql}
+        GROUP BY document_id
+    """
+    sections = settings.DOC_SECTION_CENTROIDS
+    if sections > 0:
+        centroids += f"""
+        UNION ALL
+        SELECT document_id, section, min(owner_id), count(*), avg({column})
+        FROM (
+            SELECT
+                document_id,
+                owner_id,
+                {column},
+                ntile({int(sections)}) OVER (
+                    PARTITION BY document_id ORDER BY chunk_index, id
+                ) AS section,
+                count(*) OVER (PARTITION BY document_id) AS document_chunks
+            FROM chunks
+            WHERE {where_sql}
+        ) s
+        WHERE document_chunks >= {int(settings.DOC_SECTION_MIN_CHUNKS)}
+        GROUP BY document_id, section
+        """
+    return f"""
+        INSERT INTO {table}
+            (document_id, section, owner_id, chunk_count, embedding)
+        {centroids}
+    """
+
+
+async def refresh_document_embeddings(
+    db: AsyncSession | AsyncConnection,
+    document_ids: Optional[List[int]],
+    column: str = "embedding",
+    table: str = "document_embeddings",
+):
+    """
+    Recompute the centroids of `document_ids` (all documents when None)
+    from their current chunks' `column` into `table`. Does not commit.
+    """
+    if document_ids is None:
+        await db.execute(sql_text(f"DELETE FROM {table}"))
+        await db.execute(sql_text(_refresh_sql(f"{column} IS NOT NULL", column, table)))
+        return
+    if not document_ids:
+        return
+    params = {"document_ids": list(document_ids)}
+    await db.execute(
+        sql_text(f"DELETE FROM {table} WHERE document_id = ANY(:document_ids)"),
+        params,
+    )
+    await db.execute(
+        sql_text(
+            _refresh_sql(
+                f"document_id = ANY(:document_ids) AND {column} IS NOT NULL", column, table
+            )
+        ),
+        params,
+    )
+
+
+async def create_document_index(conn: AsyncConnection):
+    """Create the centroid HNSW index, backfilling centroids on first run."""
+    await conn.execute(sql_text(INDEX_SQL))
+    result = await conn.execute(
+        sql_text(
+            "SELECT NOT EXISTS (SELECT 1 FROM document_embeddings) "
+            "AND EXISTS (SELECT 1 FROM chunks)"
+        )
+    )
+    if result.scalar_one():
+        await refresh_document_embeddings(conn, None)
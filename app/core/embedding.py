@@ -1,29 +1,306 @@
-from fastembed import TextEmbedding
-from asyncio import Lock
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+from tokenizers import Tokenizer
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.embedding_backends import EmbeddingBackend, active_backend
+
+if TYPE_CHECKING:
+    from fastembed import TextEmbedding
+
+# fastembed's `NumpyArray`, without importing fastembed (and onnxruntime)
+# along with the app; the model is loaded in the background at startup.
+NumpyArray = (
+    NDArray[np.float64]
+    | NDArray[np.float32]
+    | NDArray[np.float16]
+    | NDArray[np.int8]
+    | NDArray[np.int64]
+    | NDArray[np.int32]
+)
+
+
+def load_text_embedding(backend: EmbeddingBackend) -> "TextEmbedding":
+    """
+    Load `backend`'s model, read from (or downloaded into) EMBED_CACHE_DIR.
+
+    ONNX Runtime uses the backend's threads (EMBED_THREADS by default) with
+    full graph optimization.
+    """
+    from fastembed import TextEmbedding
+
+    if backend.custom and not any(
+        m.model.lower() == backend.model.lower()
+        for m in TextEmbedding._list_supported_models()
+    ):
+        from fastembed.common.model_description import ModelSource, PoolingType
+
+        TextEmbedding.add_custom_model(
+            backend.model,
+            pooling=PoolingType(backend.pooling),
+            normalization=backend.normalization,
+            sources=ModelSource(hf=backend.hf_repo),
+            dim=backend.dim,
+            model_file=backend.model_file or "onnx/model.onnx",
+        )
+    return TextEmbedding(
+        model_name=backend.model,
+        cache_dir=settings.EMBED_CACHE_DIR or None,
+        threads=backend.num_threads,
+        local_files_only=settings.EMBED_LOCAL_FILES_ONLY,
+    )
+
 
 class EmbbedModel:
-    _instance = None
-    _lock = Lock()
-    def __init__(self) -> None:
-        self.embed_model=None
-        
+    def __init__(self, backend: Optional[EmbeddingBackend] = None) -> None:
+        # None follows active_backend() until the model is loaded.
+        self._backend = backend
+        self.embed_model: Optional["TextEmbedding"] = None
+        self.tokenizer: Optional[Tokenizer] = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self) -> EmbeddingBackend:
+        return self._backend or active_backend()
+
+    @property
+    def loaded(self) -> bool:
+        return self.embed_model is not None
+
     def init(self):
-        if self.embed_model is None:
-            self.embed_model = TextEmbedding(model_name="BAAI/bge-small-en-v1.5")
-   
-    @classmethod
-    async def get_instance(cls):
-        if cls._instance is None:
-            async with cls._lock:
-                if cls._instance is None:
-                    instance = super().__new__(cls)
-                    instance.model = TextEmbedding()
-                    cls._instance = instance
-        return cls._instance
+        """Load the model once; callers from other threads wait for it."""
+        if self.embed_model is not None:
+            return
+        with self._lock:
+            if self.embed_model is None:
+                self._backend = self.backend
+                self.embed_model = load_text_embedding(self._backend)
+
+    def switch(self, backend: EmbeddingBackend):
+        """
+        Load `backend` and swap it in. Batches already running finish on the
+        old model; later ones use the new one.
+        """
+        model = load_text_embedding(backend)
+        with self._lock:
+            self._backend = backend
+            self.embed_model = model
+            self.tokenizer = None
+
 
 embbed_model=EmbbedModel()
 
-def get_embbed()->TextEmbedding:
-    if embbed_model.embed_model is None:
-        print("that thing is not inited")
-    return embbed_model.embed_model
\ No newline at end of file
+def get_embbed() -> "TextEmbedding":
+    """The embedding model, loaded on first use."""
+    embbed_model.init()
+    return embbed_model.embed_model  # type: ignore[return-value]
+
+
+def get_tokenizer() -> Tokenizer:
+    """
+    The embedding model's tokenizer, for measuring text in model tokens.
+
+    A copy with truncation and padding disabled, so counts are exact and
+    the model's own tokenizer is left untouched.
+    """
+    if embbed_model.tokenizer is None:
+        embbed_model.init()
+        tokenizer = Tokenizer.from_str(get_embbed().model.tokenizer.to_str())
+        tokenizer.no_truncation()
+        tokenizer.no_padding()
+        embbed_model.tokenizer = tokenizer
+    return embbed_model.tokenizer
+
+
+@dataclass
+class _EmbedRequest:
+    texts: List[str]
+    future: asyncio.Future = field(repr=False)
+
+
+class EmbeddingBatcher:
+    """
+    Runs model inference off the event loop and coalesces texts from
+    concurrent callers into shared batches.
+
+    A batch is dispatched as soon as it holds `max_batch_size` texts or
+    `max_wait_ms` has passed since its first request arrived, whichever
+    comes first. Large inputs are fed in slices of `max_batch_size`, so a
+    big ingest never holds the model for longer than one batch and small
+    queries get to ride along in between.
+    """
+
+    def __init__(
+        self,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        workers: int = 1,
+    ) -> None:
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self._queue: Optional[asyncio.Queue[_EmbedRequest]] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._carry: Optional[_EmbedRequest] = None
+        self._inflight: set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None and not self._runner.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="embed"
+        )
+        self._runner = asyncio.create_task(self._run(), name="embedding-batcher")
+
+    async def stop(self):
+        if self._runner is None:
+            return
+        self._runner.cancel()
+        try:
+            await self._runner
+        except asyncio.CancelledError:
+            pass
+        self._runner = None
+
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        pending = [self._carry] if self._carry is not None else []
+        self._carry = None
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for request in pending:
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("Embedding engine stopped"))
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def embed(self, texts: List[str]) -> List[NumpyArray]:
+        """Embed `texts`, sharing model batches with concurrent callers."""
+        if not texts:
+            return []
+        if not self.running:
+            raise RuntimeError("Embedding engine is not started")
+
+        results: List[NumpyArray] = []
+        for start in range(0, len(texts), self.max_batch_size):
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put(  # type: ignore[union-attr]
+                _EmbedRequest(texts[start : start + self.max_batch_size], future)
+            )
+            results.extend(await future)
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        assert queue is not None and self._slots is not None
+
+        while True:
+            await self._slots.acquire()
+            batch: List[_EmbedRequest] = []
+            try:
+                if self._carry is not None:
+                    batch, self._carry = [self._carry], None
+                else:
+                    batch = [await queue.get()]
+                size = len(batch[0].texts)
+                deadline = loop.time() + self.max_wait
+
+                while size < self.max_batch_size:
+                    if queue.empty():
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            request = await asyncio.wait_for(queue.get(), timeout)
+                        except TimeoutError:
+                            break
+                    else:
+                        request = queue.get_nowait()
+                    if size + len(request.texts) > self.max_batch_size:
+                        # Keep batches within the cap; it leads the next one.
+                        self._carry = request
+                        break
+                    batch.append(request)
+                    size += len(request.texts)
+            except BaseException:
+                self._slots.release()
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(
+                            RuntimeError("Embedding engine stopped")
+                        )
+                raise
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: List[_EmbedRequest]):
+        try:
+            texts = [text for request in batch for text in request.texts]
+            metrics.EMBED_BATCH_SIZE.observe(len(texts))
+            try:
+                with metrics.EMBED_BATCH_SECONDS.time():
+                    vectors = await asyncio.get_running_loop().run_in_executor(
+                        self._executor, self._infer, texts
+                    )
+            except Exception as e:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                return
+
+            offset = 0
+            for request in batch:
+                end = offset + len(request.texts)
+                if not request.future.done():
+                    request.future.set_result(vectors[offset:end])
+                offset = end
+        finally:
+            self._slots.release()  # type: ignore[union-attr]
+
+    @staticmethod
+    def _infer(texts: List[str]) -> List[NumpyArray]:
+        return list(get_embbed().embed(texts, batch_size=len(texts)))
+
+
+embedding_engine = EmbeddingBatcher(
+    max_batch_size=active_backend().max_batch_size,
+    max_wait_ms=settings.EMBED_MAX_WAIT_MS,
+    workers=settings.EMBED_WORKERS,
+)
+
+query_embedding_cache = TTLCache(
+    max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+    max_bytes=settings.QUERY_CACHE_MAX_BYTES,
+    ttl_seconds=settings.QUERY_CACHE_TTL_S,
+)
+
+metrics.registry.gauge(
+    "query_embedding_cache_entries",
+    "Cached query embeddings.",
+    lambda: len(query_embedding_cache),
+)
+metrics.registry.gauge(
+    "query_embedding_cache_hit_ratio",
+    "Hit ratio of the query embedding cache since startup.",
+    lambda: query_embedding_cache.stats()["hit_rate"],
+)
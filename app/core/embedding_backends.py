@@ -0,0 +1,132 @@
+"""
+Registry of embedding backends: which model to run and how.
+
+A backend's `name` is what `chunks.embedding_model` records, so it must
+not be reused for a different model. Entries can be added or overridden
+without code changes through EMBED_BACKENDS, e.g.
+
+    EMBED_BACKENDS='{"e5-small-int8": {"model": "Xenova/multilingual-e5-small",
+        "dim": 384, "hf_repo": "Xenova/multilingual-e5-small",
+        "model_file": "onnx/model_quantized.onnx", "pooling": "MEAN"}}'
+
+The active backend is EMBED_BACKEND until a re-embedding migration
+(`python -m app.reembed`) swaps the corpus to another one; running
+processes then follow the database (see app/core/startup.py).
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import settings
+
+
+@dataclass(frozen=True)
+class EmbeddingBackend:
+    name: str
+    model: str  # fastembed model name
+    dim: int
+    # An ONNX export fastembed does not list (e.g. a quantized variant),
+    # registered with TextEmbedding.add_custom_model.
+    hf_repo: Optional[str] = None
+    model_file: Optional[str] = None
+    pooling: str = "CLS"
+    normalization: bool = True
+    # The tokenizer lowercases its input, so queries that differ only in
+    # case embed identically and may share a query cache entry.
+    uncased: bool = False
+    # Per-backend overrides of EMBED_MAX_BATCH_SIZE and EMBED_THREADS.
+    batch_size: Optional[int] = None
+    threads: Optional[int] = None
+
+    @property
+    def custom(self) -> bool:
+        return self.hf_repo is not None
+
+    @property
+    def max_batch_size(self) -> int:
+        return self.batch_size or settings.EMBED_MAX_BATCH_SIZE
+
+    @property
+    def num_threads(self) -> Optional[int]:
+        return self.threads if self.threads is not None else settings.EMBED_THREADS
+
+
+BACKENDS: Dict[str, EmbeddingBackend] = {}
+
+
+def register_backend(backend: EmbeddingBackend) -> EmbeddingBackend:
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+# fastembed's own builds of these are already int8-quantized ONNX. All of
+# them use an uncased (bert-base-uncased style) WordPiece tokenizer.
+register_backend(
+    EmbeddingBackend("bge-small-en-v1.5", "BAAI/bge-small-en-v1.5", 384, uncased=True)
+)
+register_backend(
+    EmbeddingBackend("bge-base-en-v1.5", "BAAI/bge-base-en-v1.5", 768, uncased=True)
+)
+register_backend(
+    EmbeddingBackend(
+        "all-minilm-l6-v2", "sentence-transformers/all-MiniLM-L6-v2", 384, uncased=True
+    )
+)
+register_backend(
+    EmbeddingBackend(
+        "snowflake-arctic-embed-xs", "snowflake/snowflake-arctic-embed-xs", 384, uncased=True
+    )
+)
+register_backend(
+    EmbeddingBackend(
+        "nomic-embed-text-v1.5-q", "nomic-ai/nomic-embed-text-v1.5-Q", 768, uncased=True
+    )
+)
+register_backend(
+    EmbeddingBackend(
+        "bge-small-en-v1.5-int8",
+        "Xenova/bge-small-en-v1.5",
+        384,
+        hf_repo="Xenova/bge-small-en-v1.5",
+        model_file="onnx/model_quantized.onnx",
+        uncased=True,
+    )
+)
+for _name, _fields in settings.EMBED_BACKENDS.items():
+    register_backend(EmbeddingBackend(name=_name, **_fields))
+
+
+def get_backend(name: str) -> EmbeddingBackend:
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown embedding backend {name!r}; known: {', '.join(sorted(BACKENDS))}"
+        ) from None
+
+
+_active = get_backend(settings.EMBED_BACKEND)
+
+
+def active_backend() -> EmbeddingBackend:
+    """The backend whose vectors `chunks.embedding` holds, as far as this process knows."""
+    return _active
+
+
+def set_active_backend(backend: EmbeddingBackend):
+    global _active
+    _active = backend
+
+
+async def swapped_backend_name(conn: AsyncConnection) -> Optional[str]:
+    """The backend the latest completed migration swapped in, if any."""
+    result = await conn.execute(
+        sql_text(
+            "SELECT target FROM embedding_migrations WHERE status = 'swapped' "
+            "ORDER BY swapped_at DESC LIMIT 1"
+        )
+    )
+    return result.scalar_one_or_none()
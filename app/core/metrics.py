@@ -0,0 +1,422 @@
+"""
+Minimal Prometheus-style metrics: histograms, counters and callback
+gauges rendered in the text exposition format by `registry.render()`.
+
+Recording is a bisect plus a few integer updates, so it is cheap enough
+for hot paths. Metrics are not locked; record them from the event loop
+(or the thread that owns the engine connection), not from executor threads.
+
+Under the prefork server each worker has its own registry. After
+`registry.share(directory)` every worker writes a snapshot of its values
+to `<directory>/<pid>.json` every METRICS_PUBLISH_S and whenever it is
+scraped, and renders the sum of all workers' histograms and counters
+(including workers that have exited) plus every live worker's gauges,
+labelled by `pid`.
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def state(self) -> list:
+        return [self.counts, self.sum, self.count]
+
+    def add(self, state: list) -> None:
+        counts, total, count = state
+        if len(counts) != len(self.counts):
+            return  # recorded with other buckets
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def state(self) -> float:
+        return self.value
+
+    def add(self, state: float) -> None:
+        self.value += state
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def state(self) -> list:
+        """This process's values, as JSON: [[label values, child state], ...]."""
+        return [[list(values), child.state()] for values, child in self._children.items()]
+
+    def merged(self, states: Iterable[list]) -> dict:
+        """Children holding the sums of several processes' `state()`."""
+        children: dict = {}
+        for state in states:
+            for values, child_state in state:
+                key = tuple(values)
+                child = children.get(key)
+                if child is None:
+                    child = children[key] = self._new_child()
+                child.add(child_state)
+        return children
+
+    def samples(self, children: Optional[dict]) -> List[str]:
+        """Sample lines of `children`, or of this process's values if None."""
+        raise NotImplementedError
+
+    def render(self, children: Optional[dict] = None) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(children),
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self, children: Optional[dict]) -> List[str]:
+        lines = []
+        for values, child in sorted((self._children if children is None else children).items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+                )
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self, children: Optional[dict]) -> List[str]:
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, values)} "
+            f"{_format_value(child.value)}"
+            for values, child in sorted((self._children if children is None else children).items())
+        ]
+
+
+class Gauge(_Metric):
+    """A gauge whose value is read from `callback` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]) -> None:
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def value(self) -> Optional[float]:
+        try:
+            return self.callback()
+        except Exception:
+            return None
+
+    def state(self) -> Optional[float]:
+        return self.value()
+
+    def samples(self, children: Optional[dict]) -> List[str]:
+        if children is None:
+            value = self.value()
+            return [] if value is None else [f"{self.name} {_format_value(value)}"]
+        # {(pid,): value} of the live workers.
+        return [
+            f"{self.name}{_format_labels(('pid',), values)} {_format_value(value)}"
+            for values, value in sorted(children.items())
+            if value is not None
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        # Where the workers of a prefork server publish their snapshots.
+        self.directory: Optional[str] = None
+        self._publisher: Optional[asyncio.Task] = None
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, callback: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, documentation, callback))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        if self.directory is None:
+            for metric in self._metrics.values():
+                lines.extend(metric.render())
+            return "\n".join(lines) + "\n"
+
+        # Publish first, so every worker renders this one's latest values
+        # and counters never appear to go back between scrapes.
+        self.publish()
+        snapshots = self._read_snapshots()
+        live = {pid: snapshot for pid, snapshot in snapshots.items() if _alive(pid)}
+        for name, metric in self._metrics.items():
+            if isinstance(metric, Gauge):
+                children = {(str(pid),): s.get(name) for pid, s in live.items()}
+            else:
+                children = metric.merged(s[name] for s in snapshots.values() if name in s)
+            lines.extend(metric.render(children))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """Every metric's `state()` in this process."""
+        return {name: metric.state() for name, metric in self._metrics.items()}
+
+    def share(self, directory: str):
+        """
+        Render the values of every process publishing to `directory`. Call
+        once in the prefork master; stale snapshots are removed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            os.unlink(path)
+        self.directory = directory
+
+    def publish(self):
+        """Write this process's snapshot, if shared."""
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+    def start_publishing(self, interval_s: float):
+        """Publish every `interval_s` seconds until `stop_publishing`, if shared."""
+        if self.directory is not None and self._publisher is None:
+            self._publisher = asyncio.create_task(self._publish_every(interval_s))
+
+    async def stop_publishing(self):
+        if self._publisher is None:
+            return
+        self._publisher.cancel()
+        try:
+            await self._publisher
+        except asyncio.CancelledError:
+            pass
+        self._publisher = None
+        self.publish()
+
+    async def _publish_every(self, interval_s: float):
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                self.publish()
+            except OSError:
+                logger.warning("could not publish metrics", exc_info=True)
+
+    def _read_snapshots(self) -> Dict[int, dict]:
+        snapshots = {}
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshots[int(os.path.basename(path)[: -len(".json")])] = json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced, or not a snapshot
+        return snapshots
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+async def timed_aiter(
+    iterator: AsyncIterator[T], on_done: Callable[[float], None]
+) -> AsyncIterator[T]:
+    """
+    Re-yield `iterator`, passing the total time spent waiting on it (not on
+    the consumer) to `on_done` once it is exhausted or closed.
+    """
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = await anext(iterator)
+            except StopAsyncIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        on_done(elapsed)
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = MetricsRegistry()
+
+INGEST_STAGE_SECONDS = registry.histogram(
+    "ingest_stage_seconds",
+    "Time a document spent in each ingest stage (summed over its batches).",
+    ["stage"],
+)
+INGEST_CHUNKS = registry.histogram(
+    "ingest_chunks_per_document",
+    "Chunks produced per ingested document.",
+    buckets=SIZE_BUCKETS,
+)
+INGEST_DEDUPLICATED = registry.counter(
+    "ingest_deduplicated",
+    "Uploads whose chunks were cloned from an identical earlier upload.",
+)
+PARSE_SECONDS = registry.histogram(
+    "parser_seconds", "Time to extract the text of one upload.", ["parser"]
+)
+EMBED_BATCH_SIZE = registry.histogram(
+    "embedding_batch_size", "Texts per model inference batch.", buckets=SIZE_BUCKETS
+)
+EMBED_BATCH_SECONDS = registry.histogram(
+    "embedding_batch_seconds", "Model inference time per batch."
+)
+DB_STATEMENT_SECONDS = registry.histogram(
+    "db_statement_seconds", "SQL statement execution time.", ["operation"]
+)
+DB_SLOW_STATEMENTS = registry.counter(
+    "db_slow_statements", "Statements slower than DB_SLOW_QUERY_MS.", ["operation"]
+)
+ANN_QUERY_SECONDS = registry.histogram(
+    "ann_query_seconds", "Vector search latency.", ["query", "strategy"]
+)
@@ -0,0 +1,61 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+
+
+class ParsingExecutor:
+    """
+    Process pool for the CPU-bound parser backends (pdfminer, tesseract,
+    BeautifulSoup, python-docx).
+
+    `limits` caps how many jobs of one kind (e.g. "pdf", "image") may run at
+    once so a burst of heavy files cannot occupy every worker. When the pool
+    is not started, jobs run in a thread instead.
+    """
+
+    def __init__(self, max_workers: Optional[int], limits: Dict[str, int]) -> None:
+        self.max_workers = max_workers
+        self.limits = limits
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def start(self):
+        if self._pool is None:
+            # spawn: workers must not inherit the loop, model or DB pool.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, kind: str, func: Callable[..., Any], *args) -> Any:
+        """Run `func(*args)` in the pool under the concurrency limit for `kind`."""
+        limit = self._semaphore(kind)
+        async with limit or nullcontext():
+            if self._pool is None:
+                return await asyncio.to_thread(func, *args)
+            return await asyncio.get_running_loop().run_in_executor(
+                self._pool, partial(func, *args)
+            )
+
+    def _semaphore(self, kind: str) -> Optional[asyncio.Semaphore]:
+        if kind not in self.limits:
+            return None
+        if kind not in self._semaphores:
+            self._semaphores[kind] = asyncio.Semaphore(self.limits[kind])
+        return self._semaphores[kind]
+
+
+parsing_executor = ParsingExecutor(
+    max_workers=settings.PARSE_WORKERS,
+    limits=settings.PARSE_CONCURRENCY,
+)
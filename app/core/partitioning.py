@@ -0,0 +1,152 @@
+"""
+Optional partitioning of `chunks` by `owner_id` (`CHUNK_PARTITIONING`).
+
+- hash: `CHUNK_HASH_PARTITIONS` partitions created by `init_db`; each
+        tenant lives in one of them alongside the other tenants of its bucket.
+- list: one partition per tenant, attached on first write by
+        `PartitionManager.ensure_owner`.
+
+Indexes are declared on the parent, so Postgres builds a separate HNSW
+graph per partition, and queries filtering on `owner_id` are pruned to the
+tenant's partition.
+"""
+
+import logging
+from typing import List, Optional
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.core.config import settings
+from app.models import CHUNKS_PARTITIONED
+
+logger = logging.getLogger(__name__)
+
+HASH = "hash"
+LIST = "list"
+
+
+def partition_name(owner_id: int) -> str:
+    """Name of a tenant's list partition."""
+    return f"chunks_owner_{owner_id}".replace("-", "n")
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    result = await conn.execute(
+        sql_text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = 'chunks'::regclass)"
+        )
+    )
+    return bool(result.scalar_one())
+
+
+async def create_partitions(conn: AsyncConnection):
+    """Validate the layout of `chunks` and create the hash partitions."""
+    if settings.CHUNK_PARTITIONING not in ("", HASH, LIST):
+        raise ValueError(f"Unknown CHUNK_PARTITIONING: {settings.CHUNK_PARTITIONING!r}")
+
+    # create_all() never alters an existing table, and the upsert conflict
+    # target depends on the layout, so a mismatch must not go unnoticed.
+    if await is_partitioned(conn) != CHUNKS_PARTITIONED:
+        raise RuntimeError(
+            "The chunks table layout does not match CHUNK_PARTITIONING="
+            f"{settings.CHUNK_PARTITIONING!r}; recreate or migrate the table."
+        )
+
+    if settings.CHUNK_PARTITIONING == HASH:
+        modulus = settings.CHUNK_HASH_PARTITIONS
+        for remainder in range(modulus):
+            await conn.execute(
+                sql_text(
+                    f"CREATE TABLE IF NOT EXISTS chunks_p{remainder} PARTITION OF chunks "
+                    f"FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder})"
+                )
+            )
+
+
+class PartitionManager:
+    """Creates list partitions on demand and rebuilds per-tenant indexes."""
+
+    def __init__(self) -> None:
+        self._known: set[int] = set()
+
+    async def ensure_owner(self, session: AsyncSession, owner_id: Optional[int]):
+        """
+        Make sure `owner_id` has a partition to write into.
+
+        Runs on its own connection. ATTACH PARTITION only takes a SHARE UPDATE
+        EXCLUSIVE lock on `chunks`, so reads and writes, including ones
+        pending in `session`, carry on meanwhile. Call it before `session`
+        writes to `documents`, since attaching also adds the foreign key.
+        """
+        if not CHUNKS_PARTITIONED:
+            return
+        if owner_id is None:
+            raise ValueError("owner_id is required when chunks are partitioned")
+        if settings.CHUNK_PARTITIONING != LIST or owner_id in self._known:
+            return
+
+        name = partition_name(owner_id)
+        async with session.bind.begin() as conn:
+            # Serialize concurrent first writes of the same tenant.
+            await conn.execute(
+                sql_text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": name}
+            )
+            result = await conn.execute(
+                sql_text(
+                    "SELECT EXISTS (SELECT 1 FROM pg_inherits "
+                    "WHERE inhrelid = to_regclass(:name))"
+                ),
+                {"name": name},
+            )
+            if not result.scalar_one():
+                await conn.execute(
+                    sql_text(
+                        f"CREATE TABLE IF NOT EXISTS {name} "
+                        "(LIKE chunks INCLUDING DEFAULTS INCLUDING GENERATED)"
+                    )
+                )
+                await conn.execute(
+                    sql_text(
+                        f"ALTER TABLE chunks ATTACH PARTITION {name} "
+                        f"FOR VALUES IN ({int(owner_id)})"
+                    )
+                )
+                logger.info("created chunks partition %s", name)
+        self._known.add(owner_id)
+
+    async def reindex_owner(self, session: AsyncSession, owner_id: int) -> List[str]:
+        """
+        Rebuild the HNSW indexes of the partition holding `owner_id`'s chunks
+        with REINDEX CONCURRENTLY, leaving other tenants' indexes alone.
+        Without partitioning this rebuilds the global index. Returns the
+        rebuilt index names.
+
+        `session` must have no transaction open: REINDEX CONCURRENTLY waits
+        for every older transaction to finish, including that one.
+        """
+        if session.in_transaction():
+            raise RuntimeError("reindex_owner needs a session without an open transaction")
+        async with session.bind.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            result = await conn.execute(
+                sql_text("""
+                    SELECT i.indexrelid::regclass::text
+                    FROM pg_index i
+                    JOIN pg_class ic ON ic.oid = i.indexrelid
+                    JOIN pg_am am ON am.oid = ic.relam
+                    WHERE am.amname = 'hnsw'
+                      AND i.indrelid = (
+                          SELECT tableoid FROM chunks WHERE owner_id = :owner_id LIMIT 1
+                      )
+                """),
+                {"owner_id": owner_id},
+            )
+            indexes = list(result.scalars())
+            for index in indexes:
+                await conn.execute(sql_text(f"REINDEX INDEX CONCURRENTLY {index}"))
+        return indexes
+
+
+partition_manager = PartitionManager()
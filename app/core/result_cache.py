@@ -0,0 +1,255 @@
+"""
+Cache of retrieval results, invalidated by per-scope version counters.
+
+Every result is cached under its query (vector hash, filters, limits) plus
+the current versions of the scopes it depends on: the filtered documents,
+else the filtered owner, else everything. Writers bump the versions of a
+document, its owner and the global scope after committing, so entries that
+may be stale can no longer be looked up and age out of the LRU, while
+results over other documents stay cached.
+
+There are two tiers: an in-process LRU and an optional shared store
+(`RESULT_CACHE_REDIS_URL`) that also holds the version counters, so
+invalidations reach every worker. Without the shared store, only writes
+made by the serving process invalidate its results: the prefork server
+turns the cache off for more than one worker, and documents ingested by
+`python -m app.worker` may be served stale for up to RESULT_CACHE_TTL_S.
+"""
+
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Scope = Tuple[Hashable, ...]
+
+GLOBAL_SCOPE: Scope = ("all",)
+
+RESULT_CACHE_LOOKUPS = metrics.registry.counter(
+    "result_cache_lookups",
+    "Retrieval result cache lookups by outcome (local, shared or miss).",
+    ["query", "outcome"],
+)
+
+
+class SharedCache:
+    """
+    A store shared by all workers. Implementations must be safe to call
+    concurrently from one event loop.
+    """
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float):
+        raise NotImplementedError
+
+    async def counters(self, keys: Sequence[str]) -> List[int]:
+        """Current values of counters, 0 for ones never incremented."""
+        raise NotImplementedError
+
+    async def incr(self, keys: Sequence[str]):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class RedisCache(SharedCache):
+    """`SharedCache` on Redis; needs the `redis` package."""
+
+    def __init__(self, url: str, prefix: str = "rc:") -> None:
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "RESULT_CACHE_REDIS_URL is set but the redis package is not installed"
+            ) from e
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float):
+        await self.client.set(self.prefix + key, value, px=int(ttl_seconds * 1000))
+
+    async def counters(self, keys: Sequence[str]) -> List[int]:
+        values = await self.client.mget([self.prefix + key for key in keys])
+        return [int(value or 0) for value in values]
+
+    async def incr(self, keys: Sequence[str]):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.incr(self.prefix + key)
+            await pipe.execute()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def vector_key(vector: np.ndarray) -> str:
+    """Stable digest of a query vector."""
+    data = np.ascontiguousarray(vector, dtype=np.float32).tobytes()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def query_scopes(owner_id: Optional[int], document_ids: Optional[List[int]]) -> List[Scope]:
+    """The scopes whose changes can alter the results of a filtered query."""
+    if document_ids:
+        return [("doc", document_id) for document_id in sorted(set(document_ids))]
+    if owner_id is not None:
+        return [("owner", owner_id)]
+    return [GLOBAL_SCOPE]
+
+
+def document_scopes(document_id: int, owner_id: Optional[int]) -> List[Scope]:
+    """The scopes a change to `document_id` invalidates."""
+    scopes: List[Scope] = [("doc", document_id), GLOBAL_SCOPE]
+    if owner_id is not None:
+        scopes.append(("owner", owner_id))
+    return scopes
+
+
+def _scope_key(scope: Scope) -> str:
+    return "v:" + ":".join(str(part) for part in scope)
+
+
+class ResultCache:
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: float = 300.0,
+        shared: Optional[SharedCache] = None,
+    ) -> None:
+        self.enabled = max_entries > 0
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        self._local = TTLCache(
+            max_entries=max_entries, max_bytes=max_bytes, ttl_seconds=ttl_seconds
+        )
+        # Scope versions when there is no shared store.
+        self._versions: Dict[Scope, int] = {}
+
+    async def get_or_compute(
+        self,
+        query: str,
+        key: Tuple[Hashable, ...],
+        scopes: List[Scope],
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Cached result of `compute` for `key` (a query name such as "chunks"
+        plus everything that determines its result) under the current
+        versions of `scopes`. Results must be JSON-serializable.
+        """
+        if not self.enabled:
+            return await compute()
+        try:
+            versions = await self._current_versions(scopes)
+        except Exception:
+            logger.warning("result cache versions unavailable; bypassing", exc_info=True)
+            return await compute()
+
+        full_key = (query, *key, versions)
+        outcome = "local"
+
+        async def load():
+            nonlocal outcome
+            if self.shared is not None:
+                shared_key = "r:" + hashlib.blake2b(
+                    repr(full_key).encode(), digest_size=20
+                ).hexdigest()
+                try:
+                    raw = await self.shared.get(shared_key)
+                except Exception:
+                    logger.warning("shared result cache read failed", exc_info=True)
+                    raw = None
+                if raw is not None:
+                    outcome = "shared"
+                    return json.loads(raw)
+
+            outcome = "miss"
+            value = await compute()
+            if self.shared is not None:
+                try:
+                    payload = json.dumps(value).encode()
+                    await self.shared.set(shared_key, payload, self.ttl_seconds)
+                except Exception:
+                    logger.warning("shared result cache write failed", exc_info=True)
+            return value
+
+        value = await self._local.get_or_compute(
+            full_key, load, size_of=lambda value: len(json.dumps(value))
+        )
+        RESULT_CACHE_LOOKUPS.labels(query, outcome).inc()
+        return value
+
+    def require_shared(self, processes: int):
+        """
+        Turn the cache off if `processes` workers would serve queries without
+        a shared store: each would keep its own scope versions, so a write
+        handled by one would leave the others serving stale results.
+        """
+        if processes > 1 and self.shared is None and self.enabled:
+            logger.warning(
+                "result cache disabled: %d workers need RESULT_CACHE_REDIS_URL to share it",
+                processes,
+            )
+            self.enabled = False
+
+    async def invalidate(self, document_id: int, owner_id: Optional[int]):
+        """Drop cached results that may include `document_id`. Call after committing."""
+        scopes = document_scopes(document_id, owner_id)
+        if self.shared is None:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+            return
+        try:
+            await self.shared.incr([_scope_key(scope) for scope in scopes])
+        except Exception:
+            # Other workers may serve stale results until their entries
+            # expire; at least this one must not.
+            logger.error(
+                "could not invalidate shared results of document %s", document_id,
+                exc_info=True,
+            )
+            self._local.clear()
+
+    async def close(self):
+        if self.shared is not None:
+            await self.shared.close()
+
+    async def _current_versions(self, scopes: List[Scope]) -> Tuple[int, ...]:
+        if self.shared is None:
+            return tuple(self._versions.get(scope, 0) for scope in scopes)
+        return tuple(await self.shared.counters([_scope_key(scope) for scope in scopes]))
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    def stats(self) -> dict:
+        return self._local.stats()
+
+
+result_cache = ResultCache(
+    max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+    ttl_seconds=settings.RESULT_CACHE_TTL_S,
+    shared=(
+        RedisCache(settings.RESULT_CACHE_REDIS_URL) if settings.RESULT_CACHE_REDIS_URL else None
+    ),
+)
+
+metrics.registry.gauge(
+    "result_cache_entries", "Entries in the local retrieval result cache.", result_cache.__len__
+)
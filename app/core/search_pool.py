@@ -0,0 +1,109 @@
+"""
+Raw asyncpg connection pool for the search hot path.
+
+Search queries skip SQLAlchemy's statement compilation and result
+processing: vectors are bound in binary straight from NumPy (see
+`vector_codec`), and because every query shape is a fixed SQL string,
+asyncpg's per-connection statement cache turns each one into a
+server-side prepared statement after its first use.
+"""
+
+import re
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.vector_codec import register_vector_codecs
+
+# `:name` binds, but not the second colon of a `::type` cast.
+_BIND = re.compile(r"(?<![:\w]):([A-Za-z_]\w*)")
+
+
+@lru_cache(maxsize=1024)
+def _compile(sql: str) -> Tuple[str, Tuple[str, ...]]:
+    names: List[str] = []
+
+    def replace(match: re.Match) -> str:
+        name = match.group(1)
+        if name not in names:
+            names.append(name)
+        return f"${names.index(name) + 1}"
+
+    return _BIND.sub(replace, sql), tuple(names)
+
+
+def to_positional(sql: str, params: dict) -> Tuple[str, List[Any]]:
+    """Convert SQL with `:name` binds (as used with `text()`) to asyncpg's `$n`."""
+    query, names = _compile(sql)
+    return query, [params[name] for name in names]
+
+
+def asyncpg_dsn(url: str) -> str:
+    """The libpq DSN of a SQLAlchemy `postgresql+asyncpg://` URL."""
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class SearchPool:
+    def __init__(
+        self,
+        min_size: int = 2,
+        max_size: int = 10,
+        statement_cache_size: int = 256,
+    ) -> None:
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self._pool: Optional[asyncpg.Pool] = None
+
+    @property
+    def running(self) -> bool:
+        return self._pool is not None
+
+    async def start(self):
+        """Open the pool; pgvector must already be installed (see `init_db`)."""
+        if self._pool is not None:
+            return
+        self._pool = await asyncpg.create_pool(
+            asyncpg_dsn(settings.DB_URL),
+            min_size=self.min_size,
+            max_size=self.max_size,
+            statement_cache_size=self.statement_cache_size,
+            init=register_vector_codecs,
+        )
+
+    async def stop(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        if self._pool is None:
+            raise RuntimeError("Search pool is not started")
+        async with self._pool.acquire() as conn:
+            yield conn
+
+    def size(self) -> int:
+        return self._pool.get_size() if self._pool is not None else 0
+
+    def idle(self) -> int:
+        return self._pool.get_idle_size() if self._pool is not None else 0
+
+
+search_pool = SearchPool(
+    min_size=settings.SEARCH_POOL_MIN_SIZE,
+    max_size=settings.SEARCH_POOL_MAX_SIZE,
+    statement_cache_size=settings.SEARCH_STATEMENT_CACHE_SIZE,
+)
+
+metrics.registry.gauge(
+    "search_pool_size", "Connections open in the search pool.", search_pool.size
+)
+metrics.registry.gauge(
+    "search_pool_idle", "Idle connections in the search pool.", search_pool.idle
+)
@@ -0,0 +1,183 @@
+"""
+Startup and health checks.
+
+The embedding model is loaded and warmed up in the background once the
+server is up, so liveness probes pass at once while readiness waits until
+queries no longer stall on a cold model: the first ONNX runs allocate
+buffers and pick kernels and are much slower than later ones. Requests
+that need the model before then wait for it to load.
+
+Afterwards the process polls `embedding_migrations` every
+EMBED_BACKEND_POLL_S and switches to the backend a re-embedding migration
+swapped in. Until it does, it writes and queries with the old model
+against the new vectors; the migration repairs such writes afterwards.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from sqlalchemy import text as sql_text
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import engine
+from app.core.embedding import (
+    embbed_model,
+    embedding_engine,
+    get_embbed,
+    query_embedding_cache,
+)
+from app.core.embedding_backends import (
+    active_backend,
+    get_backend,
+    set_active_backend,
+    swapped_backend_name,
+)
+from app.models import EMBEDDING_DIM
+
+logger = logging.getLogger(__name__)
+
+# A query-sized and a chunk-sized input.
+WARMUP_TEXTS = [
+    "warm up",
+    " ".join(["the embedding model is warmed up with a chunk sized input"] * 20),
+]
+
+
+class Startup:
+    def __init__(self) -> None:
+        self.created_at = time.perf_counter()
+        self.model_ready = False
+        # Set by a prefork master that created the schema before forking.
+        self.schema_ready = False
+        self.error: Optional[str] = None
+        # Seconds per step, and to `ready` since the app was imported.
+        self.seconds: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def preload(self):
+        """Load and warm up the model in this process, e.g. before forking workers."""
+        with self._timed("model_load"):
+            embbed_model.init()
+        if settings.EMBED_WARMUP:
+            with self._timed("warmup"):
+                list(get_embbed().embed(WARMUP_TEXTS, batch_size=len(WARMUP_TEXTS)))
+        self.model_ready = True
+        self.seconds["ready"] = time.perf_counter() - self.created_at
+
+    def start(self):
+        """
+        Load and warm up the model in the background, unless preloaded,
+        then keep following re-embedding migrations.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="model-warmup")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def check(self) -> dict:
+        """Readiness report: the model is warm and the database answers."""
+        checks = {"model": self.model_ready, "database": await self._database_ok()}
+        return {
+            "ready": all(checks.values()),
+            "checks": checks,
+            "error": self.error,
+            "startup_seconds": self.seconds,
+        }
+
+    async def follow_backend(self) -> bool:
+        """
+        Switch to the backend `chunks.embedding` was last migrated to, if it
+        is not the active one. Returns whether it switched.
+        """
+        name = await self._migrated_backend()
+        if name is None or name == active_backend().name:
+            return False
+        backend = get_backend(name)
+        if backend.dim != EMBEDDING_DIM:
+            # The ORM's vector columns are sized at import.
+            error = (
+                f"the corpus was re-embedded with {name!r} ({backend.dim} dimensions); "
+                f"restart with EMBED_BACKEND={name}"
+            )
+            if self.error != error:
+                logger.error(error)
+            self.model_ready = False
+            self.error = error
+            return False
+
+        logger.info("switching embedding backend from %s to %s", active_backend().name, name)
+        if embbed_model.loaded:
+            await asyncio.to_thread(embbed_model.switch, backend)
+        set_active_backend(backend)
+        embedding_engine.max_batch_size = backend.max_batch_size
+        query_embedding_cache.clear()
+        return True
+
+    async def _run(self):
+        if not self.model_ready:
+            await self._warm_up()
+            if not self.model_ready:
+                return
+        while True:
+            await asyncio.sleep(settings.EMBED_BACKEND_POLL_S)
+            try:
+                await self.follow_backend()
+            except Exception:
+                logger.exception("could not check for an embedding backend switch")
+
+    async def _migrated_backend(self) -> Optional[str]:
+        async with engine.connect() as conn:
+            return await swapped_backend_name(conn)
+
+    async def _warm_up(self):
+        try:
+            with self._timed("model_load"):
+                await asyncio.to_thread(embbed_model.init)
+            if settings.EMBED_WARMUP:
+                with self._timed("warmup"):
+                    await embedding_engine.embed(WARMUP_TEXTS)
+        except Exception as e:
+            self.error = repr(e)
+            logger.exception("embedding model could not be loaded")
+            return
+        self.model_ready = True
+        self.seconds["ready"] = time.perf_counter() - self.created_at
+        logger.info("ready after %.2fs (%s)", self.seconds["ready"], self.seconds)
+
+    async def _database_ok(self) -> bool:
+        async def ping():
+            async with engine.connect() as conn:
+                await conn.execute(sql_text("SELECT 1"))
+
+        try:
+            await asyncio.wait_for(ping(), settings.HEALTH_DB_TIMEOUT_S)
+            return True
+        except Exception:
+            logger.warning("readiness check: database unavailable", exc_info=True)
+            return False
+
+    @contextmanager
+    def _timed(self, step: str):
+        start = time.perf_counter()
+        yield
+        self.seconds[step] = time.perf_counter() - start
+
+
+startup = Startup()
+
+metrics.registry.gauge(
+    "model_ready", "1 once the embedding model is loaded and warmed up.",
+    lambda: int(startup.model_ready),
+)
@@ -0,0 +1,153 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional, Union
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+
+from app.core.config import settings
+
+_READ_SIZE = 1024 * 1024
+
+
+@dataclass
+class UploadSource:
+    """
+    An upload's bytes, either held in memory (`data`) or spooled once to a
+    temp file (`path`) when larger than the spool threshold, and their
+    SHA-256 (hex), which identifies repeated uploads.
+    """
+
+    filename: Optional[str]
+    content_type: str
+    size: int
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+    sha256: Optional[str] = None
+
+    @property
+    def content(self) -> Union[bytes, str]:
+        """What parsers take: the in-memory bytes, or the spool file's path."""
+        return self.data if self.data is not None else self.path  # type: ignore[return-value]
+
+    def read_bytes(self) -> bytes:
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:  # type: ignore[arg-type]
+            return f.read()
+
+
+def _too_large(limit: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File too large: file should be at most {limit} bytes",
+    )
+
+
+@asynccontextmanager
+async def spool_upload(
+    file: UploadFile,
+    max_bytes: int = settings.MAX_UPLOAD_BYTES,
+    spool_threshold: int = settings.UPLOAD_SPOOL_THRESHOLD,
+) -> AsyncIterator[UploadSource]:
+    """
+    Stream `file` into an UploadSource, enforcing `max_bytes` as it reads.
+
+    Uploads up to `spool_threshold` bytes stay in memory; bigger ones are
+    copied once into a temp file that is removed on exit. The SHA-256 is
+    computed on the way.
+    """
+    content_type = file.content_type or ""
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    if file.size is not None and file.size <= spool_threshold:
+        data = await file.read()
+        if len(data) > max_bytes:
+            raise _too_large(max_bytes)
+        yield UploadSource(
+            file.filename,
+            content_type,
+            len(data),
+            data=data,
+            sha256=hashlib.sha256(data).hexdigest(),
+        )
+        return
+
+    buffer = bytearray()
+    spool = None
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        while chunk := await file.read(_READ_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(max_bytes)
+            digest.update(chunk)
+            if spool is None and size <= spool_threshold:
+                buffer += chunk
+                continue
+            if spool is None:
+                suffix = mimetypes.guess_extension(content_type) or ""
+                spool = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+                spool.write(buffer)
+                buffer = bytearray()
+            spool.write(chunk)
+
+        if spool is None:
+            yield UploadSource(
+                file.filename,
+                content_type,
+                size,
+                data=bytes(buffer),
+                sha256=digest.hexdigest(),
+            )
+        else:
+            spool.close()
+            yield UploadSource(
+                file.filename, content_type, size, path=spool.name, sha256=digest.hexdigest()
+            )
+    finally:
+        if spool is not None:
+            spool.close()
+            os.remove(spool.name)
+
+
+class RequestSizeLimitMiddleware:
+    """Reject request bodies over `max_bytes` while they are being received."""
+
+    def __init__(self, app, max_bytes: int) -> None:
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        detail = f"Request too large: body should be at most {self.max_bytes} bytes"
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and int(content_length) > self.max_bytes:
+            response = JSONResponse(
+                {"detail": detail}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=detail,
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,41 @@
+"""
+Binary asyncpg codecs for pgvector types.
+
+Vectors are encoded straight from NumPy buffers (`int16 dim, int16 unused`
+followed by big-endian float32 values) instead of going through Python float
+lists and the text format.
+"""
+
+import struct
+
+import numpy as np
+
+_HEADER = struct.Struct(">HH")
+
+
+def encode_vector(value) -> bytes:
+    if isinstance(value, str):
+        # pgvector.sqlalchemy binds vectors as '[1.0,2.0,...]' literals.
+        value = np.array(value.strip("[]").split(","), dtype=np.float32)
+    arr = np.asarray(value, dtype=">f4")
+    if arr.ndim != 1:
+        raise ValueError(f"expected a 1-d vector, got shape {arr.shape}")
+    return _HEADER.pack(arr.shape[0], 0) + arr.tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    dim, _ = _HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=_HEADER.size).astype(
+        np.float32
+    )
+
+
+async def register_vector_codecs(conn) -> None:
+    """Register the binary `vector` codec on an asyncpg connection."""
+    await conn.set_type_codec(
+        "vector",
+        schema="public",
+        encoder=encode_vector,
+        decoder=decode_vector,
+        format="binary",
+    )
@@ -0,0 +1,97 @@
+"""
+Layouts of the ANN index over `chunks.embedding`.
+
+- full:    HNSW over the float32 vectors (the original layout).
+- halfvec: HNSW over a float16 expression of the embedding, half the size.
+- binary:  HNSW over the binary-quantized embedding (1 bit per dimension)
+           with Hamming distance, ~32x smaller.
+
+Compact layouts only order an oversampled candidate set; queries re-rank
+those candidates against the full-precision vectors, which stay in the
+table.
+"""
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.models import Chunk
+
+FULL = "full"
+HALFVEC = "halfvec"
+BINARY = "binary"
+MODES = (FULL, HALFVEC, BINARY)
+
+EMBEDDING_DIM: int = Chunk.__table__.c.embedding.type.dim
+
+INDEX_NAMES = {
+    FULL: "idx_chunks_embedding_hnsw",
+    HALFVEC: "idx_chunks_embedding_halfvec_hnsw",
+    BINARY: "idx_chunks_embedding_bit_hnsw",
+}
+
+
+def _check_mode(mode: str) -> None:
+    if mode not in MODES:
+        raise ValueError(f"Unknown vector index mode: {mode!r}")
+
+
+def index_expression(mode: str, column: str = "embedding", dim: int = EMBEDDING_DIM) -> str:
+    """The indexed expression; queries must use it verbatim to hit the index."""
+    _check_mode(mode)
+    if mode == HALFVEC:
+        return f"({column})::halfvec({dim})"
+    if mode == BINARY:
+        return f"binary_quantize({column})::bit({dim})"
+    return column
+
+
+def candidate_distance(mode: str, column: str, query: str) -> str:
+    """Distance expression ordering ANN candidates for `mode`'s index."""
+    _check_mode(mode)
+    if mode == HALFVEC:
+        return f"{index_expression(mode, column)} <=> ({query})::halfvec({EMBEDDING_DIM})"
+    if mode == BINARY:
+        return f"{index_expression(mode, column)} <~> binary_quantize({query})"
+    return f"{column} <=> {query}"
+
+
+def index_sql(
+    mode: str,
+    m: int = 16,
+    ef_construction: int = 64,
+    column: str = "embedding",
+    dim: int = EMBEDDING_DIM,
+    name: str = "",
+    prefix: str = "CREATE INDEX IF NOT EXISTS",
+    table: str = "chunks",
+) -> str:
+    """
+    DDL of `mode`'s index. `column`, `dim` and `name` index another vector
+    column (a re-embedding migration's), `prefix` and `table` allow e.g.
+    CREATE INDEX CONCURRENTLY on one partition.
+    """
+    _check_mode(mode)
+    opclass = {
+        FULL: "vector_cosine_ops",
+        HALFVEC: "halfvec_cosine_ops",
+        BINARY: "bit_hamming_ops",
+    }[mode]
+    expression = index_expression(mode, column, dim)
+    if mode != FULL:
+        # Expression indexes need the expression parenthesized.
+        expression = f"({expression})"
+    return (
+        f"{prefix} {name or INDEX_NAMES[mode]} "
+        f"ON {table} USING hnsw ({expression} {opclass}) "
+        f"WITH (m = {m}, ef_construction = {ef_construction});"
+    )
+
+
+async def create_vector_index(
+    conn: AsyncConnection, mode: str, m: int = 16, ef_construction: int = 64
+):
+    """
+    Create the HNSW index for `mode`. Indexes of other modes are left in
+    place; drop them once queries have switched over.
+    """
+    await conn.execute(sql_text(index_sql(mode, m, ef_construction)))
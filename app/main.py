@@ -1,28 +1,77 @@
 # import asyncio
 from contextlib import asynccontextmanager
-from typing import List
-from fastapi import Depends, FastAPI, UploadFile, File
+from dataclasses import asdict
+from typing import List, Literal, Optional
+from fastapi import Depends, FastAPI, UploadFile, File, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.core import metrics
+from app.core.config import settings
 from app.core.database import get_db
-from app.core.embedding import embbed_model
+from app.core.embedding import embedding_engine
+from app.core.parsing import parsing_executor
+from app.core.result_cache import result_cache
+from app.core.search_pool import search_pool
+from app.core.startup import startup
+from app.core.uploads import RequestSizeLimitMiddleware, spool_upload
 from app.schema.document import DocumentCreate
-from app.services.chunk_service import ChunkService
 from app.services.document import DocumentService
 from app.services.document_parser import DocumentParserService
 from app.services.embeddings import EmbeddingService, VectorService
+from app.services.ingest import IngestPipeline
+from app.services.jobs import JobService
+from app.services.transcription import transcription_engine
 from app.core.database import init_db
 # from app.core.database import test_connection
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    embbed_model.init()
-    await init_db()
+    await embedding_engine.start()
+    parsing_executor.start()
+    await transcription_engine.start()
+    if not startup.schema_ready:
+        await init_db()
+    if settings.SEARCH_FAST_PATH:
+        await search_pool.start()
+    await startup.follow_backend()
+    # The model loads in the background; see /health/ready.
+    startup.start()
+    metrics.registry.start_publishing(settings.METRICS_PUBLISH_S)
     yield
+    await metrics.registry.stop_publishing()
+    await startup.stop()
+    await search_pool.stop()
+    await result_cache.close()
+    await transcription_engine.stop()
+    parsing_executor.stop()
+    await embedding_engine.stop()
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=settings.MAX_REQUEST_BYTES)
+
+DEFAULT_OWNER_ID = 12312415353
+
+
+@app.get("/health/live")
+async def health_live():
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    report = await startup.check()
+    return JSONResponse(
+        report,
+        status_code=status.HTTP_200_OK if report["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
 
 
 @app.post("/parse")
@@ -33,10 +82,19 @@ async def parse_file(file: UploadFile = File(...)):
         return {"error": str(e)}
 
 
+@app.post("/parse/batch")
+async def parse_files(files: List[UploadFile] = File(...)):
+    return StreamingResponse(
+        DocumentParserService.parse_multiple(files),
+        media_type="application/x-ndjson",
+    )
+
+
 @app.post("/embbed")
 async def embbed(text: str):
     try:
-        return {"embeddings": EmbeddingService.embbed_string(text)}
+        embeddings = await EmbeddingService.embbed_string(text)
+        return {"embeddings": embeddings.tolist()}
     except ValueError as e:
         return {"error": str(e)}
 
@@ -47,31 +105,104 @@ async def save(file: UploadFile = File(...), db: AsyncSession = Depends(get_db))
         db,
         document_data=DocumentCreate(title=file.filename or "None"),
     )
-    result = await DocumentParserService.parse(file)
-    chunks = ChunkService.chunk(result["text"])
-    embeddings = EmbeddingService.embbed_doc(chunks)
+    try:
+        async with spool_upload(file) as source:
+            stats = await IngestPipeline().ingest_source(
+                db,
+                document_id=document.id,
+                owner_id=DEFAULT_OWNER_ID,
+                source=source,
+                segments=DocumentParserService.iter_upload_text(source),
+            )
+    except ValueError as e:
+        return {"error": str(e)}
+    return {"msg": "success", "document_id": document.id, "chunks": stats.chunks}
+
+
+@app.post("/reindex/{document_id}")
+async def reindex(
+    document_id: int,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+):
+    document = await DocumentService.get_by_id(db, document_id)
+    try:
+        async with spool_upload(file) as source:
+            stats = await IngestPipeline().ingest_source(
+                db,
+                document_id=document.id,
+                owner_id=DEFAULT_OWNER_ID,
+                source=source,
+                segments=DocumentParserService.iter_upload_text(source),
+                reindex=True,
+            )
+    except ValueError as e:
+        return {"error": str(e)}
+    return {"msg": "success", "document_id": document.id, **asdict(stats)}
+
+
+@app.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def enqueue_job(
+    file: UploadFile = File(...),
+    document_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """Queue `file` for ingestion by the workers; with `document_id`, re-index that document."""
+    if document_id is not None:
+        await DocumentService.get_by_id(db, document_id)
+    async with spool_upload(file) as source:
+        job = await JobService.enqueue(
+            db, source, owner_id=DEFAULT_OWNER_ID, document_id=document_id
+        )
+    return {"job_id": job.id, "document_id": job.document_id, "status": job.status}
 
-    await VectorService.upsert_chunks(
-        db,
-        document_id=document.id,
-        owner_id=12312415353,
-        chunks=(chunks),
-        embeddings=embeddings,
-    )
-    return {"msg": "success"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    return await JobService.get(db, job_id)
 
 
 class QuerySchema(BaseModel):
     query: str
     doc_ids: List[int]
+    mode: Literal["vector", "hybrid"] = "vector"
 
 
 @app.post("/query")
 async def query(query: QuerySchema, db: AsyncSession = Depends(get_db)):
-    embeddings = EmbeddingService.embbed_string(query.query)
-    output = await VectorService.query_similar_chunks(
+    embeddings = await EmbeddingService.embbed_string(query.query)
+    if query.mode == "hybrid":
+        output = await VectorService.query_hybrid_chunks(
+            db,
+            query_embedding=embeddings,
+            query_text=query.query,
+            document_ids=query.doc_ids,
+        )
+    elif search_pool.running:
+        output = await VectorService.query_similar_chunks_fast(
+            query_embedding=embeddings,
+            document_ids=query.doc_ids,
+        )
+    else:
+        output = await VectorService.query_similar_chunks(
+            db,
+            query_embedding=embeddings,
+            document_ids=query.doc_ids,
+        )
+    return {"success": output}
+
+
+class BatchQuerySchema(BaseModel):
+    queries: List[str]
+    doc_ids: List[int]
+
+
+@app.post("/query/batch")
+async def query_batch(query: BatchQuerySchema, db: AsyncSession = Depends(get_db)):
+    embeddings = await EmbeddingService.embbed_strings(query.queries)
+    output = await VectorService.query_similar_chunks_batch(
         db,
-        query_embedding=embeddings,
+        query_embeddings=embeddings,
         document_ids=query.doc_ids,
     )
     return {"success": output}
@@ -2,16 +2,41 @@ from sqlalchemy import (
     Column,
     Integer,
     BigInteger,
+    Boolean,
+    DateTime,
     String,
     Text,
     ForeignKey,
     Index,
+    Computed,
+    func,
+    text as sql_text,
 )
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.orm import declarative_base, relationship
 from pgvector.sqlalchemy import Vector
 
+from app.core.config import settings
+from app.core.embedding_backends import get_backend
+
 Base = declarative_base()
 
+# Fixed when the tables are created; a re-embedding migration to another
+# dimension (app/services/reembed.py) changes the columns, after which
+# EMBED_BACKEND must name the new backend.
+EMBEDDING_DIM = get_backend(settings.EMBED_BACKEND).dim
+
+# Full-text representation of a chunk, used by hybrid search.
+TEXT_TSV_EXPRESSION = "to_tsvector('english', text)"
+
+# Partitioning chunks by owner requires owner_id in the primary key.
+CHUNKS_PARTITIONED = bool(settings.CHUNK_PARTITIONING)
+_CHUNK_TABLE_OPTIONS = (
+    {"postgresql_partition_by": f"{settings.CHUNK_PARTITIONING.upper()} (owner_id)"}
+    if CHUNKS_PARTITIONED
+    else {}
+)
+
 
 class Document(Base):
     __tablename__ = "documents"
@@ -19,9 +44,21 @@ class Document(Base):
     id = Column(BigInteger, primary_key=True, index=True)
     owner_id = Column(BigInteger, index=True, nullable=True)
     title = Column(String, nullable=True)
+    # SHA-256 of the upload the chunks came from, and what they depend on
+    # besides its bytes (app.services.ingest.ingest_version).
+    content_sha256 = Column(String, nullable=True)
+    parser_version = Column(String, nullable=True)
 
+    # The chunks foreign key cascades; don't load every chunk to delete it.
     chunks = relationship(
-        "Chunk", back_populates="document", cascade="all, delete-orphan"
+        "Chunk",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
+
+    __table_args__ = (
+        Index("idx_documents_content_sha256", "content_sha256", "parser_version"),
     )
 
 
@@ -32,10 +69,112 @@ class Chunk(Base):
     document_id = Column(
         BigInteger, ForeignKey("documents.id", ondelete="CASCADE"), index=True
     )
-    owner_id = Column(BigInteger, index=True, nullable=True)
+    owner_id = Column(
+        BigInteger,
+        primary_key=CHUNKS_PARTITIONED,
+        index=True,
+        nullable=not CHUNKS_PARTITIONED,
+    )
     chunk_index = Column(Integer, nullable=True)
     text = Column(Text, nullable=False)
-    embedding = Column(Vector(384))  # Adjust to your embedding dimension
+    embedding = Column(Vector(EMBEDDING_DIM))
+    # Name of the embedding backend that produced `embedding`.
+    embedding_model = Column(String, nullable=True)
+    text_tsv = Column(TSVECTOR, Computed(TEXT_TSV_EXPRESSION, persisted=True))
 
     document = relationship("Document", back_populates="chunks")
-    __table_args__ = (Index("idx_chunks_document_id", "document_id"),)
+    __table_args__ = (
+        Index("idx_chunks_document_id", "document_id"),
+        Index("idx_chunks_text_tsv", "text_tsv", postgresql_using="gin"),
+        _CHUNK_TABLE_OPTIONS,
+    )
+
+
+class DocumentEmbedding(Base):
+    """Centroid of a document's chunk embeddings (see app/core/document_index.py)."""
+
+    __tablename__ = "document_embeddings"
+
+    document_id = Column(
+        BigInteger, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True
+    )
+    # 0 is the whole document; 1..DOC_SECTION_CENTROIDS are runs of chunks.
+    section = Column(Integer, primary_key=True, default=0)
+    owner_id = Column(BigInteger, index=True, nullable=True)
+    chunk_count = Column(Integer, nullable=False)
+    embedding = Column(Vector(EMBEDDING_DIM), nullable=False)
+
+
+class IngestJob(Base):
+    """A queued upload, ingested by `python -m app.worker` (see app/services/jobs.py)."""
+
+    __tablename__ = "ingest_jobs"
+
+    id = Column(BigInteger, primary_key=True)
+    document_id = Column(
+        BigInteger, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False
+    )
+    owner_id = Column(BigInteger, nullable=True)
+    reindex = Column(Boolean, nullable=False, default=False)
+    filename = Column(String, nullable=True)
+    content_type = Column(String, nullable=False)
+    # The upload, a file in JOB_PAYLOAD_DIR; removed once the job is finished.
+    payload_file = Column(String, nullable=True)
+    payload_size = Column(BigInteger, nullable=False)
+    payload_sha256 = Column(String, nullable=True)
+
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_by = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    chunks_done = Column(Integer, nullable=False, default=0)
+    stats = Column(JSONB, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("idx_ingest_jobs_document_id", "document_id"),
+        # Claiming scans only runnable jobs.
+        Index(
+            "idx_ingest_jobs_queued",
+            "run_after",
+            postgresql_where=sql_text("status = 'queued'"),
+        ),
+        Index(
+            "idx_ingest_jobs_running",
+            "heartbeat_at",
+            postgresql_where=sql_text("status = 'running'"),
+        ),
+    )
+
+
+class EmbeddingMigration(Base):
+    """A re-embedding of the corpus with another backend (see app/services/reembed.py)."""
+
+    __tablename__ = "embedding_migrations"
+
+    id = Column(BigInteger, primary_key=True)
+    source = Column(String, nullable=False)
+    target = Column(String, nullable=False)
+    # running, swapped (chunks.embedding holds `target`'s vectors), failed, aborted
+    status = Column(String, nullable=False, default="running")
+    rows_done = Column(BigInteger, nullable=False, default=0)
+    rows_total = Column(BigInteger, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    swapped_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # At most one migration runs at a time.
+        Index(
+            "idx_embedding_migrations_running",
+            "status",
+            unique=True,
+            postgresql_where=sql_text("status = 'running'"),
+        ),
+    )
@@ -0,0 +1,55 @@
+"""
+Re-embed the corpus with another embedding backend, online.
+
+    python -m app.reembed --to bge-small-en-v1.5-int8
+    python -m app.reembed --abort
+
+See app/services/reembed.py. SIGINT / SIGTERM stop after the current
+batch; running the same command again resumes the migration.
+"""
+
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.core.config import settings
+from app.core.database import init_db
+from app.core.embedding_backends import BACKENDS, get_backend
+from app.services.reembed import ReembedMigration
+
+logger = logging.getLogger(__name__)
+
+
+async def main(args):
+    await init_db()
+    if args.abort:
+        migration_id = await ReembedMigration.abort()
+        if migration_id is None:
+            logger.info("no migration is running")
+        else:
+            logger.info("migration %s aborted", migration_id)
+        return
+
+    migration = ReembedMigration(
+        get_backend(args.to), batch_size=args.batch_size, pause_s=args.pause_s
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, migration.stop)
+    status = await migration.run()
+    logger.info("migration %s is %s", migration.id, status)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--to", choices=sorted(BACKENDS), help="backend to migrate to")
+    action.add_argument("--abort", action="store_true", help="abort the running migration")
+    parser.add_argument("--batch-size", type=int, default=settings.REEMBED_BATCH_SIZE)
+    parser.add_argument("--pause-s", type=float, default=settings.REEMBED_PAUSE_S)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    asyncio.run(main(args))
@@ -0,0 +1,290 @@
+"""
+Prefork API server: one master, N uvicorn workers sharing its model.
+
+    python main.py --workers 4
+
+The master creates the schema, loads and warms up the embedding model,
+freezes the GC and binds the listening socket, then forks the workers.
+They inherit the model copy-on-write, so N workers cost about one model's
+memory, and they all accept on the shared socket.
+
+Signals to the master:
+- SIGHUP: replace the workers one at a time, each new worker started
+  before the old one is stopped gracefully. They are forked from the
+  master again, so code changes need a master restart; an embedding
+  backend swapped in by a re-embedding migration is loaded first. (Workers
+  switch to it by themselves too, but then each holds its own copy.)
+- SIGTERM / SIGINT: stop the workers gracefully, then exit.
+
+Workers that exit are replaced, e.g. after `--max-requests` requests.
+Per-process resources (DB pool, parsing pool, caches) are per worker. The
+retrieval result cache is turned off with more than one worker unless
+RESULT_CACHE_REDIS_URL gives them a shared store. /metrics, served by any
+worker, sums every worker's histograms and counters from the snapshots
+they write to METRICS_MULTIPROC_DIR (see app/core/metrics.py).
+"""
+
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import random
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import engine, init_db
+from app.core.embedding import embbed_model
+from app.core.parsing import parsing_executor
+from app.core.result_cache import result_cache
+from app.core.startup import startup
+from app.main import app
+
+logger = logging.getLogger(__name__)
+
+# Workers dying this soon after being forked are restarted with a delay.
+_CRASH_WINDOW_S = 5.0
+
+
+class PreforkServer:
+    def __init__(
+        self,
+        app,
+        host: str = settings.SERVER_HOST,
+        port: int = settings.SERVER_PORT,
+        workers: int = settings.SERVER_WORKERS,
+        graceful_timeout_s: float = settings.SERVER_GRACEFUL_TIMEOUT_S,
+        max_requests: int = settings.SERVER_MAX_REQUESTS,
+    ) -> None:
+        self.app = app
+        self.host = host
+        self.port = port
+        self.worker_count = workers or os.cpu_count() or 1
+        self.graceful_timeout_s = graceful_timeout_s
+        self.max_requests = max_requests
+        # pid -> fork time of the current workers
+        self.workers: Dict[int, float] = {}
+        self._sock: socket.socket
+        self._stopping = False
+        self._restart = False
+        self._metrics_dir: Optional[str] = None
+
+    def run(self):
+        self.preload()
+        self._sock = self._bind()
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_restart)
+        logger.info(
+            "master %d serving on %s:%d with %d workers",
+            os.getpid(), self.host, self.port, self.worker_count,
+        )
+        for _ in range(self.worker_count):
+            self._spawn()
+
+        while not self._stopping:
+            self._reap()
+            if self._restart:
+                self._restart = False
+                self._roll()
+            time.sleep(0.2)
+        self._shutdown()
+
+    def preload(self):
+        """Everything the workers share, done once before forking."""
+        if settings.EMBED_THREADS is None:
+            # ONNX Runtime's thread pool does not survive fork(); with one
+            # thread it has none, and N workers use N cores anyway.
+            settings.EMBED_THREADS = 1
+        elif settings.EMBED_THREADS != 1:
+            raise SystemExit("prefork workers need EMBED_THREADS=1")
+        if settings.PARSE_WORKERS is None:
+            parsing_executor.max_workers = max((os.cpu_count() or 1) // self.worker_count, 1)
+        # Tokenizers' own thread pool has the same problem.
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        result_cache.require_shared(self.worker_count)
+
+        asyncio.run(self._prepare_database())
+        startup.schema_ready = True
+        if embbed_model.backend.threads not in (None, 1):
+            raise SystemExit(f"prefork workers need {embbed_model.backend.name} to use 1 thread")
+        startup.preload()
+        logger.info("model loaded and warmed up: %s", startup.seconds)
+
+        if self.worker_count > 1:
+            self._metrics_dir = settings.METRICS_MULTIPROC_DIR or tempfile.mkdtemp(
+                prefix="context-machine-metrics-"
+            )
+            metrics.registry.share(self._metrics_dir)
+
+        # Keep the GC from writing to (and so copying) the preloaded objects.
+        gc.collect()
+        gc.freeze()
+
+    @staticmethod
+    async def _prepare_database():
+        await init_db()
+        await startup.follow_backend()
+        # Pooled connections must not be shared with the workers.
+        await engine.dispose()
+
+    def _follow_backend(self):
+        """Load the backend a migration swapped in, before forking new workers."""
+        async def follow() -> bool:
+            try:
+                return await startup.follow_backend()
+            finally:
+                await engine.dispose()
+
+        try:
+            switched = asyncio.run(follow())
+        except Exception:
+            logger.exception("could not check for an embedding backend switch")
+            return
+        if switched:
+            startup.preload()
+            gc.unfreeze()
+            gc.collect()
+            gc.freeze()
+
+    def _bind(self) -> socket.socket:
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        return sock
+
+    def _spawn(self) -> int:
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return pid
+
+        code = 1
+        try:
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(sig, signal.SIG_DFL)
+            config = uvicorn.Config(
+                self.app,
+                lifespan="on",
+                timeout_graceful_shutdown=int(self.graceful_timeout_s),
+                # Jittered so workers do not all restart at once.
+                limit_max_requests=(
+                    self.max_requests + random.randint(0, self.max_requests // 10)
+                    if self.max_requests
+                    else None
+                ),
+            )
+            server = uvicorn.Server(config)
+            server.run(sockets=[self._sock])
+            code = 0 if server.started else 3
+        except BaseException:
+            logger.exception("worker %d failed", os.getpid())
+        finally:
+            os._exit(code)
+
+    def _reap(self):
+        """Replace workers that exited."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            forked_at = self.workers.pop(pid, None)
+            if forked_at is None or self._stopping:
+                continue
+            logger.warning(
+                "worker %d exited with %d; starting another", pid, os.waitstatus_to_exitcode(status)
+            )
+            if time.monotonic() - forked_at < _CRASH_WINDOW_S:
+                time.sleep(1)
+            self._spawn()
+
+    def _roll(self):
+        """Replace every worker, one at a time."""
+        logger.info("restarting %d workers", len(self.workers))
+        self._follow_backend()
+        for pid in list(self.workers):
+            if self._stopping:
+                return
+            self._spawn()
+            self.workers.pop(pid, None)
+            self._stop_worker(pid)
+
+    def _stop_worker(self, pid: int):
+        self._signal(pid, signal.SIGTERM)
+        self._wait_worker(pid, time.monotonic() + self.graceful_timeout_s)
+
+    def _wait_worker(self, pid: int, deadline: float):
+        """Wait for `pid` to exit, killing it at `deadline`."""
+        while time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if done:
+                return
+            time.sleep(0.1)
+        logger.warning("worker %d did not stop in time; killing it", pid)
+        self._signal(pid, signal.SIGKILL)
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+    def _shutdown(self):
+        logger.info("stopping %d workers", len(self.workers))
+        workers, self.workers = list(self.workers), {}
+        for pid in workers:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout_s
+        for pid in workers:
+            self._wait_worker(pid, deadline)
+        self._sock.close()
+        if self._metrics_dir and not settings.METRICS_MULTIPROC_DIR:
+            shutil.rmtree(self._metrics_dir, ignore_errors=True)
+
+    @staticmethod
+    def _signal(pid: int, sig: int):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_restart(self, signum, frame):
+        self._restart = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default=settings.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS)
+    parser.add_argument("--graceful-timeout", type=float, default=settings.SERVER_GRACEFUL_TIMEOUT_S)
+    parser.add_argument("--max-requests", type=int, default=settings.SERVER_MAX_REQUESTS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    PreforkServer(
+        app,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        graceful_timeout_s=args.graceful_timeout,
+        max_requests=args.max_requests,
+    ).run()
@@ -1,5 +1,236 @@
+import asyncio
 import re
-from typing import List
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Tuple
+
+from tokenizers import Tokenizer
+
+from app.core.config import settings
+from app.core.embedding import get_tokenizer
+
+_HEADING = re.compile(r"^\s{0,3}#{1,6}\s")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+
+# Largest incomplete trailing block held back between segments.
+_MAX_CARRY_CHARS = 64 * 1024
+
+
+@dataclass
+class _Unit:
+    """A sentence (or code line) of a block, with its size in model tokens."""
+
+    text: str
+    tokens: int
+    block: int
+    sep: str  # joins it to the previous unit of the same block
+    heading: bool = False
+    overlap: bool = False  # repeated from the previous chunk
+
+
+class TokenChunker:
+    """
+    Streaming chunker that packs text into chunks of at most `max_tokens`
+    model tokens.
+
+    Segments are split into blocks (Markdown headings, fenced code,
+    list items and paragraphs), blocks into sentences, and sentences are
+    packed greedily without crossing the budget. Each chunk after the first
+    repeats up to `overlap_tokens` of trailing sentences from the previous
+    one. A heading is never left at the end of a chunk.
+    The last paragraph of a segment is held back until the next segment
+    (or `flush`), so blocks split across segments (e.g. PDF pages) stay
+    whole.
+    """
+
+    def __init__(
+        self,
+        tokenizer: Optional[Tokenizer] = None,
+        max_tokens: int = settings.CHUNK_MAX_TOKENS,
+        overlap_tokens: int = settings.CHUNK_OVERLAP_TOKENS,
+    ) -> None:
+        if max_tokens <= 0 or not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("need 0 <= overlap_tokens < max_tokens")
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self._tail = ""
+        self._blocks = 0
+        self._units: List[_Unit] = []
+        self._tokens = 0
+
+    def feed(self, segment: str) -> Iterator[str]:
+        """Add a segment of text; yields the chunks it completes."""
+        text = self._tail + segment
+        cut = self._safe_cut(text)
+        self._tail = text[cut:]
+        yield from self._pack(text[:cut])
+
+    def flush(self) -> Iterator[str]:
+        """Yield everything still buffered; the chunker can then be reused."""
+        text, self._tail = self._tail, ""
+        yield from self._pack(text)
+        if self._has_new_content():
+            yield self._emit(keep_overlap=False)
+        self._units, self._tokens = [], 0
+
+    def _safe_cut(self, text: str) -> int:
+        """
+        Where to split `text` into complete blocks and a held-back tail: the
+        last paragraph break outside a code fence, unless the tail would
+        grow past `_MAX_CARRY_CHARS`.
+        """
+        cut = text.rfind("\n\n")
+        while cut > 0 and self._in_fence(text[:cut]):
+            cut = text.rfind("\n\n", 0, cut)
+        if cut > 0 and len(text) - cut <= _MAX_CARRY_CHARS:
+            return cut
+        return len(text) if len(text) > _MAX_CARRY_CHARS else 0
+
+    @staticmethod
+    def _in_fence(text: str) -> bool:
+        return sum(1 for line in text.split("\n") if _FENCE.match(line)) % 2 == 1
+
+    def _pack(self, text: str) -> Iterator[str]:
+        units = self._units_of(text)
+        for unit in units:
+            starts_section = unit.heading and unit.sep == ""
+            if starts_section and self._tokens >= self.max_tokens // 2:
+                # Start sections on a fresh chunk once this one is reasonably full.
+                yield self._emit(keep_overlap=False)
+            elif self._tokens + unit.tokens > self.max_tokens and self._has_new_content():
+                yield self._emit(keep_overlap=True)
+            # Drop overlap until the new unit fits; it always makes progress.
+            while self._units and self._tokens + unit.tokens > self.max_tokens:
+                self._tokens -= self._units.pop(0).tokens
+            self._units.append(unit)
+            self._tokens += unit.tokens
+
+    def _has_new_content(self) -> bool:
+        return any(not unit.overlap for unit in self._units)
+
+    def _emit(self, keep_overlap: bool) -> str:
+        units = self._units
+        # Keep a trailing heading with the text that follows it.
+        held: List[_Unit] = []
+        while len(units) > 1 and units[-1].heading:
+            held.insert(0, units.pop())
+
+        chunk = self._join(units)
+
+        carried: List[_Unit] = []
+        if keep_overlap and self.overlap_tokens and not held:
+            budget = self.overlap_tokens
+            for unit in reversed(units):
+                if unit.heading:
+                    break
+                if unit.tokens > budget:
+                    if not carried:
+                        carried.insert(0, self._last_tokens(unit, budget))
+                    break
+                carried.insert(0, _Unit(unit.text, unit.tokens, unit.block, unit.sep))
+                budget -= unit.tokens
+            for unit in carried:
+                unit.overlap = True
+
+        self._units = carried + held
+        self._tokens = sum(unit.tokens for unit in self._units)
+        return chunk
+
+    def _last_tokens(self, unit: _Unit, count: int) -> _Unit:
+        encoding = self.tokenizer.encode(unit.text, add_special_tokens=False)
+        start = encoding.offsets[-count][0]
+        return _Unit(unit.text[start:], count, unit.block, unit.sep)
+
+    @staticmethod
+    def _join(units: List[_Unit]) -> str:
+        parts: List[str] = []
+        previous: Optional[_Unit] = None
+        for unit in units:
+            if previous is not None:
+                parts.append(unit.sep if unit.block == previous.block else "\n\n")
+            parts.append(unit.text)
+            previous = unit
+        return "".join(parts).strip()
+
+    def _units_of(self, text: str) -> List[_Unit]:
+        pieces: List[Tuple[str, int, str, bool]] = []  # text, block, sep, heading
+        for block, code, heading in self._split_blocks(text):
+            self._blocks += 1
+            if code:
+                sentences, sep = block.split("\n"), "\n"
+            else:
+                sentences, sep = _SENTENCE_END.split(block), " "
+            for i, sentence in enumerate(sentences):
+                if sentence.strip() or code:
+                    pieces.append((sentence, self._blocks, sep if i else "", heading))
+        if not pieces:
+            return []
+
+        encodings = self.tokenizer.encode_batch(
+            [piece[0] for piece in pieces], add_special_tokens=False
+        )
+        units: List[_Unit] = []
+        for (piece, block, sep, heading), encoding in zip(pieces, encodings):
+            if len(encoding.ids) <= self.max_tokens:
+                units.append(_Unit(piece, len(encoding.ids), block, sep, heading))
+                continue
+            # A single sentence over budget: cut it at token boundaries.
+            offsets = encoding.offsets
+            for start in range(0, len(offsets), self.max_tokens):
+                window = offsets[start : start + self.max_tokens]
+                units.append(
+                    _Unit(
+                        piece[window[0][0] : window[-1][1]],
+                        len(window),
+                        block,
+                        sep if start == 0 else " ",
+                        heading,
+                    )
+                )
+        return units
+
+    @staticmethod
+    def _split_blocks(text: str) -> Iterator[Tuple[str, bool, bool]]:
+        """Yield (text, is_code, is_heading) blocks with whitespace normalized."""
+        lines: List[str] = []
+        in_fence = False
+
+        def paragraph() -> Iterator[Tuple[str, bool, bool]]:
+            block = _SPACES.sub(" ", " ".join(line.strip() for line in lines)).strip()
+            lines.clear()
+            if block:
+                yield block, False, False
+
+        for line in text.split("\n"):
+            if _FENCE.match(line):
+                if in_fence:
+                    lines.append(line.rstrip())
+                    yield "\n".join(lines), True, False
+                    lines.clear()
+                else:
+                    yield from paragraph()
+                    lines.append(line.rstrip())
+                in_fence = not in_fence
+            elif in_fence:
+                lines.append(line.rstrip())
+            elif not line.strip():
+                yield from paragraph()
+            elif _HEADING.match(line):
+                yield from paragraph()
+                yield _SPACES.sub(" ", line.strip()), False, True
+            elif _LIST_ITEM.match(line):
+                yield from paragraph()
+                lines.append(line)
+            else:
+                lines.append(line)
+
+        if in_fence:
+            yield "\n".join(lines), True, False
+            lines.clear()
+        yield from paragraph()
 
 
 class ChunkService:
@@ -36,6 +267,27 @@ class ChunkService:
             if chunk:
                 chunks.append(chunk)
 
-            start = max(end - overlap, end)  # maintain overlap but avoid infinite loop
+            if end >= text_length:
+                break
+            # Step back by `overlap`, but always move forward.
+            start = max(end - overlap, start + 1)
 
         return chunks
+
+    @staticmethod
+    def iter_chunks(segments: Iterable[str], **kwargs) -> Iterator[str]:
+        """Token-budgeted chunks of a stream of text segments (see `TokenChunker`)."""
+        chunker = TokenChunker(**kwargs)
+        for segment in segments:
+            yield from chunker.feed(segment)
+        yield from chunker.flush()
+
+    @staticmethod
+    async def aiter_chunks(segments: AsyncIterator[str], **kwargs) -> AsyncIterator[str]:
+        """`iter_chunks` of an async stream, chunking in a worker thread."""
+        chunker = await asyncio.to_thread(TokenChunker, **kwargs)
+        async for segment in segments:
+            for chunk in await asyncio.to_thread(list, chunker.feed(segment)):
+                yield chunk
+        for chunk in await asyncio.to_thread(list, chunker.flush()):
+            yield chunk
@@ -1,7 +1,8 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import HTTPException, status
-from app.models import Document
+from app.core.result_cache import result_cache
+from app.models import Chunk, Document
 from app.schema.document import DocumentCreate, DocumentUpdate  # your Pydantic schemas
 
 
@@ -64,5 +65,11 @@ class DocumentService:
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Document with ID {document_id} not found.",
             )
+        owners = await db.scalars(
+            select(Chunk.owner_id).where(Chunk.document_id == document_id).distinct()
+        )
+        owner_ids = set(owners)
         await db.delete(document)
         await db.commit()
+        for owner_id in owner_ids:
+            await result_cache.invalidate(document_id, owner_id)
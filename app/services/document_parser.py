@@ -1,70 +1,84 @@
-from fastapi import HTTPException, UploadFile
-from typing import List
+import asyncio
+from fastapi import UploadFile
+from collections import deque
+from typing import AsyncIterator, BinaryIO, List, Tuple, Union
 import io 
-from bs4 import BeautifulSoup
-from docx import Document
-from pdfminer.high_level import extract_text
-import tempfile
-import os
-from PIL import Image
-import pytesseract
 import logging
 import io
-from pydub import AudioSegment
-import httpx
-import mimetypes
+import os
+import tempfile
+from app.core import metrics
 from app.core.config import settings
+from app.core.parsing import parsing_executor
+from app.core.uploads import UploadSource, spool_upload
+from app.services.transcription import transcription_engine
 import json
 
 logger=logging.getLogger(__name__)
 
+# Parser backends (pdfminer, python-docx, BeautifulSoup, PIL, pytesseract)
+# are imported by the functions that use them: they are slow to import and
+# most processes, like each parsing worker, only ever need one or two.
+
+AUDIO_TYPES = {
+    "audio/flac", "audio/mpeg", "audio/mp3", "audio/m4a",
+    "audio/x-m4a", "audio/ogg", "audio/wav",
+    "audio/x-wav", "audio/webm"
+}
+
+# Recorded with each ingested document; bump it when parsers extract
+# different text from the same bytes, so earlier uploads are not reused.
+PARSER_VERSION = "1"
+
+# Metrics label of the parser for each content type.
+PARSER_NAMES = {
+    "image/png": "image",
+    "image/jpeg": "image",
+    "image/webp": "image",
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "text/html": "html",
+    "text/plain": "text",
+    "text/markdown": "text",
+    **{content_type: "audio" for content_type in AUDIO_TYPES},
+}
+
+
+# What parsers consume: an upload's bytes, or the path of its spool file.
+Source = Union[bytes, str]
+
+
+def open_binary(source: Source) -> BinaryIO:
+    return io.BytesIO(source) if isinstance(source, bytes) else open(source, "rb")
+
+
+def write_temp_file(data: bytes, suffix: str = "") -> str:
+    """Write `data` to a new temp file and return its path; the caller removes it."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as f:
+        f.write(data)
+    return f.name
+
+
+def read_text(source: Source) -> str:
+    if isinstance(source, bytes):
+        return source.decode("utf-8", errors="ignore")
+    with open(source, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
 
 
 class DocumentParserService:
     @staticmethod
     async def parse(file: UploadFile):
-        content_type = file.content_type or ""
-        suffix = mimetypes.guess_extension(content_type) or ""
-        content = await file.read()
-        tmp_path = None
-
         try:
-            # Write file to temp location
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-                tmp.write(content)
-                tmp_path = tmp.name
-
             # Default output values
             output, error, status = "", "", "Success"
 
-            match content_type:
-                case "image/png" | "image/jpeg" | "image/webp":
-                    output = await ImageParser.parse(tmp_path)
-                case "application/pdf":
-                    output = await PDFParser.parse(tmp_path)
-                case "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                    output = await DocxParser.parse(tmp_path)
-                case "text/html":
-                    output = await HTMLParser.parse(tmp_path)
-                case "text/plain" | "text/markdown":
-                    output = await TextParser.parse(tmp_path)
-                case content_type if content_type in {
-                    "audio/flac", "audio/mpeg", "audio/mp3", "audio/m4a",
-                    "audio/x-m4a", "audio/ogg", "audio/wav",
-                    "audio/x-wav", "audio/webm"
-                }:
-                    output = await AudioParser.parse(content, content_type)
-                case _:
-                    status = "Failed"
-                    error = f"Unsupported file type: {content_type}"
-                    output = ""
+            async with spool_upload(file) as source:
+                output = await DocumentParserService.parse_source(source)
         except Exception as e:
             status = "Failed"
             error = str(e)
             output = ""
-        finally:
-            if tmp_path and os.path.exists(tmp_path):
-                os.remove(tmp_path)
 
         return {
             "file_name": file.filename,
@@ -72,48 +86,215 @@ class DocumentParserService:
             "error": error,
             "text": output
         }
-        
+
+    @staticmethod
+    async def parse_source(source: UploadSource):
+        parser = PARSER_NAMES.get(source.content_type, "unsupported")
+        with metrics.PARSE_SECONDS.labels(parser).time():
+            return await DocumentParserService._parse_source(source)
+
+    @staticmethod
+    async def _parse_source(source: UploadSource):
+        content = source.content
+        match source.content_type:
+            case "image/png" | "image/jpeg" | "image/webp":
+                return await ImageParser.parse(content)
+            case "application/pdf":
+                return await PDFParser.parse(content)
+            case "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
+                return await DocxParser.parse(content)
+            case "text/html":
+                return await HTMLParser.parse(content)
+            case "text/plain" | "text/markdown":
+                return await TextParser.parse(content)
+            case content_type if content_type in AUDIO_TYPES:
+                return await AudioParser.parse(source.read_bytes(), content_type)
+            case content_type:
+                raise ValueError(f"Unsupported file type: {content_type}")
+
+    @staticmethod
+    async def iter_text(file: UploadFile) -> AsyncIterator[str]:
+        """Yield the text of `file` segment by segment; raises ValueError if parsing fails."""
+        async with spool_upload(file) as source:
+            async for text in DocumentParserService.iter_upload_text(source):
+                yield text
+
+    @staticmethod
+    async def iter_upload_text(source: UploadSource) -> AsyncIterator[str]:
+        """`iter_source_text`, raising ValueError if parsing fails."""
+        try:
+            async for text in DocumentParserService.iter_source_text(source):
+                yield text
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(str(e)) from e
+
+    @staticmethod
+    async def iter_source_text(source: UploadSource) -> AsyncIterator[str]:
+        """
+        Yield the text of `source` segment by segment (pages for PDFs).
+        Raises ValueError for unsupported types; other errors pass through.
+        """
+        if source.content_type == "application/pdf":
+            pages = metrics.timed_aiter(
+                PDFParser.iter_pages(source.content),
+                metrics.PARSE_SECONDS.labels("pdf").observe,
+            )
+            async for _, text in pages:
+                if text.strip():
+                    yield text
+            return
+
+        text = await DocumentParserService.parse_source(source)
+        if text:
+            yield text
 
     @staticmethod
     async def parse_multiple(files: List[UploadFile]):
-        for file in files:
-            result= await DocumentParserService.parse(file)
-            yield (json.dumps(result) + "\n").encode("utf-8")
-        yield json.dumps({
+        """Parse `files` concurrently, yielding NDJSON lines in completion order."""
+        tasks = [
+            asyncio.create_task(DocumentParserService.parse(file)) for file in files
+        ]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                yield (json.dumps(result) + "\n").encode("utf-8")
+        finally:
+            for task in tasks:
+                task.cancel()
+        yield (json.dumps({
             "file_name": "",
             "status": "Finished",
             "error": "",
             "text": ""
-            }).encode("utf-8")
+            }) + "\n").encode("utf-8")
 
 
 class TextParser:
     @staticmethod
-    async def parse(path: str):
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            text = f.read()
+    async def parse(source: Source):
+        if isinstance(source, bytes):
+            return read_text(source)
+        # Plain file read, not worth a round-trip through the process pool.
+        return await asyncio.to_thread(TextParser.extract, source)
+
+    @staticmethod
+    def extract(source: Source):
+        text = read_text(source)
         return  text
 
 
 class PDFParser:
     @staticmethod
-    async def parse(path: str):
-        text = extract_text(path)
-        return  text
+    async def parse(source: Source):
+        pages = [text async for _, text in PDFParser.iter_pages(source)]
+        return "".join(pages)
+
+    @staticmethod
+    async def iter_pages(source: Source) -> AsyncIterator[Tuple[int, str]]:
+        """
+        Yield `(page_number, text)` in page order, extracting page ranges in
+        parallel worker processes so the first pages are available long
+        before the last ones are parsed. In-memory bytes split over several
+        tasks are written to one temp file first, so the workers read them
+        from disk instead of each receiving a copy.
+        """
+        page_count = await asyncio.to_thread(PDFParser.count_pages, source)
+        spool = None
+        if isinstance(source, bytes) and page_count > settings.PDF_PAGES_PER_TASK:
+            # Every task would otherwise pickle the whole file to its worker.
+            spool = source = await asyncio.to_thread(write_temp_file, source, ".pdf")
+        ranges = deque(
+            (start, min(start + settings.PDF_PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, settings.PDF_PAGES_PER_TASK)
+        )
+        pending: deque[asyncio.Task] = deque()
+        try:
+            while ranges or pending:
+                while ranges and len(pending) < settings.PDF_MAX_INFLIGHT_TASKS:
+                    start, stop = ranges.popleft()
+                    pending.append(
+                        asyncio.create_task(
+                            parsing_executor.run(
+                                "pdf", PDFParser.extract_page_range, source, start, stop
+                            )
+                        )
+                    )
+                for page in await pending.popleft():
+                    yield page
+        finally:
+            for task in pending:
+                task.cancel()
+            if spool is not None:
+                os.unlink(spool)
+
+    @staticmethod
+    def count_pages(source: Source) -> int:
+        from pdfminer.pdfdocument import PDFDocument
+        from pdfminer.pdfpage import PDFPage
+        from pdfminer.pdfparser import PDFParser as PDFStreamParser
+        from pdfminer.pdftypes import resolve1
+
+        with open_binary(source) as fp:
+            document = PDFDocument(PDFStreamParser(fp))
+            pages = resolve1(document.catalog.get("Pages"))
+            count = resolve1(pages.get("Count")) if pages else None
+            if isinstance(count, int):
+                return count
+            return sum(1 for _ in PDFPage.create_pages(document))
+
+    @staticmethod
+    def extract_page_range(source: Source, start: int, stop: int) -> List[Tuple[int, str]]:
+        """Text of pages [start, stop) as `(page_number, text)`, 1-based, like extract_text."""
+        from pdfminer.converter import TextConverter
+        from pdfminer.layout import LAParams
+        from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
+
+        pages = []
+        with open_binary(source) as fp:
+            resources = PDFResourceManager(caching=True)
+            out = io.StringIO()
+            device = TextConverter(resources, out, laparams=LAParams())
+            interpreter = PDFPageInterpreter(resources, device)
+            for page_no, page in enumerate(PDFPage.get_pages(fp)):
+                if page_no < start:
+                    continue
+                if page_no >= stop:
+                    break
+                interpreter.process_page(page)
+                pages.append((page_no + 1, out.getvalue()))
+                out.seek(0)
+                out.truncate(0)
+            device.close()
+        return pages
 
 
 class DocxParser:
     @staticmethod
-    async def parse(path: str):
-        doc = Document(path)
+    async def parse(source: Source):
+        return await parsing_executor.run("docx", DocxParser.extract, source)
+
+    @staticmethod
+    def extract(source: Source):
+        from docx import Document
+
+        with open_binary(source) as f:
+            doc = Document(f)
         text = "\n".join([p.text for p in doc.paragraphs])
         return text
 
 class HTMLParser:
     @staticmethod
-    async def parse(path: str):
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            html = f.read()
+    async def parse(source: Source):
+        return await parsing_executor.run("html", HTMLParser.extract, source)
+
+    @staticmethod
+    def extract(source: Source):
+        from bs4 import BeautifulSoup
+
+        html = read_text(source)
         soup = BeautifulSoup(html, "html.parser")
         text = soup.get_text(separator="\n", strip=True)
 
@@ -122,10 +303,18 @@ class HTMLParser:
 
 class ImageParser:
     @staticmethod
-    async def parse(path: str):
+    async def parse(source: Source):
+        return await parsing_executor.run("image", ImageParser.extract, source)
+
+    @staticmethod
+    def extract(source: Source):
+        import pytesseract
+        from PIL import Image
+
         try:
-            image=Image.open(path)
-            text=pytesseract.image_to_string(image)
+            with open_binary(source) as f:
+                image=Image.open(f)
+                text=pytesseract.image_to_string(image)
             return str(text)
         except Exception as e:
             logger.warning(f"image failed to parse: {e}")
@@ -133,24 +322,4 @@ class ImageParser:
 class AudioParser:
     @staticmethod
     async def parse(file:bytes,file_type:str):
-        size=len(file)/(1024*1024)
-        if size> settings.MAX_AUDIO_SIZE_MB:
-            raise HTTPException(status_code=400,detail=f"File too large : file should be less than {settings.MAX_AUDIO_SIZE_MB} MB")
-        audio=AudioSegment.from_file(io.BytesIO(file))
-        duration_sec = len(audio) / 1000
-        duration_min = duration_sec / 60
-        if duration_min > settings.MAX_AUDIO_DURATION_MIN:
-            raise HTTPException(status_code=400, detail=f"Audio too long: audio should be less than {settings.MAX_AUDIO_DURATION_MIN} min")
-        
-        ext = mimetypes.guess_extension(file_type) or ".wav"
-        async with httpx.AsyncClient(timeout=None) as client:
-            form = {"model": "whisper-large-v3-turbo"}
-            files = {"file": (f"audio{ext}",file, file_type)}
-            headers = {"Authorization": f"Bearer {settings.GROQ_API}"}
-            response = await client.post(settings.GROQ_TRANSCRIPTION_URL, data=form, files=files, headers=headers)
-
-        if response.status_code != 200:
-            raise HTTPException(status_code=response.status_code, detail=response.text)
-
-        data = response.json()
-        return data.get("text")
\ No newline at end of file
+        return await transcription_engine.transcribe(file, file_type)
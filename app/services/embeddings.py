@@ -1,16 +1,40 @@
-from fastembed.common.types import NumpyArray
-from app.core.embedding import get_embbed
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import get_asyncpg_connection
+from app.core.document_index import refresh_document_embeddings
+from app.core.embedding import (
+    NumpyArray,
+    embbed_model,
+    embedding_engine,
+    query_embedding_cache,
+)
+from app.core.embedding_backends import EmbeddingBackend
+from app.core.partitioning import partition_manager
+from app.core.result_cache import query_scopes, result_cache, vector_key
+from app.core.search_pool import search_pool, to_positional
+from app.core.vector_index import candidate_distance
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.models import Chunk
+from app.services.search_planner import (
+    EXACT,
+    FILTERED,
+    HNSW,
+    Database,
+    SearchPlan,
+    filter_sql,
+    search_planner,
+)
 import numpy as np
+import re
 
 ##
 from sqlalchemy import (
     text as sql_text,
 )
 
-from typing import Iterable, List, Optional
-from uuid import uuid4
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+import hashlib
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 ##
@@ -18,13 +42,82 @@ from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 class EmbeddingService:
     @staticmethod
-    def embbed_doc(chunks: List[str]):
-        """returns Vectors of 384 dimensions"""
-        return get_embbed().embed(chunks)
+    async def embbed_doc(chunks: List[str]) -> List[NumpyArray]:
+        """returns Vectors of the active backend's dimension"""
+        return await embedding_engine.embed(chunks)
+
+    @staticmethod
+    async def embbed_string(query: str) -> NumpyArray:
+        """Embed a query, served from the query cache when possible."""
+        backend = embbed_model.backend
+        normalized = EmbeddingService.normalize_query(query, backend)
+        key = (backend.name, normalized)
+
+        async def compute():
+            vector = (await embedding_engine.embed([normalized]))[0]
+            vector.setflags(write=False)  # shared between callers
+            return vector
+
+        return await query_embedding_cache.get_or_compute(
+            key, compute, size_of=lambda v: v.nbytes
+        )
+
+    @staticmethod
+    async def embbed_strings(queries: List[str]) -> List[NumpyArray]:
+        """Embed several queries, running every cache miss in one model batch."""
+        backend = embbed_model.backend
+        keys = [(backend.name, EmbeddingService.normalize_query(q, backend)) for q in queries]
+        vectors = {key: query_embedding_cache.get(key) for key in keys}
+        missing = [key for key, vector in vectors.items() if vector is None]
+
+        if missing:
+            embedded = await embedding_engine.embed([text for _, text in missing])
+            for key, vector in zip(missing, embedded):
+                vector.setflags(write=False)  # shared between callers
+                query_embedding_cache.set(key, vector, vector.nbytes)
+                vectors[key] = vector
+
+        return [vectors[key] for key in keys]
 
     @staticmethod
-    def embbed_string(query: str):
-        return list(get_embbed().embed([query]))[0]
+    def normalize_query(query: str, backend: EmbeddingBackend) -> str:
+        """Whitespace-insensitive form, also case-insensitive for uncased backends."""
+        normalized = re.sub(r"\s+", " ", query.strip())
+        return normalized.lower() if backend.uncased else normalized
+
+
+# Columns written by upsert_chunks, in COPY record order.
+_CHUNK_COLUMNS = ("id", "document_id", "owner_id", "chunk_index", "text", "embedding")
+# (id) or, with partitioning, (id, owner_id).
+_CHUNK_CONFLICT_COLUMNS = [col.name for col in Chunk.__table__.primary_key.columns]
+_CHUNK_UPDATE_COLUMNS = tuple(
+    col
+    for col in ("text", "embedding", "embedding_model", "chunk_index", "owner_id")
+    if col not in _CHUNK_CONFLICT_COLUMNS
+)
+
+# asyncpg caps a statement at 32767 bind parameters (one more for embedding_model).
+_INSERT_MAX_ROWS = 32767 // (len(_CHUNK_COLUMNS) + 1)
+
+
+class ChunkIds:
+    """
+    Content-addressed chunk ids for one document.
+
+    An id is `<document_id>:<sha256(text)[:32]>:<n>`, where `n` numbers
+    repeated texts within the document, so re-chunking unchanged content
+    yields the same ids. Use one instance per document, in chunk order.
+    """
+
+    def __init__(self, document_id: int) -> None:
+        self.document_id = document_id
+        self._seen: Counter[str] = Counter()
+
+    def next(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+        occurrence = self._seen[digest]
+        self._seen[digest] += 1
+        return f"{self.document_id}:{digest}:{occurrence}"
 
 
 class VectorService:
@@ -35,41 +128,158 @@ class VectorService:
         owner_id: Optional[int],
         chunks: List[str],
         embeddings: Iterable[NumpyArray],
+        start_index: int = 0,
+        commit: bool = True,
+        method: Optional[str] = None,
+        ids: Optional[List[str]] = None,
     ):
-        """Bulk upsert text chunks and embeddings into the database."""
-        records = [
-            {
-                "id": str(uuid4()),
-                "document_id": document_id,
-                "owner_id": owner_id,
-                "chunk_index": i,
-                "text": text,
-                "embedding": emb.tolist(),
-            }
-            for i, (text, emb) in enumerate(zip(chunks, embeddings))
+        """
+        Bulk upsert text chunks and embeddings into the database.
+
+        `start_index` offsets `chunk_index` so a document can be written in
+        several batches; pass `commit=False` to leave the transaction open
+        (then call `refresh_document_embeddings` before committing and
+        `result_cache.invalidate` after).
+        Chunk ids come from `ChunkIds` unless `ids` is given, which callers
+        writing one document over several calls should do with a shared
+        `ChunkIds` so repeated texts stay distinct.
+        """
+        await partition_manager.ensure_owner(session, owner_id)
+        if ids is None:
+            chunk_ids = ChunkIds(document_id)
+            ids = [chunk_ids.next(text) for text in chunks]
+        rows = [
+            (chunk_id, document_id, owner_id, i, text, emb)
+            for i, (chunk_id, text, emb) in enumerate(
+                zip(ids, chunks, embeddings), start_index
+            )
         ]
+        await VectorService.write_chunk_rows(session, rows, method)
+        if commit:
+            await refresh_document_embeddings(session, [document_id])
+            await session.commit()
+            await result_cache.invalidate(document_id, owner_id)
+
+    @staticmethod
+    async def write_chunk_rows(
+        session: AsyncSession, rows: List[tuple], method: Optional[str] = None
+    ):
+        """
+        Upsert `(id, document_id, owner_id, chunk_index, text, embedding)` rows.
+
+        `method` is "insert" (multi-row INSERT ... ON CONFLICT) or "copy"
+        (binary COPY into a staging table, then merge) and defaults to
+        settings.UPSERT_METHOD. Does not commit.
+        """
+        method = method or settings.UPSERT_METHOD
+        if not rows:
+            return
+
+        if method == "copy":
+            await VectorService._copy_chunks(session, rows)
+        elif method == "insert":
+            await VectorService._insert_chunks(session, rows)
+        else:
+            raise ValueError(f"Unknown upsert method: {method}")
 
-        stmt = pg_insert(Chunk.__table__).values(records)
-        stmt = stmt.on_conflict_do_update(
-            index_elements=["id"],
-            set_={
-                "text": stmt.excluded.text,
-                "embedding": stmt.excluded.embedding,
-                "chunk_index": stmt.excluded.chunk_index,
-                "owner_id": stmt.excluded.owner_id,
-            },
+    @staticmethod
+    async def _insert_chunks(session: AsyncSession, rows: List[tuple]):
+        for start in range(0, len(rows), _INSERT_MAX_ROWS):
+            records = [
+                dict(
+                    zip(_CHUNK_COLUMNS, (*row[:-1], row[-1].tolist())),
+                    embedding_model=embbed_model.backend.name,
+                )
+                for row in rows[start : start + _INSERT_MAX_ROWS]
+            ]
+            stmt = pg_insert(Chunk.__table__).values(records)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=_CHUNK_CONFLICT_COLUMNS,
+                set_={col: stmt.excluded[col] for col in _CHUNK_UPDATE_COLUMNS},
+            )
+            await session.execute(stmt)
+
+    @staticmethod
+    async def _copy_chunks(session: AsyncSession, rows: List[tuple]):
+        """Stream rows through binary COPY into a temp table and merge them."""
+        columns = ", ".join(_CHUNK_COLUMNS)
+        conflict = ", ".join(_CHUNK_CONFLICT_COLUMNS)
+        updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in _CHUNK_UPDATE_COLUMNS)
+
+        # Runs through the session first so the staging table lives in its transaction.
+        await session.execute(
+            sql_text(
+                "CREATE TEMP TABLE IF NOT EXISTS chunks_stage "
+                "(LIKE chunks INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+        )
+        conn = await get_asyncpg_connection(session)
+        await conn.copy_records_to_table(
+            "chunks_stage", records=rows, columns=_CHUNK_COLUMNS
+        )
+        await session.execute(
+            sql_text(f"""
+                INSERT INTO chunks ({columns}, embedding_model)
+                SELECT {columns}, :embedding_model FROM chunks_stage
+                ON CONFLICT ({conflict}) DO UPDATE SET {updates}
+            """),
+            {"embedding_model": embbed_model.backend.name},
         )
+        await session.execute(sql_text("TRUNCATE chunks_stage"))
 
-        await session.execute(stmt)
-        await session.commit()
+    @staticmethod
+    async def get_chunk_positions(
+        session: AsyncSession, document_id: int
+    ) -> Dict[str, int]:
+        """Map chunk id -> chunk_index for every stored chunk of a document."""
+        result = await session.execute(
+            sql_text("SELECT id, chunk_index FROM chunks WHERE document_id = :doc_id"),
+            {"doc_id": document_id},
+        )
+        return {r.id: r.chunk_index for r in result}
+
+    @staticmethod
+    async def move_chunks(session: AsyncSession, positions: Dict[str, int]):
+        """Set `chunk_index` for existing chunks without touching their vectors."""
+        if not positions:
+            return
+        await session.execute(
+            sql_text("""
+                UPDATE chunks SET chunk_index = moved.chunk_index
+                FROM unnest(CAST(:ids AS text[]), CAST(:indexes AS int[]))
+                    AS moved(id, chunk_index)
+                WHERE chunks.id = moved.id
+            """),
+            {"ids": list(positions), "indexes": list(positions.values())},
+        )
+
+    @staticmethod
+    async def delete_chunks(session: AsyncSession, chunk_ids: List[str]):
+        """Delete chunks by id. Does not commit."""
+        if not chunk_ids:
+            return
+        await session.execute(
+            sql_text("DELETE FROM chunks WHERE id = ANY(:ids)"), {"ids": chunk_ids}
+        )
 
     @staticmethod
     async def delete_chunks_by_document(session: AsyncSession, document_id: int):
         """Delete all chunks for a given document."""
+        result = await session.execute(
+            Chunk.__table__.delete()
+            .where(Chunk.document_id == document_id)
+            .returning(Chunk.owner_id)
+        )
+        owners = set(result.scalars())
+        await refresh_document_embeddings(session, [document_id])
+        # Its chunks no longer match its upload, so it must not be cloned from.
         await session.execute(
-            Chunk.__table__.delete().where(Chunk.document_id == document_id)
+            sql_text("UPDATE documents SET content_sha256 = NULL WHERE id = :id"),
+            {"id": document_id},
         )
         await session.commit()
+        for owner_id in owners:
+            await result_cache.invalidate(document_id, owner_id)
 
     @staticmethod
     async def query_similar_chunks(
@@ -78,40 +288,414 @@ class VectorService:
         top_k: int = 5,
         owner_id: Optional[int] = None,
         document_ids: Optional[List[int]] = None,
+        strategy: Optional[str] = None,
     ):
-        """Find similar chunks using pgvector's <=> cosine distance operator."""
-        params = {"qvec": str(query_embedding.tolist()), "limit": top_k}
+        """
+        Find similar chunks using pgvector's <=> cosine distance operator.
 
-        where_clauses = []
-        if owner_id is not None:
-            where_clauses.append("owner_id = :owner_id")
-            params["owner_id"] = owner_id
-        if document_ids:
-            where_clauses.append("document_id = ANY(:doc_ids)")
-            params["doc_ids"] = document_ids
+        The search strategy comes from `search_planner` unless `strategy`
+        ("exact", "filtered" or "hnsw") forces one. Results are cached in
+        `result_cache` until one of the searched documents changes.
+        """
+        return await result_cache.get_or_compute(
+            "chunks",
+            VectorService._chunks_cache_key(
+                query_embedding, top_k, owner_id, document_ids, strategy
+            ),
+            query_scopes(owner_id, document_ids),
+            lambda: VectorService._query_similar_chunks(
+                session, query_embedding, top_k, owner_id, document_ids, strategy
+            ),
+        )
 
-        where_sql = " AND ".join(where_clauses) if where_clauses else "TRUE"
+    @staticmethod
+    async def _query_similar_chunks(
+        session: AsyncSession,
+        query_embedding: NumpyArray,
+        top_k: int,
+        owner_id: Optional[int],
+        document_ids: Optional[List[int]],
+        strategy: Optional[str],
+    ):
+        plan = await VectorService._plan(session, owner_id, document_ids, top_k, strategy)
+        params = {
+            "qvec": str(query_embedding.tolist()),
+            "limit": top_k,
+            "ann_candidates": plan.candidates or top_k,
+        }
+        where_sql = filter_sql(params, owner_id, document_ids)
+        sql = sql_text(VectorService._similar_chunks_sql(plan, where_sql))
 
-        sql = sql_text(f"""
+        rows = await VectorService._execute_planned(session, plan, sql, params, "chunks")
+        return [
+            {
+                "id": r.id,
+                "document_id": r.document_id,
+                "text": r.text,
+                "distance": float(r.distance),
+            }
+            for r in rows
+        ]
+
+    @staticmethod
+    async def query_similar_chunks_fast(
+        query_embedding: NumpyArray,
+        top_k: int = 5,
+        owner_id: Optional[int] = None,
+        document_ids: Optional[List[int]] = None,
+        strategy: Optional[str] = None,
+    ):
+        """
+        `query_similar_chunks` over the raw asyncpg `search_pool`: the query
+        vector is bound in binary and each filter shape runs as a cached
+        prepared statement. Shares its cached results.
+        """
+        return await result_cache.get_or_compute(
+            "chunks",
+            VectorService._chunks_cache_key(
+                query_embedding, top_k, owner_id, document_ids, strategy
+            ),
+            query_scopes(owner_id, document_ids),
+            lambda: VectorService._query_similar_chunks_fast(
+                query_embedding, top_k, owner_id, document_ids, strategy
+            ),
+        )
+
+    @staticmethod
+    async def _query_similar_chunks_fast(
+        query_embedding: NumpyArray,
+        top_k: int,
+        owner_id: Optional[int],
+        document_ids: Optional[List[int]],
+        strategy: Optional[str],
+    ):
+        async with search_pool.acquire() as conn:
+            plan = await VectorService._plan(conn, owner_id, document_ids, top_k, strategy)
+            params = {
+                "qvec": query_embedding,
+                "limit": top_k,
+                "ann_candidates": plan.candidates or top_k,
+            }
+            where_sql = filter_sql(params, owner_id, document_ids)
+            query, args = to_positional(
+                VectorService._similar_chunks_sql(plan, where_sql), params
+            )
+
+            with metrics.ANN_QUERY_SECONDS.labels("chunks_fast", plan.strategy).time():
+                gucs = VectorService._gucs(plan)
+                if not gucs:
+                    rows = await conn.fetch(query, *args)
+                else:
+                    # BEGIN and the SET LOCALs go in one round trip; the
+                    # settings end with the transaction. Values come from the
+                    # plan and settings, never from the request.
+                    set_local = " ".join(
+                        f"SET LOCAL {name} = '{value}';" for name, value in gucs.items()
+                    )
+                    await conn.execute(f"BEGIN; {set_local}")
+                    try:
+                        rows = await conn.fetch(query, *args)
+                    except BaseException:
+                        await conn.execute("ROLLBACK")
+                        raise
+                    await conn.execute("COMMIT")
+
+        return [
+            {
+                "id": r["id"],
+                "document_id": r["document_id"],
+                "text": r["text"],
+                "distance": float(r["distance"]),
+            }
+            for r in rows
+        ]
+
+    @staticmethod
+    def _chunks_cache_key(
+        query_embedding: NumpyArray,
+        top_k: int,
+        owner_id: Optional[int],
+        document_ids: Optional[List[int]],
+        strategy: Optional[str],
+    ) -> tuple:
+        return (
+            vector_key(query_embedding),
+            top_k,
+            owner_id,
+            tuple(sorted(set(document_ids or ()))),
+            strategy,
+        )
+
+    @staticmethod
+    def _similar_chunks_sql(plan: SearchPlan, where_sql: str) -> str:
+        return f"""
             SELECT
                 id,
                 document_id,
                 text,
                 embedding <=> (:qvec)::vector AS distance
-            FROM chunks
-            WHERE {where_sql}
-            ORDER BY embedding <=> (:qvec)::vector
+            FROM (
+                SELECT id, document_id, text, embedding
+                FROM chunks
+                WHERE {where_sql}
+                ORDER BY {VectorService._order_by(plan)}
+                LIMIT :ann_candidates
+            ) hits
+            ORDER BY distance
             LIMIT :limit
-        """)
+        """
+
+    @staticmethod
+    async def _plan(
+        db: Database,
+        owner_id: Optional[int],
+        document_ids: Optional[List[int]],
+        limit: int,
+        strategy: Optional[str],
+    ) -> SearchPlan:
+        if strategy is None:
+            plan = await search_planner.plan(db, owner_id, document_ids, limit)
+        elif strategy == FILTERED:
+            plan = SearchPlan(FILTERED, ef_search=settings.HNSW_MAX_EF_SEARCH)
+        else:
+            plan = SearchPlan(strategy)
+        return search_planner.with_rerank(plan, limit)
 
+    @staticmethod
+    def _order_by(
+        plan: SearchPlan,
+        column: str = "embedding",
+        query: str = "(:qvec)::vector",
+    ) -> str:
+        """ORDER BY expression selecting the (candidate) nearest rows."""
+        if plan.strategy == EXACT:
+            # Not an indexable ORDER BY, so the planner filters through the
+            # btree indexes and sorts instead of walking the HNSW graph.
+            return f"({column} <=> {query}) + 0"
+        if plan.candidates:
+            return candidate_distance(settings.VECTOR_INDEX_MODE, column, query)
+        return f"{column} <=> {query}"
+
+    @staticmethod
+    async def _execute_planned(
+        session: AsyncSession, plan: SearchPlan, sql, params: dict, query: str
+    ) -> list:
+        """
+        Run `sql`, raising hnsw.ef_search (and iterative scans) as planned;
+        its latency is recorded under the `query` label.
+        """
+        with metrics.ANN_QUERY_SECONDS.labels(query, plan.strategy).time():
+            return await VectorService._execute_with_gucs(session, plan, sql, params)
+
+    @staticmethod
+    async def _execute_with_gucs(
+        session: AsyncSession, plan: SearchPlan, sql, params: dict
+    ) -> list:
+        gucs = VectorService._gucs(plan)
+        if not gucs:
+            result = await session.execute(sql, params)
+            return result.fetchall()
+
+        names = list(gucs)
+        set_sql = ", ".join(
+            f"set_config('{name}', :g{i}, true)" for i, name in enumerate(names)
+        )
+        previous = (
+            await session.execute(
+                sql_text(
+                    "SELECT "
+                    + ", ".join(
+                        f"current_setting('{name}', true) AS g{i}"
+                        for i, name in enumerate(names)
+                    )
+                    + f", {set_sql}"
+                ),
+                {f"g{i}": gucs[name] for i, name in enumerate(names)},
+            )
+        ).one()
         result = await session.execute(sql, params)
         rows = result.fetchall()
+
+        # The session's transaction outlives this query, so put the settings
+        # back. On failure the rollback discards the SET LOCALs anyway.
+        defaults = {"hnsw.ef_search": str(settings.HNSW_EF_SEARCH), "hnsw.iterative_scan": "off"}
+        await session.execute(
+            sql_text(f"SELECT {set_sql}"),
+            {f"g{i}": previous[i] or defaults[name] for i, name in enumerate(names)},
+        )
+        return rows
+
+    @staticmethod
+    def _gucs(plan: SearchPlan) -> Dict[str, str]:
+        """Transaction-local settings the plan needs (hnsw.ef_search, iterative scans)."""
+        if plan.ef_search is None:
+            return {}
+        gucs = {"hnsw.ef_search": str(plan.ef_search)}
+        if plan.strategy == FILTERED and settings.HNSW_ITERATIVE_SCAN:
+            gucs["hnsw.iterative_scan"] = settings.HNSW_ITERATIVE_SCAN
+        return gucs
+
+    @staticmethod
+    async def query_similar_chunks_batch(
+        session: AsyncSession,
+        query_embeddings: List[NumpyArray],
+        top_k: int = 5,
+        owner_id: Optional[int] = None,
+        document_ids: Optional[List[int]] = None,
+    ):
+        """
+        Run `query_similar_chunks` for several query vectors in one statement
+        (a LATERAL ANN subquery per unnested vector); returns one result list
+        per query, in order.
+        """
+        if not query_embeddings:
+            return []
+        plan = await VectorService._plan(session, owner_id, document_ids, top_k, None)
+        params = {
+            "qvecs": [str(q.tolist()) for q in query_embeddings],
+            "limit": top_k,
+            "ann_candidates": plan.candidates or top_k,
+        }
+        where_sql = filter_sql(params, owner_id, document_ids)
+
+        sql = sql_text(f"""
+            SELECT
+                q.ord AS query_index,
+                hit.id,
+                hit.document_id,
+                hit.text,
+                hit.distance
+            FROM (
+                SELECT ord, qvec::vector AS qvec
+                FROM unnest(CAST(:qvecs AS text[])) WITH ORDINALITY AS u(qvec, ord)
+            ) q
+            CROSS JOIN LATERAL (
+                SELECT
+                    id,
+                    document_id,
+                    text,
+                    embedding <=> q.qvec AS distance
+                FROM (
+                    SELECT id, document_id, text, embedding
+                    FROM chunks
+                    WHERE {where_sql}
+                    ORDER BY {VectorService._order_by(plan, query="q.qvec")}
+                    LIMIT :ann_candidates
+                ) c
+                ORDER BY distance
+                LIMIT :limit
+            ) hit
+            ORDER BY q.ord, hit.distance
+        """)
+
+        rows = await VectorService._execute_planned(session, plan, sql, params, "chunks_batch")
+        output: List[List[dict]] = [[] for _ in query_embeddings]
+        for r in rows:
+            output[r.query_index - 1].append(
+                {
+                    "id": r.id,
+                    "document_id": r.document_id,
+                    "text": r.text,
+                    "distance": float(r.distance),
+                }
+            )
+        return output
+
+    @staticmethod
+    async def query_hybrid_chunks(
+        session: AsyncSession,
+        query_embedding: NumpyArray,
+        query_text: str,
+        top_k: int = 5,
+        owner_id: Optional[int] = None,
+        document_ids: Optional[List[int]] = None,
+        candidates: int = settings.HYBRID_CANDIDATES,
+        rrf_k: int = settings.HYBRID_RRF_K,
+        text_matches: int = settings.HYBRID_TEXT_MATCHES,
+    ):
+        """
+        Hybrid full-text + vector search fused with reciprocal rank fusion.
+
+        The HNSW and GIN candidate lists (`candidates` each) are retrieved and
+        fused in a single statement; a chunk's score is the sum of
+        1 / (rrf_k + rank) over the lists it appears in.
+
+        ts_rank_cd reads every matched row's tsvector, so at most
+        `text_matches` GIN matches are ranked. A query term common to more
+        chunks than that is ranked over an arbitrary subset of its matches.
+        """
+        plan = await VectorService._plan(session, owner_id, document_ids, candidates, None)
+        params = {
+            "qvec": str(query_embedding.tolist()),
+            "qtext": query_text,
+            "candidates": candidates,
+            "ann_candidates": plan.candidates or candidates,
+            "rrf_k": rrf_k,
+            "text_matches": text_matches,
+            "limit": top_k,
+        }
+        where_sql = filter_sql(params, owner_id, document_ids)
+
+        sql = sql_text(f"""
+            WITH vector_hits AS (
+                SELECT id, row_number() OVER (ORDER BY distance) AS rank
+                FROM (
+                    SELECT id, embedding <=> (:qvec)::vector AS distance
+                    FROM (
+                        SELECT id, embedding
+                        FROM chunks
+                        WHERE {where_sql}
+                        ORDER BY {VectorService._order_by(plan)}
+                        LIMIT :ann_candidates
+                    ) c
+                    ORDER BY distance
+                    LIMIT :candidates
+                ) v
+            ),
+            text_matches AS (
+                SELECT id, text_tsv
+                FROM chunks
+                WHERE {where_sql}
+                    AND text_tsv @@ websearch_to_tsquery('english', :qtext)
+                LIMIT :text_matches
+            ),
+            text_hits AS (
+                SELECT id, row_number() OVER (ORDER BY text_rank DESC) AS rank
+                FROM (
+                    SELECT id, ts_rank_cd(text_tsv, query) AS text_rank
+                    FROM text_matches, websearch_to_tsquery('english', :qtext) AS query
+                    ORDER BY text_rank DESC
+                    LIMIT :candidates
+                ) t
+            ),
+            fused AS (
+                SELECT
+                    coalesce(v.id, t.id) AS id,
+                    coalesce(1.0 / (:rrf_k + v.rank), 0)
+                        + coalesce(1.0 / (:rrf_k + t.rank), 0) AS score
+                FROM vector_hits v
+                FULL OUTER JOIN text_hits t ON t.id = v.id
+            )
+            SELECT
+                c.id,
+                c.document_id,
+                c.text,
+                c.embedding <=> (:qvec)::vector AS distance,
+                f.score
+            FROM fused f
+            JOIN chunks c ON c.id = f.id
+            ORDER BY f.score DESC
+            LIMIT :limit
+        """)
+
+        rows = await VectorService._execute_planned(session, plan, sql, params, "hybrid")
         return [
             {
                 "id": r.id,
                 "document_id": r.document_id,
                 "text": r.text,
                 "distance": float(r.distance),
+                "score": float(r.score),
             }
             for r in rows
         ]
@@ -124,33 +708,83 @@ class VectorService:
         candidate_document_ids: Optional[List[int]] = None,
         top_k_docs: int = 5,
         chunks_to_consider: int = 200,
+        strategy: Optional[str] = None,
+    ):
+        """
+        Aggregate chunk similarity to rank documents, among the ones nearest by
+        centroid when DOC_ROUTING is on (cached like `query_similar_chunks`).
+        """
+        return await result_cache.get_or_compute(
+            "documents",
+            (
+                vector_key(query_embedding),
+                top_k_docs,
+                chunks_to_consider,
+                owner_id,
+                tuple(sorted(set(candidate_document_ids or ()))),
+                strategy,
+            ),
+            query_scopes(owner_id, candidate_document_ids),
+            lambda: VectorService._query_similar_documents(
+                session,
+                query_embedding,
+                owner_id,
+                candidate_document_ids,
+                top_k_docs,
+                chunks_to_consider,
+                strategy,
+            ),
+        )
+
+    @staticmethod
+    async def _query_similar_documents(
+        session: AsyncSession,
+        query_embedding: NumpyArray,
+        owner_id: Optional[int],
+        candidate_document_ids: Optional[List[int]],
+        top_k_docs: int,
+        chunks_to_consider: int,
+        strategy: Optional[str],
     ):
-        """Aggregate chunk similarity to rank documents."""
+        route_docs = max(settings.DOC_ROUTE_DOCUMENTS, top_k_docs)
+        if (
+            settings.DOC_ROUTING
+            and strategy != EXACT
+            and (not candidate_document_ids or len(candidate_document_ids) > route_docs)
+        ):
+            # Coarse pass: only chunks of the documents nearest by centroid
+            # are compared, so the chunk query below is a small exact scan.
+            candidate_document_ids = await VectorService._route_documents(
+                session, query_embedding, owner_id, candidate_document_ids, route_docs
+            )
+            if not candidate_document_ids:
+                return []
+
+        plan = await VectorService._plan(
+            session, owner_id, candidate_document_ids, chunks_to_consider, strategy
+        )
         params = {
             "qvec": query_embedding.tolist(),
             "limit_chunks": chunks_to_consider,
+            "ann_candidates": plan.candidates or chunks_to_consider,
             "top_k_docs": top_k_docs,
         }
-        where = []
-
-        if owner_id is not None:
-            where.append("c.owner_id = :owner_id")
-            params["owner_id"] = owner_id
-        if candidate_document_ids:
-            where.append("c.document_id = ANY(:candidate_document_ids)")
-            params["candidate_document_ids"] = candidate_document_ids
-
-        where_sql = " AND ".join(where) if where else "TRUE"
+        where_sql = filter_sql(params, owner_id, candidate_document_ids, alias="c")
 
         sql = sql_text(f"""
-            WITH top_chunks AS (
-                SELECT
-                    c.id,
-                    c.document_id,
-                    c.embedding <=> (:qvec)::vector AS distance
+            WITH candidates AS (
+                SELECT c.document_id, c.embedding
                 FROM chunks c
                 WHERE {where_sql}
-                ORDER BY c.embedding <=> (:qvec)::vector
+                ORDER BY {VectorService._order_by(plan, column="c.embedding")}
+                LIMIT :ann_candidates
+            ),
+            top_chunks AS (
+                SELECT
+                    document_id,
+                    embedding <=> (:qvec)::vector AS distance
+                FROM candidates
+                ORDER BY distance
                 LIMIT :limit_chunks
             )
             SELECT
@@ -163,8 +797,7 @@ class VectorService:
             LIMIT :top_k_docs;
         """)
 
-        result = await session.execute(sql, params)
-        rows = result.fetchall()
+        rows = await VectorService._execute_planned(session, plan, sql, params, "documents")
         return [
             {
                 "document_id": r.document_id,
@@ -173,3 +806,43 @@ class VectorService:
             }
             for r in rows
         ]
+
+    @staticmethod
+    async def _route_documents(
+        session: AsyncSession,
+        query_embedding: NumpyArray,
+        owner_id: Optional[int],
+        candidate_document_ids: Optional[List[int]],
+        route_docs: int,
+    ) -> List[int]:
+        """The `route_docs` documents with a centroid nearest to the query."""
+        # A document can match through its own and its section centroids.
+        route_rows = route_docs * (1 + settings.DOC_SECTION_CENTROIDS)
+        params = {
+            "qvec": query_embedding.tolist(),
+            "route_rows": route_rows,
+            "route_docs": route_docs,
+        }
+        where_sql = filter_sql(params, owner_id, candidate_document_ids)
+        if where_sql == "TRUE":
+            plan = SearchPlan(HNSW, ef_search=max(settings.HNSW_EF_SEARCH, route_rows))
+        else:
+            plan = SearchPlan(FILTERED, ef_search=settings.HNSW_MAX_EF_SEARCH)
+
+        sql = sql_text(f"""
+            SELECT document_id
+            FROM (
+                SELECT document_id, embedding <=> (:qvec)::vector AS distance
+                FROM document_embeddings
+                WHERE {where_sql}
+                ORDER BY embedding <=> (:qvec)::vector
+                LIMIT :route_rows
+            ) nearest
+            GROUP BY document_id
+            ORDER BY min(distance)
+            LIMIT :route_docs
+        """)
+        rows = await VectorService._execute_planned(
+            session, plan, sql, params, "documents_route"
+        )
+        return [r.document_id for r in rows]
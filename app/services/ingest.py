@@ -0,0 +1,365 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.document_index import refresh_document_embeddings
+from app.core.embedding import NumpyArray, embbed_model
+from app.core.partitioning import partition_manager
+from app.core.result_cache import result_cache
+from app.core.uploads import UploadSource
+from app.services.chunk_service import TokenChunker
+from app.services.document_parser import PARSER_VERSION, DocumentParserService
+from app.services.embeddings import ChunkIds, EmbeddingService, VectorService
+
+# Marks the end of a stage's output.
+_DONE = None
+
+# (chunk_index, chunk_id, text)
+PendingChunk = Tuple[int, str, str]
+EmbeddedBatch = Tuple[List[PendingChunk], List[NumpyArray]]
+
+
+def ingest_version() -> str:
+    """What a document's chunks depend on besides the upload's bytes and the embedding backend."""
+    return f"{PARSER_VERSION}:{settings.CHUNK_MAX_TOKENS}:{settings.CHUNK_OVERLAP_TOKENS}"
+
+
+@dataclass
+class IngestStats:
+    chunks: int = 0
+    embedded: int = 0
+    moved: int = 0
+    deleted: int = 0
+    # Set when the chunks were copied from an identical upload instead.
+    cloned_from: Optional[int] = None
+    # Seconds spent per stage: parse, chunk, embed, upsert (or clone).
+    seconds: Dict[str, float] = field(default_factory=dict)
+
+    def add_time(self, stage: str, seconds: float):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+
+class IngestPipeline:
+    """
+    Streams a document through parse -> chunk -> embed -> upsert.
+
+    Stages run concurrently and hand work over through bounded queues, so
+    only a few batches of chunks and vectors are alive at any time and
+    embedding the next batch overlaps with writing the previous one. The
+    whole document is written in one transaction that commits at the end.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = settings.INGEST_BATCH_SIZE,
+        queue_size: int = settings.INGEST_QUEUE_SIZE,
+    ) -> None:
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+    async def run(
+        self,
+        session: AsyncSession,
+        document_id: int,
+        owner_id: Optional[int],
+        segments: AsyncIterator[str],
+        reindex: bool = False,
+        stats: Optional[IngestStats] = None,
+        content_sha256: Optional[str] = None,
+    ) -> IngestStats:
+        """
+        Ingest the text `segments` of a document, recording `content_sha256`
+        (of the upload they were parsed from, if known) for `ingest_source`
+        when they produced any chunks.
+
+        With `reindex=True` the new chunks are diffed against the stored ones
+        by their content-addressed ids: only new chunks are embedded,
+        unchanged ones at a new position just get their `chunk_index`
+        updated and chunks that disappeared are deleted. Pass `stats` to
+        watch progress (e.g. `stats.chunks`) while it runs.
+        """
+        started = time.perf_counter()
+        await partition_manager.ensure_owner(session, owner_id)
+        stats = stats if stats is not None else IngestStats()
+        segments = metrics.timed_aiter(
+            segments, lambda seconds: stats.add_time("parse", seconds)
+        )
+        existing = (
+            await VectorService.get_chunk_positions(session, document_id)
+            if reindex
+            else {}
+        )
+        seen: Set[str] = set()
+        moved: Dict[str, int] = {}
+
+        chunk_queue: asyncio.Queue[Optional[PendingChunk]] = asyncio.Queue(
+            self.queue_size * self.batch_size
+        )
+        batch_queue: asyncio.Queue[Optional[EmbeddedBatch]] = asyncio.Queue(
+            self.queue_size
+        )
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(self._chunk(document_id, segments, chunk_queue, stats))
+                tg.create_task(
+                    self._embed(chunk_queue, batch_queue, existing, seen, moved, stats)
+                )
+                tg.create_task(
+                    self._upsert(session, document_id, owner_id, batch_queue, stats)
+                )
+
+            if reindex:
+                vanished = [chunk_id for chunk_id in existing if chunk_id not in seen]
+                await VectorService.move_chunks(session, moved)
+                await VectorService.delete_chunks(session, vanished)
+                stats.moved, stats.deleted = len(moved), len(vanished)
+
+            changed = bool(stats.embedded or stats.moved or stats.deleted)
+            if changed:
+                await refresh_document_embeddings(session, [document_id])
+            # An empty parse (e.g. OCR that failed quietly) must not be cloned.
+            await self._record_upload(
+                session, document_id, content_sha256 if stats.chunks else None
+            )
+            await session.commit()
+        except BaseExceptionGroup as eg:
+            await session.rollback()
+            # Surface the first failure as-is so callers can handle it.
+            raise eg.exceptions[0]
+        except BaseException:
+            await session.rollback()
+            raise
+
+        if changed:
+            await result_cache.invalidate(document_id, owner_id)
+
+        stats.add_time("total", time.perf_counter() - started)
+        for stage, seconds in stats.seconds.items():
+            metrics.INGEST_STAGE_SECONDS.labels(stage).observe(seconds)
+        metrics.INGEST_CHUNKS.observe(stats.chunks)
+        return stats
+
+    async def ingest_source(
+        self,
+        session: AsyncSession,
+        document_id: int,
+        owner_id: Optional[int],
+        source: UploadSource,
+        segments: Optional[AsyncIterator[str]] = None,
+        reindex: bool = False,
+        stats: Optional[IngestStats] = None,
+    ) -> IngestStats:
+        """
+        Ingest an upload. If a document of the same owner was already
+        ingested from the same bytes (and `ingest_version`, and embedding
+        backend), its chunks and vectors are copied server-side instead of
+        parsing and embedding again. Otherwise `segments` (by default
+        `iter_source_text(source)`) go through `run`.
+
+        Only the owner's own documents are candidates, so how fast an
+        upload is ingested reveals nothing about other tenants' files.
+        """
+        stats = stats if stats is not None else IngestStats()
+        if settings.INGEST_DEDUP and source.sha256 is not None:
+            started = time.perf_counter()
+            if await self._clone(session, document_id, owner_id, source.sha256, stats):
+                metrics.INGEST_DEDUPLICATED.inc()
+                stats.add_time("clone", time.perf_counter() - started)
+                stats.add_time("total", time.perf_counter() - started)
+                return stats
+
+        if segments is None:
+            segments = DocumentParserService.iter_source_text(source)
+        return await self.run(
+            session,
+            document_id=document_id,
+            owner_id=owner_id,
+            segments=segments,
+            reindex=reindex,
+            stats=stats,
+            content_sha256=source.sha256,
+        )
+
+    async def _clone(
+        self,
+        session: AsyncSession,
+        document_id: int,
+        owner_id: Optional[int],
+        sha256: str,
+        stats: IngestStats,
+    ) -> bool:
+        """Copy the chunks of a document ingested from the same bytes, if any."""
+        result = await session.execute(
+            sql_text("""
+                SELECT d.id, (SELECT count(*) FROM chunks c WHERE c.document_id = d.id) AS chunks
+                FROM documents d
+                WHERE d.content_sha256 = :sha256 AND d.parser_version = :version
+                  AND EXISTS (SELECT 1 FROM chunks c WHERE c.document_id = d.id)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM chunks c
+                      WHERE c.document_id = d.id
+                        AND (c.embedding_model IS DISTINCT FROM :model
+                             OR c.owner_id IS DISTINCT FROM :owner_id)
+                  )
+                ORDER BY d.id = :document_id DESC, d.id DESC
+                LIMIT 1
+            """),
+            {
+                "sha256": sha256,
+                "version": ingest_version(),
+                "model": embbed_model.backend.name,
+                "owner_id": owner_id,
+                "document_id": document_id,
+            },
+        )
+        row = result.one_or_none()
+        if row is None:
+            return False
+        stats.chunks, stats.cloned_from = row.chunks, row.id
+        if row.id == document_id:
+            # Re-indexed from the upload it already holds.
+            return True
+
+        await partition_manager.ensure_owner(session, owner_id)
+        params = {
+            "document_id": document_id,
+            "owner_id": owner_id,
+            "source_id": row.id,
+            "prefix": str(document_id),
+        }
+        try:
+            await session.execute(
+                sql_text("DELETE FROM chunks WHERE document_id = :document_id"), params
+            )
+            # Chunk ids are `<document_id>:<digest>:<n>`; only the prefix changes.
+            await session.execute(
+                sql_text("""
+                    INSERT INTO chunks
+                        (id, document_id, owner_id, chunk_index, text, embedding, embedding_model)
+                    SELECT
+                        :prefix || substr(id, strpos(id, ':')),
+                        :document_id, :owner_id, chunk_index, text, embedding, embedding_model
+                    FROM chunks
+                    WHERE document_id = :source_id
+                """),
+                params,
+            )
+            await session.execute(
+                sql_text("DELETE FROM document_embeddings WHERE document_id = :document_id"),
+                params,
+            )
+            await session.execute(
+                sql_text("""
+                    INSERT INTO document_embeddings
+                        (document_id, section, owner_id, chunk_count, embedding)
+                    SELECT :document_id, section, :owner_id, chunk_count, embedding
+                    FROM document_embeddings
+                    WHERE document_id = :source_id
+                """),
+                params,
+            )
+            await self._record_upload(session, document_id, sha256)
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            raise
+        await result_cache.invalidate(document_id, owner_id)
+        return True
+
+    @staticmethod
+    async def _record_upload(
+        session: AsyncSession, document_id: int, content_sha256: Optional[str]
+    ):
+        await session.execute(
+            sql_text("""
+                UPDATE documents SET content_sha256 = :sha256, parser_version = :version
+                WHERE id = :document_id
+            """),
+            {"document_id": document_id, "sha256": content_sha256, "version": ingest_version()},
+        )
+
+    async def _chunk(
+        self,
+        document_id: int,
+        segments: AsyncIterator[str],
+        out: asyncio.Queue[Optional[PendingChunk]],
+        stats: IngestStats,
+    ):
+        ids = ChunkIds(document_id)
+        # Tokenizing is CPU-bound (and the first use may load the model), so
+        # the chunker runs in a worker thread, leaving the event loop free.
+        chunker = await asyncio.to_thread(TokenChunker)
+        index = 0
+        async for segment in segments:
+            start = time.perf_counter()
+            chunks = await asyncio.to_thread(list, chunker.feed(segment))
+            stats.add_time("chunk", time.perf_counter() - start)
+            for chunk in chunks:
+                await out.put((index, ids.next(chunk), chunk))
+                index += 1
+        start = time.perf_counter()
+        chunks = await asyncio.to_thread(list, chunker.flush())
+        stats.add_time("chunk", time.perf_counter() - start)
+        for chunk in chunks:
+            await out.put((index, ids.next(chunk), chunk))
+            index += 1
+        await out.put(_DONE)
+
+    async def _embed(
+        self,
+        source: asyncio.Queue[Optional[PendingChunk]],
+        out: asyncio.Queue[Optional[EmbeddedBatch]],
+        existing: Dict[str, int],
+        seen: Set[str],
+        moved: Dict[str, int],
+        stats: IngestStats,
+    ):
+        batch: List[PendingChunk] = []
+        while True:
+            item = await source.get()
+            if item is not _DONE:
+                index, chunk_id, _ = item
+                stats.chunks += 1
+                if chunk_id in existing:
+                    seen.add(chunk_id)
+                    if existing[chunk_id] != index:
+                        moved[chunk_id] = index
+                else:
+                    batch.append(item)
+            if batch and (item is _DONE or len(batch) >= self.batch_size):
+                start = time.perf_counter()
+                embeddings = await EmbeddingService.embbed_doc(
+                    [text for _, _, text in batch]
+                )
+                stats.add_time("embed", time.perf_counter() - start)
+                await out.put((batch, embeddings))
+                batch = []
+            if item is _DONE:
+                break
+        await out.put(_DONE)
+
+    async def _upsert(
+        self,
+        session: AsyncSession,
+        document_id: int,
+        owner_id: Optional[int],
+        source: asyncio.Queue[Optional[EmbeddedBatch]],
+        stats: IngestStats,
+    ):
+        while (item := await source.get()) is not _DONE:
+            batch, embeddings = item
+            rows = [
+                (chunk_id, document_id, owner_id, index, text, emb)
+                for (index, chunk_id, text), emb in zip(batch, embeddings)
+            ]
+            start = time.perf_counter()
+            await VectorService.write_chunk_rows(session, rows)
+            stats.add_time("upsert", time.perf_counter() - start)
+            stats.embedded += len(rows)
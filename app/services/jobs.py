@@ -0,0 +1,301 @@
+"""
+Durable ingest queue stored in Postgres (`ingest_jobs`).
+
+The API enqueues uploads with `JobService.enqueue`; any number of
+`python -m app.worker` processes claim them with FOR UPDATE SKIP LOCKED,
+so each job runs on one worker at a time without a separate broker.
+Failed jobs are retried with exponential backoff, and jobs whose worker
+stopped sending heartbeats are put back in the queue.
+
+Uploads wait in JOB_PAYLOAD_DIR, which the API and every worker must
+share (e.g. a network volume); the jobs table only holds their file name
+and SHA-256, so large uploads stay out of the table and its WAL.
+"""
+
+import asyncio
+import json
+import mimetypes
+import os
+import random
+import shutil
+import uuid
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.uploads import UploadSource
+from app.models import Document, IngestJob
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+@dataclass
+class ClaimedJob:
+    id: int
+    document_id: int
+    owner_id: Optional[int]
+    reindex: bool
+    attempts: int
+    max_attempts: int
+    source: UploadSource
+
+
+def _payload_path(name: str) -> str:
+    return os.path.join(settings.JOB_PAYLOAD_DIR, name)
+
+
+def _store_payload(source: UploadSource) -> str:
+    """Copy the upload into JOB_PAYLOAD_DIR; returns the file's name there."""
+    os.makedirs(settings.JOB_PAYLOAD_DIR, exist_ok=True)
+    name = uuid.uuid4().hex + (mimetypes.guess_extension(source.content_type) or "")
+    if source.data is not None:
+        with open(_payload_path(name), "wb") as f:
+            f.write(source.data)
+    else:
+        shutil.copyfile(source.path, _payload_path(name))  # type: ignore[arg-type]
+    return name
+
+
+def _remove_payloads(names: Iterable[Optional[str]]):
+    for name in names:
+        if name is not None:
+            try:
+                os.remove(_payload_path(name))
+            except FileNotFoundError:
+                pass
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait before attempt `attempts + 1`: exponential, capped, jittered."""
+    delay = settings.JOB_RETRY_BACKOFF_S * 2 ** max(attempts - 1, 0)
+    return min(delay, settings.JOB_RETRY_MAX_BACKOFF_S) * random.uniform(0.8, 1.2)
+
+
+class JobService:
+    @staticmethod
+    async def enqueue(
+        db: AsyncSession,
+        source: UploadSource,
+        owner_id: Optional[int],
+        document_id: Optional[int] = None,
+        title: Optional[str] = None,
+    ) -> IngestJob:
+        """
+        Queue `source` for ingestion into `document_id`, re-indexing it, or
+        into a new document titled `title` when `document_id` is None.
+        """
+        reindex = document_id is not None
+        if document_id is None:
+            document = Document(title=title or source.filename or "None")
+            db.add(document)
+            await db.flush()
+            document_id = document.id
+
+        payload_file = await asyncio.to_thread(_store_payload, source)
+        job = IngestJob(
+            document_id=document_id,
+            owner_id=owner_id,
+            reindex=reindex,
+            filename=source.filename,
+            content_type=source.content_type,
+            payload_file=payload_file,
+            payload_size=source.size,
+            payload_sha256=source.sha256,
+            status=QUEUED,
+            max_attempts=settings.JOB_MAX_ATTEMPTS,
+        )
+        db.add(job)
+        try:
+            await db.commit()
+        except BaseException:
+            _remove_payloads([payload_file])
+            raise
+        return job
+
+    @staticmethod
+    async def get(db: AsyncSession, job_id: int) -> dict:
+        """Status and progress of a job."""
+        result = await db.execute(
+            sql_text("""
+                SELECT id, document_id, status, attempts, max_attempts, chunks_done,
+                       stats, error, created_at, started_at, finished_at, run_after
+                FROM ingest_jobs WHERE id = :id
+            """),
+            {"id": job_id},
+        )
+        row = result.mappings().one_or_none()
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Job with ID {job_id} not found.",
+            )
+        return dict(row)
+
+    @staticmethod
+    async def claim(db: AsyncSession, worker_id: str) -> Optional[ClaimedJob]:
+        """
+        Take the oldest runnable job, or return None if there is none.
+
+        Jobs of one document run one at a time and in order, so a re-index
+        never races the ingest it follows.
+        """
+        result = await db.execute(
+            sql_text("""
+                UPDATE ingest_jobs SET
+                    status = 'running',
+                    attempts = attempts + 1,
+                    locked_by = :worker,
+                    heartbeat_at = now(),
+                    started_at = now(),
+                    chunks_done = 0
+                WHERE id = (
+                    SELECT id FROM ingest_jobs j
+                    WHERE status = 'queued' AND run_after <= now()
+                      AND NOT EXISTS (
+                          SELECT 1 FROM ingest_jobs o
+                          WHERE o.document_id = j.document_id
+                            AND (o.status = 'running' OR (o.status = 'queued' AND o.id < j.id))
+                      )
+                    ORDER BY run_after, id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, document_id, owner_id, reindex, attempts, max_attempts,
+                          filename, content_type, payload_file, payload_size, payload_sha256
+            """),
+            {"worker": worker_id},
+        )
+        row = result.one_or_none()
+        await db.commit()
+        if row is None:
+            return None
+        return ClaimedJob(
+            id=row.id,
+            document_id=row.document_id,
+            owner_id=row.owner_id,
+            reindex=row.reindex,
+            attempts=row.attempts,
+            max_attempts=row.max_attempts,
+            source=UploadSource(
+                row.filename,
+                row.content_type,
+                row.payload_size,
+                path=_payload_path(row.payload_file),
+                sha256=row.payload_sha256,
+            ),
+        )
+
+    @staticmethod
+    async def heartbeat(
+        db: AsyncSession, job_id: int, worker_id: str, chunks_done: int
+    ) -> bool:
+        """Record progress; False if the job is no longer held by `worker_id`."""
+        result = await db.execute(
+            sql_text("""
+                UPDATE ingest_jobs SET heartbeat_at = now(), chunks_done = :chunks
+                WHERE id = :id AND locked_by = :worker AND status = 'running'
+            """),
+            {"id": job_id, "worker": worker_id, "chunks": chunks_done},
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+    @staticmethod
+    async def succeed(db: AsyncSession, job_id: int, worker_id: str, stats: dict):
+        result = await db.execute(
+            sql_text("""
+                UPDATE ingest_jobs j SET
+                    status = 'succeeded', stats = CAST(:stats AS jsonb),
+                    chunks_done = :chunks, payload_file = NULL, error = NULL,
+                    locked_by = NULL, finished_at = now()
+                FROM (SELECT id, payload_file FROM ingest_jobs WHERE id = :id FOR UPDATE) old
+                WHERE j.id = old.id AND j.locked_by = :worker
+                RETURNING old.payload_file
+            """),
+            {
+                "id": job_id,
+                "worker": worker_id,
+                "stats": json.dumps(stats),
+                "chunks": stats.get("chunks", 0),
+            },
+        )
+        await db.commit()
+        _remove_payloads(result.scalars())
+
+    @staticmethod
+    async def fail(
+        db: AsyncSession, job: ClaimedJob, worker_id: str, error: str, retry: bool = True
+    ) -> str:
+        """
+        Record a failed attempt: back to the queue after `retry_delay` while
+        attempts remain (and `retry`), otherwise failed for good. Returns the
+        new status.
+        """
+        new_status = QUEUED if retry and job.attempts < job.max_attempts else FAILED
+        result = await db.execute(
+            sql_text("""
+                UPDATE ingest_jobs j SET
+                    status = :status,
+                    error = :error,
+                    run_after = now() + make_interval(secs => :delay),
+                    locked_by = NULL,
+                    finished_at = CASE WHEN :finished THEN now() END,
+                    payload_file = CASE WHEN :finished THEN NULL ELSE j.payload_file END
+                FROM (SELECT id, payload_file FROM ingest_jobs WHERE id = :id FOR UPDATE) old
+                WHERE j.id = old.id AND j.locked_by = :worker
+                RETURNING old.payload_file
+            """),
+            {
+                "id": job.id,
+                "worker": worker_id,
+                "status": new_status,
+                "finished": new_status == FAILED,
+                "error": error[:4000],
+                "delay": retry_delay(job.attempts),
+            },
+        )
+        await db.commit()
+        if new_status == FAILED:
+            _remove_payloads(result.scalars())
+        return new_status
+
+    @staticmethod
+    async def requeue_stale(db: AsyncSession, stale_after_s: float) -> int:
+        """
+        Put back jobs whose worker has not sent a heartbeat for
+        `stale_after_s` (it crashed or lost its connection). Jobs out of
+        attempts are failed instead. Returns the number of jobs touched.
+        """
+        result = await db.execute(
+            sql_text("""
+                UPDATE ingest_jobs j SET
+                    status = CASE WHEN j.attempts < j.max_attempts THEN 'queued' ELSE 'failed' END,
+                    error = 'worker ' || coalesce(j.locked_by, '?') || ' stopped responding',
+                    finished_at = CASE WHEN j.attempts < j.max_attempts THEN NULL ELSE now() END,
+                    payload_file = CASE
+                        WHEN j.attempts < j.max_attempts THEN j.payload_file
+                    END,
+                    locked_by = NULL,
+                    run_after = now()
+                FROM (
+                    SELECT id, payload_file FROM ingest_jobs
+                    WHERE status = 'running'
+                      AND heartbeat_at < now() - make_interval(secs => :stale)
+                    FOR UPDATE
+                ) old
+                WHERE j.id = old.id
+                RETURNING j.status, old.payload_file
+            """),
+            {"stale": stale_after_s},
+        )
+        rows = result.all()
+        await db.commit()
+        _remove_payloads(row.payload_file for row in rows if row.status == FAILED)
+        return len(rows)
@@ -0,0 +1,589 @@
+"""
+Online re-embedding of the corpus with another embedding backend
+(`python -m app.reembed`).
+
+The new vectors are written next to the live ones, into
+`chunks.embedding_next`, in throttled batches while the API keeps serving
+and writing with the current backend. A trigger clears a chunk's new
+vector when its text changes, and catch-up passes embed whatever was
+written meanwhile. The HNSW index on the new column is built
+CONCURRENTLY (per partition, when `chunks` is partitioned).
+
+The new document centroids are computed into a staging table, and
+indexed CONCURRENTLY, before the swap; a second trigger records the
+documents whose chunks change from then on. The swap is one transaction.
+It blocks writers to `chunks` (readers carry on) while the last rows are
+embedded and those documents' centroids are recomputed, then drops the
+old column and centroid table and renames the new ones into their place,
+which holds an exclusive lock only until the commit.
+
+Processes switch to the new backend within EMBED_BACKEND_POLL_S of the
+swap (see app/core/startup.py). Until then they query with the old model
+against the new vectors, and what they write is re-embedded by repair
+passes after the swap, which go on until one finds nothing after every
+process has had time to switch. Migrating to another dimension needs them restarted
+with EMBED_BACKEND set to the target.
+
+An interrupted migration resumes when run again with the same target.
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from typing import List, Optional
+
+from sqlalchemy import Row, text as sql_text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import settings
+from app.core.database import engine
+from app.core.document_index import INDEX_NAME as DOCUMENT_INDEX_NAME
+from app.core.document_index import refresh_document_embeddings
+from app.core.embedding import EmbbedModel, NumpyArray
+from app.core.embedding_backends import EmbeddingBackend, swapped_backend_name
+from app.core.result_cache import result_cache
+from app.core.vector_index import INDEX_NAMES, index_sql
+
+logger = logging.getLogger(__name__)
+
+RUNNING = "running"
+SWAPPED = "swapped"
+FAILED = "failed"
+ABORTED = "aborted"
+
+NEXT_COLUMN = "embedding_next"
+NEXT_MODEL_COLUMN = "embedding_next_model"
+TRIGGER = "chunks_reset_embedding_next"
+STAGE_TABLE = "document_embeddings_next"
+DIRTY_TABLE = "reembed_dirty_documents"
+DIRTY_TRIGGER = "chunks_mark_document_dirty"
+
+# The staging table's constraints and indexes, renamed to the live names by the swap.
+_STAGE_CONSTRAINTS = {
+    "document_embeddings_next_pkey": "document_embeddings_pkey",
+    "document_embeddings_next_document_id_fkey": "document_embeddings_document_id_fkey",
+}
+_STAGE_INDEXES = {
+    "ix_document_embeddings_next_owner_id": "ix_document_embeddings_owner_id",
+    f"{DOCUMENT_INDEX_NAME}_next": DOCUMENT_INDEX_NAME,
+}
+
+# Tries at taking the locks of the swap before giving up.
+_SWAP_ATTEMPTS = 3
+_SWAP_LOCK_TIMEOUT = "5s"
+
+_TRIGGER_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION {TRIGGER}() RETURNS trigger AS $$
+    BEGIN
+        NEW.{NEXT_COLUMN} := NULL;
+        NEW.{NEXT_MODEL_COLUMN} := NULL;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+"""
+_TRIGGER_SQL = f"""
+    CREATE TRIGGER {TRIGGER} BEFORE UPDATE OF text ON chunks
+    FOR EACH ROW WHEN (OLD.text IS DISTINCT FROM NEW.text)
+    EXECUTE FUNCTION {TRIGGER}()
+"""
+_DIRTY_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION {DIRTY_TRIGGER}() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO {DIRTY_TABLE} (document_id)
+        VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.document_id ELSE NEW.document_id END)
+        ON CONFLICT DO NOTHING;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+_DIRTY_TRIGGER_SQL = f"""
+    CREATE TRIGGER {DIRTY_TRIGGER} AFTER INSERT OR UPDATE OR DELETE ON chunks
+    FOR EACH ROW EXECUTE FUNCTION {DIRTY_TRIGGER}()
+"""
+_STAGE_TABLE_SQL = f"""
+    CREATE TABLE {STAGE_TABLE} (
+        document_id bigint NOT NULL,
+        section integer NOT NULL,
+        owner_id bigint,
+        chunk_count integer NOT NULL,
+        embedding vector({{dim}}) NOT NULL,
+        CONSTRAINT document_embeddings_next_pkey PRIMARY KEY (document_id, section),
+        CONSTRAINT document_embeddings_next_document_id_fkey FOREIGN KEY (document_id)
+            REFERENCES documents (id) ON DELETE CASCADE
+    )
+"""
+
+
+class MigrationAborted(Exception):
+    pass
+
+
+def _text_md5(text: str) -> str:
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+class ReembedMigration:
+    def __init__(
+        self,
+        target: EmbeddingBackend,
+        batch_size: int = settings.REEMBED_BATCH_SIZE,
+        pause_s: float = settings.REEMBED_PAUSE_S,
+        mode: str = settings.VECTOR_INDEX_MODE,
+    ) -> None:
+        self.target = target
+        self.batch_size = batch_size
+        self.pause_s = pause_s
+        self.mode = mode
+        self.model = EmbbedModel(target)
+        self.id: Optional[int] = None
+        self._stopping = asyncio.Event()
+
+    @property
+    def next_index(self) -> str:
+        return f"{INDEX_NAMES[self.mode]}_next"
+
+    def stop(self):
+        """Stop after the current batch; running the migration again resumes it."""
+        self._stopping.set()
+
+    async def run(self) -> str:
+        """Run or resume the migration to `target`; returns its status when this stops."""
+        async with engine.connect() as lock:
+            # Session-level, so it is held for the whole run, outside any transaction.
+            lock = await lock.execution_options(isolation_level="AUTOCOMMIT")
+            result = await lock.execute(
+                sql_text("SELECT pg_try_advisory_lock(hashtext('reembed'))")
+            )
+            if not result.scalar_one():
+                raise RuntimeError("another re-embedding process is running")
+            try:
+                return await self._run()
+            finally:
+                await lock.execute(sql_text("SELECT pg_advisory_unlock(hashtext('reembed'))"))
+
+    @staticmethod
+    async def abort() -> Optional[int]:
+        """Abort the running migration, dropping its column. Returns its id."""
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                sql_text("""
+                    UPDATE embedding_migrations SET status = 'aborted', updated_at = now()
+                    WHERE status = 'running' RETURNING id
+                """)
+            )
+            migration_id = result.scalar_one_or_none()
+            await conn.execute(sql_text(f"DROP TRIGGER IF EXISTS {TRIGGER} ON chunks"))
+            await conn.execute(sql_text(f"DROP TRIGGER IF EXISTS {DIRTY_TRIGGER} ON chunks"))
+            await conn.execute(sql_text(f"DROP TABLE IF EXISTS {DIRTY_TABLE}, {STAGE_TABLE}"))
+            await conn.execute(
+                sql_text(
+                    f"ALTER TABLE chunks DROP COLUMN IF EXISTS {NEXT_COLUMN}, "
+                    f"DROP COLUMN IF EXISTS {NEXT_MODEL_COLUMN}"
+                )
+            )
+        return migration_id
+
+    async def _run(self) -> str:
+        await self._begin()
+        try:
+            await asyncio.to_thread(self.model.init)
+            await self._prepare()
+            # Repeat until rows written meanwhile are few enough for the swap.
+            while await self._fill() >= self.batch_size:
+                pass
+            if self._stopping.is_set():
+                return RUNNING
+            await self._build_index()
+            await self._stage_centroids()
+            if self._stopping.is_set():
+                return RUNNING
+            for attempt in range(1, _SWAP_ATTEMPTS + 1):
+                await self._fill()
+                if self._stopping.is_set():
+                    return RUNNING
+                try:
+                    await self._swap()
+                    break
+                except Exception as e:
+                    if attempt == _SWAP_ATTEMPTS or "lock timeout" not in str(e):
+                        raise
+                    logger.warning("swap: could not take the locks in time; retrying")
+        except MigrationAborted:
+            return ABORTED
+        except Exception as e:
+            if await self._fail(repr(e)) == ABORTED:
+                return ABORTED
+            raise
+        logger.info("migration %s: swapped in %s", self.id, self.target.name)
+
+        # Fix what the other processes write until they notice, and until a
+        # pass finds nothing once they all have had time to.
+        deadline = time.monotonic() + 2 * settings.EMBED_BACKEND_POLL_S
+        repaired = 0
+        while True:
+            found = await self._repair()
+            repaired += found
+            if found:
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(min(settings.EMBED_BACKEND_POLL_S, remaining))
+        if repaired:
+            logger.info("migration %s: re-embedded %d chunks written meanwhile", self.id, repaired)
+        return SWAPPED
+
+    async def _begin(self):
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                sql_text("SELECT id, target FROM embedding_migrations WHERE status = 'running'")
+            )
+            running = result.one_or_none()
+            if running is not None:
+                if running.target != self.target.name:
+                    raise RuntimeError(
+                        f"migration {running.id} to {running.target} is running; "
+                        "abort it first"
+                    )
+                self.id = running.id
+                logger.info("resuming migration %s to %s", self.id, self.target.name)
+                return
+
+            source = await swapped_backend_name(conn) or settings.EMBED_BACKEND
+            if source == self.target.name:
+                raise ValueError(f"chunks are already embedded with {source}")
+            result = await conn.execute(
+                sql_text("""
+                    INSERT INTO embedding_migrations (source, target, status, rows_done, rows_total)
+                    SELECT :source, :target, 'running', 0, count(*) FROM chunks
+                    RETURNING id
+                """),
+                {"source": source, "target": self.target.name},
+            )
+            self.id = result.scalar_one()
+            logger.info("migration %s: %s -> %s", self.id, source, self.target.name)
+
+    async def _prepare(self):
+        """Add the new columns and the trigger invalidating them."""
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                sql_text(
+                    "SELECT atttypmod FROM pg_attribute WHERE attrelid = 'chunks'::regclass "
+                    "AND attname = :column AND NOT attisdropped"
+                ),
+                {"column": NEXT_COLUMN},
+            )
+            dim = result.scalar_one_or_none()
+            if dim is not None and dim != self.target.dim:
+                # Left behind by an earlier migration to another dimension.
+                await conn.execute(
+                    sql_text(
+                        f"ALTER TABLE chunks DROP COLUMN {NEXT_COLUMN}, "
+                        f"DROP COLUMN {NEXT_MODEL_COLUMN}"
+                    )
+                )
+            await conn.execute(
+                sql_text(
+                    f"ALTER TABLE chunks "
+                    f"ADD COLUMN IF NOT EXISTS {NEXT_COLUMN} vector({int(self.target.dim)}), "
+                    f"ADD COLUMN IF NOT EXISTS {NEXT_MODEL_COLUMN} text"
+                )
+            )
+            await conn.execute(sql_text(_TRIGGER_FUNCTION_SQL))
+            await conn.execute(sql_text(f"DROP TRIGGER IF EXISTS {TRIGGER} ON chunks"))
+            await conn.execute(sql_text(_TRIGGER_SQL))
+
+    async def _fill(self) -> int:
+        """One pass over the chunks lacking a new vector; returns how many it embedded."""
+        done, after = 0, ""
+        while not self._stopping.is_set():
+            async with engine.begin() as conn:
+                await self._check_running(conn)
+                rows = await self._pending(conn, after, NEXT_MODEL_COLUMN)
+            if not rows:
+                break
+            vectors = await self._embed(rows)
+            async with engine.begin() as conn:
+                written = await self._write(conn, rows, vectors, NEXT_COLUMN, NEXT_MODEL_COLUMN)
+                await conn.execute(
+                    sql_text("""
+                        UPDATE embedding_migrations
+                        SET rows_done = rows_done + :n, updated_at = now()
+                        WHERE id = :id
+                    """),
+                    {"n": len(written), "id": self.id},
+                )
+            done += len(rows)
+            after = rows[-1].id
+            await asyncio.sleep(self.pause_s)
+        return done
+
+    async def _pending(self, conn: AsyncConnection, after: str, model_column: str) -> List[Row]:
+        """The next batch of chunks after id `after` whose `model_column` is not the target."""
+        result = await conn.execute(
+            sql_text(f"""
+                SELECT id, text FROM chunks
+                WHERE id > :after AND {model_column} IS DISTINCT FROM :target
+                ORDER BY id
+                LIMIT :limit
+            """),
+            {"after": after, "target": self.target.name, "limit": self.batch_size},
+        )
+        return result.all()
+
+    async def _embed(self, rows: List[Row]) -> List[NumpyArray]:
+        texts = [row.text for row in rows]
+        return await asyncio.to_thread(self._infer, texts)
+
+    def _infer(self, texts: List[str]) -> List[NumpyArray]:
+        model = self.model.embed_model
+        assert model is not None
+        return list(model.embed(texts, batch_size=self.target.max_batch_size))
+
+    async def _write(
+        self,
+        conn: AsyncConnection,
+        rows: List[Row],
+        vectors: List[NumpyArray],
+        column: str,
+        model_column: str,
+    ) -> List[Row]:
+        """
+        Store `vectors` through a COPY-filled staging table, skipping chunks
+        whose text changed since they were read. Returns `(document_id,
+        owner_id)` of each chunk written.
+        """
+        await conn.execute(
+            sql_text(
+                "CREATE TEMP TABLE IF NOT EXISTS reembed_stage "
+                f"(id text, text_md5 text, embedding vector({int(self.target.dim)})) "
+                "ON COMMIT DROP"
+            )
+        )
+        raw = (await conn.get_raw_connection()).driver_connection
+        await raw.copy_records_to_table(
+            "reembed_stage",
+            records=[(row.id, _text_md5(row.text), v) for row, v in zip(rows, vectors)],
+            columns=("id", "text_md5", "embedding"),
+        )
+        result = await conn.execute(
+            sql_text(f"""
+                UPDATE chunks c SET {column} = s.embedding, {model_column} = :target
+                FROM reembed_stage s
+                WHERE c.id = s.id AND md5(c.text) = s.text_md5
+                RETURNING c.document_id, c.owner_id
+            """),
+            {"target": self.target.name},
+        )
+        written = list(result)
+        await conn.execute(sql_text("TRUNCATE reembed_stage"))
+        return written
+
+    async def _build_index(self):
+        """Build the index of the new column without blocking writes."""
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            result = await conn.execute(
+                sql_text(
+                    "SELECT inhrelid::regclass::text FROM pg_inherits "
+                    "WHERE inhparent = 'chunks'::regclass"
+                )
+            )
+            partitions = list(result.scalars())
+            if not partitions:
+                await self._create_index(conn, self.next_index, "chunks")
+                return
+
+            # An index on the parent alone, valid once every partition's is attached.
+            await conn.execute(
+                sql_text(
+                    self._index_sql(self.next_index, "ONLY chunks", "CREATE INDEX IF NOT EXISTS")
+                )
+            )
+            for partition in partitions:
+                name = f"{partition}_{NEXT_COLUMN}_hnsw"
+                await self._create_index(conn, name, partition)
+                result = await conn.execute(
+                    sql_text(
+                        "SELECT EXISTS (SELECT 1 FROM pg_inherits "
+                        "WHERE inhrelid = to_regclass(:name) AND inhparent = to_regclass(:parent))"
+                    ),
+                    {"name": name, "parent": self.next_index},
+                )
+                if not result.scalar_one():
+                    await conn.execute(
+                        sql_text(f"ALTER INDEX {self.next_index} ATTACH PARTITION {name}")
+                    )
+
+    async def _stage_centroids(self):
+        """
+        Compute the centroids of the new vectors into STAGE_TABLE and index
+        them, without blocking writes. Documents whose chunks change from
+        here on are recorded in DIRTY_TABLE for the swap to recompute.
+        """
+        async with engine.begin() as conn:
+            await conn.execute(sql_text(f"DROP TRIGGER IF EXISTS {DIRTY_TRIGGER} ON chunks"))
+            await conn.execute(
+                sql_text(
+                    f"CREATE TABLE IF NOT EXISTS {DIRTY_TABLE} (document_id bigint PRIMARY KEY)"
+                )
+            )
+            await conn.execute(sql_text(f"TRUNCATE {DIRTY_TABLE}"))
+            await conn.execute(sql_text(_DIRTY_FUNCTION_SQL))
+            await conn.execute(sql_text(_DIRTY_TRIGGER_SQL))
+        # Creating the trigger waited for running writers, so the centroids
+        # below see every write the trigger does not record.
+        async with engine.begin() as conn:
+            await conn.execute(sql_text(f"DROP TABLE IF EXISTS {STAGE_TABLE}"))
+            await conn.execute(sql_text(_STAGE_TABLE_SQL.format(dim=int(self.target.dim))))
+            await conn.execute(
+                sql_text(
+                    f"CREATE INDEX ix_document_embeddings_next_owner_id "
+                    f"ON {STAGE_TABLE} (owner_id)"
+                )
+            )
+            await refresh_document_embeddings(conn, None, column=NEXT_COLUMN, table=STAGE_TABLE)
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            logger.info("migration %s: indexing the new document centroids", self.id)
+            await conn.execute(
+                sql_text(
+                    f"CREATE INDEX CONCURRENTLY {DOCUMENT_INDEX_NAME}_next "
+                    f"ON {STAGE_TABLE} USING hnsw (embedding vector_cosine_ops)"
+                )
+            )
+
+    async def _create_index(self, conn: AsyncConnection, name: str, table: str):
+        result = await conn.execute(
+            sql_text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+            {"name": name},
+        )
+        valid = result.scalar_one_or_none()
+        if valid:
+            return
+        if valid is not None:
+            # An interrupted CREATE INDEX CONCURRENTLY leaves an invalid index.
+            await conn.execute(sql_text(f"DROP INDEX CONCURRENTLY {name}"))
+        logger.info("migration %s: building %s", self.id, name)
+        await conn.execute(sql_text(self._index_sql(name, table, "CREATE INDEX CONCURRENTLY")))
+
+    def _index_sql(self, name: str, table: str, prefix: str) -> str:
+        return index_sql(
+            self.mode,
+            column=NEXT_COLUMN,
+            dim=self.target.dim,
+            name=name,
+            prefix=prefix,
+            table=table,
+        )
+
+    async def _swap(self):
+        async with engine.begin() as conn:
+            await conn.execute(sql_text(f"SET LOCAL lock_timeout = '{_SWAP_LOCK_TIMEOUT}'"))
+            # Blocks writers, not readers, while the last rows are embedded.
+            await conn.execute(sql_text("LOCK TABLE chunks IN SHARE ROW EXCLUSIVE MODE"))
+            await self._check_running(conn)
+            after = ""
+            while rows := await self._pending(conn, after, NEXT_MODEL_COLUMN):
+                vectors = await self._embed(rows)
+                await self._write(conn, rows, vectors, NEXT_COLUMN, NEXT_MODEL_COLUMN)
+                after = rows[-1].id
+
+            # Only the documents written since the centroids were staged.
+            result = await conn.execute(sql_text(f"SELECT document_id FROM {DIRTY_TABLE}"))
+            await refresh_document_embeddings(
+                conn, list(result.scalars()), column=NEXT_COLUMN, table=STAGE_TABLE
+            )
+            await conn.execute(sql_text(f"DROP TRIGGER {DIRTY_TRIGGER} ON chunks"))
+            await conn.execute(sql_text(f"DROP TABLE {DIRTY_TABLE}"))
+            await conn.execute(sql_text("DROP TABLE document_embeddings"))
+            await conn.execute(
+                sql_text(f"ALTER TABLE {STAGE_TABLE} RENAME TO document_embeddings")
+            )
+            for staged, live in _STAGE_CONSTRAINTS.items():
+                await conn.execute(
+                    sql_text(
+                        f"ALTER TABLE document_embeddings RENAME CONSTRAINT {staged} TO {live}"
+                    )
+                )
+            for staged, live in _STAGE_INDEXES.items():
+                await conn.execute(sql_text(f"ALTER INDEX {staged} RENAME TO {live}"))
+
+            # The old column's indexes go with it.
+            await conn.execute(sql_text(f"DROP TRIGGER {TRIGGER} ON chunks"))
+            await conn.execute(
+                sql_text("ALTER TABLE chunks DROP COLUMN embedding, DROP COLUMN embedding_model")
+            )
+            await conn.execute(
+                sql_text(f"ALTER TABLE chunks RENAME COLUMN {NEXT_COLUMN} TO embedding")
+            )
+            await conn.execute(
+                sql_text(f"ALTER TABLE chunks RENAME COLUMN {NEXT_MODEL_COLUMN} TO embedding_model")
+            )
+            await conn.execute(
+                sql_text(f"ALTER INDEX {self.next_index} RENAME TO {INDEX_NAMES[self.mode]}")
+            )
+            result = await conn.execute(
+                sql_text(
+                    "SELECT inhrelid::regclass::text FROM pg_inherits "
+                    "WHERE inhparent = 'chunks'::regclass"
+                )
+            )
+            for partition in result.scalars():
+                await conn.execute(
+                    sql_text(
+                        f"ALTER INDEX IF EXISTS {partition}_{NEXT_COLUMN}_hnsw "
+                        f"RENAME TO {partition}_embedding_hnsw"
+                    )
+                )
+            await conn.execute(
+                sql_text("""
+                    UPDATE embedding_migrations
+                    SET status = 'swapped', swapped_at = now(), updated_at = now()
+                    WHERE id = :id
+                """),
+                {"id": self.id},
+            )
+
+    async def _repair(self) -> int:
+        """Re-embed chunks written with another backend since the swap."""
+        repaired, after = 0, ""
+        while True:
+            async with engine.connect() as conn:
+                rows = await self._pending(conn, after, "embedding_model")
+            if not rows:
+                return repaired
+            vectors = await self._embed(rows)
+            async with engine.begin() as conn:
+                written = await self._write(conn, rows, vectors, "embedding", "embedding_model")
+                documents = {row.document_id: row.owner_id for row in written}
+                await refresh_document_embeddings(conn, list(documents))
+            for document_id, owner_id in documents.items():
+                await result_cache.invalidate(document_id, owner_id)
+            repaired += len(rows)
+            after = rows[-1].id
+            await asyncio.sleep(self.pause_s)
+
+    async def _check_running(self, conn: AsyncConnection):
+        result = await conn.execute(
+            sql_text("SELECT status FROM embedding_migrations WHERE id = :id"), {"id": self.id}
+        )
+        if result.scalar_one() != RUNNING:
+            raise MigrationAborted(self.id)
+
+    async def _fail(self, error: str) -> str:
+        """Record the failure, unless the migration was aborted meanwhile; returns its status."""
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                sql_text("""
+                    UPDATE embedding_migrations
+                    SET status = CASE WHEN status = 'running' THEN 'failed' ELSE status END,
+                        error = CASE WHEN status = 'running' THEN :error ELSE error END,
+                        updated_at = now()
+                    WHERE id = :id
+                    RETURNING status
+                """),
+                {"id": self.id, "error": error},
+            )
+            return result.scalar_one()
@@ -0,0 +1,179 @@
+import json
+import math
+from dataclasses import dataclass, replace
+from typing import Any, List, Optional, Tuple, Union
+
+import asyncpg
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.search_pool import to_positional
+from app.core.vector_index import FULL
+from app.models import CHUNKS_PARTITIONED
+
+# Plans are made over either ORM sessions or raw search-pool connections.
+Database = Union[AsyncSession, asyncpg.Connection]
+
+EXACT = "exact"
+FILTERED = "filtered"
+HNSW = "hnsw"
+
+
+@dataclass(frozen=True)
+class SearchPlan:
+    """How to run one filtered ANN query."""
+
+    strategy: str
+    ef_search: Optional[int] = None
+    estimated_rows: Optional[int] = None
+    selectivity: Optional[float] = None
+    # Rows taken from a compact index and re-ranked on the full vectors.
+    candidates: Optional[int] = None
+
+
+async def fetch_scalar(db: Database, sql: str, params: dict) -> Any:
+    """First column of the first row of `sql` (with `:name` binds), or None."""
+    if isinstance(db, AsyncSession):
+        return await db.scalar(sql_text(sql), params)
+    query, args = to_positional(sql, params)
+    return await db.fetchval(query, *args)
+
+
+def filter_sql(
+    params: dict,
+    owner_id: Optional[int],
+    document_ids: Optional[List[int]],
+    alias: str = "",
+) -> str:
+    """WHERE clause for the owner / document filters, adding their params."""
+    prefix = f"{alias}." if alias else ""
+    where_clauses = []
+    if owner_id is not None:
+        where_clauses.append(f"{prefix}owner_id = :owner_id")
+        params["owner_id"] = owner_id
+    if document_ids:
+        where_clauses.append(f"{prefix}document_id = ANY(:doc_ids)")
+        params["doc_ids"] = document_ids
+    return " AND ".join(where_clauses) if where_clauses else "TRUE"
+
+
+class SearchPlanner:
+    """
+    Picks a strategy for a filtered nearest-neighbour query from the
+    estimated number of chunks that pass its filters.
+
+    - exact:    few enough rows to scan them through the btree filter and
+                sort; recall is perfect and the HNSW graph is never walked.
+    - filtered: a selective filter over a large set; HNSW with
+                `hnsw.ef_search` raised so enough candidates survive the
+                filter (plus iterative scans when configured).
+    - hnsw:     unselective or no filter; plain HNSW.
+
+    Estimates are cached per filter for `PLAN_CACHE_TTL_S`. With a compact
+    `VECTOR_INDEX_MODE`, approximate plans also oversample candidates for
+    exact re-ranking (see `with_rerank`).
+    """
+
+    def __init__(self) -> None:
+        self._estimates = TTLCache(max_entries=4096, ttl_seconds=settings.PLAN_CACHE_TTL_S)
+
+    async def plan(
+        self,
+        db: Database,
+        owner_id: Optional[int],
+        document_ids: Optional[List[int]],
+        limit: int,
+    ) -> SearchPlan:
+        if owner_id is None and not document_ids:
+            return SearchPlan(HNSW)
+
+        rows, total = await self._estimate(db, owner_id, document_ids)
+        if rows <= settings.SEARCH_EXACT_MAX_ROWS:
+            return SearchPlan(EXACT, estimated_rows=rows)
+
+        selectivity = rows / total if total else 1.0
+        if selectivity > settings.SEARCH_FILTERED_MAX_SELECTIVITY:
+            return SearchPlan(HNSW, estimated_rows=rows, selectivity=selectivity)
+
+        # HNSW yields ~ef_search candidates before filtering; scale it so as
+        # many survive the filter as an unfiltered search would consider.
+        wanted = max(settings.HNSW_EF_SEARCH, 2 * limit)
+        ef_search = math.ceil(wanted / max(selectivity, 1e-9))
+        ef_search = max(settings.HNSW_EF_SEARCH, min(ef_search, settings.HNSW_MAX_EF_SEARCH))
+        return SearchPlan(
+            FILTERED, ef_search=ef_search, estimated_rows=rows, selectivity=selectivity
+        )
+
+    def with_rerank(self, plan: SearchPlan, limit: int) -> SearchPlan:
+        """Oversample ANN candidates when searching a compact (halfvec/binary) index."""
+        if settings.VECTOR_INDEX_MODE == FULL or plan.strategy == EXACT:
+            return plan
+        candidates = limit * settings.VECTOR_RERANK_OVERSAMPLE
+        # HNSW returns at most ef_search rows.
+        ef_search = max(plan.ef_search or settings.HNSW_EF_SEARCH, candidates)
+        return replace(
+            plan,
+            candidates=candidates,
+            ef_search=min(ef_search, settings.HNSW_MAX_EF_SEARCH),
+        )
+
+    async def _estimate(
+        self,
+        db: Database,
+        owner_id: Optional[int],
+        document_ids: Optional[List[int]],
+    ) -> Tuple[int, int]:
+        """(rows matching the filters, total rows) for `chunks`."""
+        key = (owner_id, tuple(sorted(document_ids or ())))
+        cached = self._estimates.get(key)
+        if cached is not None:
+            return cached
+
+        params: dict = {"cap": settings.SEARCH_EXACT_MAX_ROWS + 1}
+        where_sql = filter_sql(params, owner_id, document_ids)
+
+        # Exact, but bounded: stops after `cap` rows from the btree indexes.
+        rows = await fetch_scalar(
+            db,
+            f"SELECT count(*) FROM (SELECT 1 FROM chunks WHERE {where_sql} LIMIT :cap) s",
+            params,
+        )
+        total = 0
+        if rows > settings.SEARCH_EXACT_MAX_ROWS:
+            # Too many to count cheaply; use the planner's estimates instead.
+            del params["cap"]
+            rows = max(rows, await self._planner_rows(db, where_sql, params))
+            total = await self._search_space_rows(db, owner_id)
+
+        self._estimates.set(key, (rows, total))
+        return rows, total
+
+    async def _search_space_rows(self, db: Database, owner_id: Optional[int]) -> int:
+        """Rows in the HNSW graph the query walks: the tenant's partition, if any."""
+        if CHUNKS_PARTITIONED and owner_id is not None:
+            rows = await fetch_scalar(
+                db,
+                """
+                    SELECT reltuples::bigint FROM pg_class
+                    WHERE oid = (SELECT tableoid FROM chunks WHERE owner_id = :owner_id LIMIT 1)
+                """,
+                {"owner_id": owner_id},
+            )
+            if rows is not None and rows > 0:
+                return int(rows)
+        return await self._planner_rows(db, "TRUE", {})
+
+    @staticmethod
+    async def _planner_rows(db: Database, where_sql: str, params: dict) -> int:
+        plan = await fetch_scalar(
+            db, f"EXPLAIN (FORMAT JSON) SELECT 1 FROM chunks WHERE {where_sql}", params
+        )
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+
+
+search_planner = SearchPlanner()
@@ -0,0 +1,214 @@
+import asyncio
+import io
+import logging
+import random
+import re
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    import httpx
+    from pydub import AudioSegment
+
+logger = logging.getLogger(__name__)
+
+_RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TranscriptionEngine:
+    """
+    Transcribes audio through the Groq (OpenAI-compatible) transcription API.
+
+    Audio is decoded with pydub and re-encoded as 16 kHz mono FLAC, so what
+    is sent stays small whatever the upload's format. Recordings longer
+    than one segment are split, preferably at a silence near each cut and
+    otherwise with a short overlap. Segments are transcribed concurrently
+    over one pooled HTTP client and stitched back together in order.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        api_key: str,
+        model: str,
+        concurrency: int = 4,
+        segment_sec: float = 600,
+        overlap_sec: float = 2,
+        max_retries: int = 4,
+        backoff_sec: float = 0.5,
+    ) -> None:
+        if not 0 <= overlap_sec < segment_sec:
+            raise ValueError(
+                f"the transcription overlap ({overlap_sec}s) must be at least 0 "
+                f"and shorter than a segment ({segment_sec}s)"
+            )
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.concurrency = concurrency
+        self.segment_ms = int(segment_sec * 1000)
+        self.overlap_ms = int(overlap_sec * 1000)
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self._client: Optional["httpx.AsyncClient"] = None
+
+    async def start(self):
+        if self._client is None:
+            import httpx
+
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(300, connect=10),
+                limits=httpx.Limits(
+                    max_connections=self.concurrency * 4,
+                    max_keepalive_connections=self.concurrency * 4,
+                ),
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def transcribe(self, audio: bytes, content_type: str) -> str:
+        await self.start()
+        segments = await asyncio.to_thread(self.split, audio)
+        if len(segments) == 1:
+            return await self._post(segments[0], "audio.flac", "audio/flac")
+
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def transcribe_segment(segment: bytes) -> str:
+            async with limit:
+                return await self._post(segment, "audio.flac", "audio/flac")
+
+        texts = await asyncio.gather(*(transcribe_segment(s) for s in segments))
+        return stitch(texts)
+
+    def split(self, audio: bytes) -> List[bytes]:
+        """FLAC-encoded segments of `audio`; just one if it fits in a segment."""
+        from pydub import AudioSegment
+
+        # Decoding straight to 16 kHz mono keeps long recordings small in memory.
+        decoded = AudioSegment.from_file(
+            io.BytesIO(audio), parameters=["-ac", "1", "-ar", "16000"]
+        )
+        cuts = (
+            [(0, len(decoded))]
+            if len(decoded) <= self.segment_ms
+            else self.plan_cuts(decoded)
+        )
+        segments = []
+        for start, end in cuts:
+            buffer = io.BytesIO()
+            decoded[start:end].export(buffer, format="flac")
+            segments.append(buffer.getvalue())
+        return segments
+
+    def plan_cuts(self, audio: "AudioSegment") -> List[Tuple[int, int]]:
+        """
+        `(start_ms, end_ms)` ranges covering `audio`. Each cut is moved to the
+        middle of the last silence in the 10% of the segment before it;
+        without one the next segment starts `overlap_ms` early instead.
+        """
+        from pydub.silence import detect_silence
+
+        search_ms = max(self.segment_ms // 10, 1000)
+        cuts = []
+        start = 0
+        while start < len(audio):
+            target = start + self.segment_ms
+            if target >= len(audio):
+                cuts.append((start, len(audio)))
+                break
+
+            window_start = max(start, target - search_ms)
+            window = audio[window_start:target]
+            silences = detect_silence(
+                window,
+                min_silence_len=300,
+                silence_thresh=window.dBFS - 16,
+                seek_step=10,
+            )
+            if silences:
+                silence_start, silence_end = silences[-1]
+                end = window_start + (silence_start + silence_end) // 2
+                cuts.append((start, end))
+                start = end
+            else:
+                cuts.append((start, target))
+                start = max(start + 1, target - self.overlap_ms)
+        return cuts
+
+    async def _post(self, payload: bytes, filename: str, content_type: str) -> str:
+        import httpx
+
+        assert self._client is not None
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._client.post(
+                    self.url,
+                    data={"model": self.model},
+                    files={"file": (filename, payload, content_type)},
+                )
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise HTTPException(status_code=502, detail=str(e))
+                await self._backoff(attempt, None)
+                continue
+
+            if response.status_code == 200:
+                return response.json().get("text") or ""
+            if response.status_code in _RETRY_STATUSES and attempt < self.max_retries:
+                await self._backoff(attempt, response.headers.get("retry-after"))
+                continue
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+        raise AssertionError("unreachable")
+
+    async def _backoff(self, attempt: int, retry_after: Optional[str]):
+        delay = self.backoff_sec * 2**attempt * (1 + random.random())
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        logger.warning(f"transcription request failed, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+
+def _words(text: str) -> List[str]:
+    return [re.sub(r"\W+", "", w).lower() for w in text.split()]
+
+
+def stitch(texts: List[str], max_overlap_words: int = 40) -> str:
+    """
+    Join segment transcripts, dropping words an overlapping segment repeats
+    from the end of the previous one.
+    """
+    result: List[str] = []
+    for text in texts:
+        words = text.split()
+        if result and words:
+            tail = _words(" ".join(result[-max_overlap_words:]))
+            head = _words(" ".join(words[:max_overlap_words]))
+            for k in range(min(len(tail), len(head)), 0, -1):
+                if tail[-k:] == head[:k]:
+                    words = words[k:]
+                    break
+        result.extend(words)
+    return " ".join(result)
+
+
+transcription_engine = TranscriptionEngine(
+    url=settings.GROQ_TRANSCRIPTION_URL,
+    api_key=settings.GROQ_API,
+    model=settings.TRANSCRIPTION_MODEL,
+    concurrency=settings.TRANSCRIPTION_CONCURRENCY,
+    segment_sec=settings.TRANSCRIPTION_SEGMENT_SEC,
+    overlap_sec=settings.TRANSCRIPTION_OVERLAP_SEC,
+    max_retries=settings.TRANSCRIPTION_MAX_RETRIES,
+    backoff_sec=settings.TRANSCRIPTION_BACKOFF_SEC,
+)
@@ -0,0 +1,180 @@
+"""
+Ingest worker: runs queued `ingest_jobs` through the ingest pipeline.
+
+    python -m app.worker --concurrency 4
+
+Start as many workers, on as many machines, as ingestion needs; they
+coordinate through the jobs table only. SIGINT / SIGTERM stop claiming new
+jobs and let the running ones finish.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+from dataclasses import asdict
+from typing import Optional
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, init_db
+from app.core.embedding import embedding_engine
+from app.core.parsing import parsing_executor
+from app.core.startup import startup
+from app.services.ingest import IngestPipeline, IngestStats
+from app.services.jobs import ClaimedJob, JobService
+from app.services.transcription import transcription_engine
+
+logger = logging.getLogger(__name__)
+
+
+class IngestWorker:
+    def __init__(
+        self,
+        concurrency: int = settings.JOB_WORKER_CONCURRENCY,
+        poll_interval_s: float = settings.JOB_POLL_INTERVAL_S,
+        heartbeat_s: float = settings.JOB_HEARTBEAT_S,
+        stale_after_s: float = settings.JOB_STALE_AFTER_S,
+        worker_id: Optional[str] = None,
+    ) -> None:
+        self.concurrency = concurrency
+        self.poll_interval_s = poll_interval_s
+        self.heartbeat_s = heartbeat_s
+        self.stale_after_s = stale_after_s
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        """Process jobs until `stop` is called."""
+        logger.info("worker %s started with %d slots", self.worker_id, self.concurrency)
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self._requeue_stale())
+            for _ in range(self.concurrency):
+                tg.create_task(self._work())
+        logger.info("worker %s stopped", self.worker_id)
+
+    async def _work(self):
+        while not self._stopping.is_set():
+            try:
+                async with AsyncSessionLocal() as db:
+                    job = await JobService.claim(db, self.worker_id)
+            except Exception:
+                logger.exception("could not claim a job")
+                job = None
+            if job is None:
+                await self._sleep(self.poll_interval_s)
+                continue
+            try:
+                await self._run_job(job)
+            except Exception:
+                # The job's status could not be recorded; it is requeued once stale.
+                logger.exception("job %s: could not record the outcome", job.id)
+
+    async def _run_job(self, job: ClaimedJob):
+        logger.info("job %s: attempt %d for document %s", job.id, job.attempts, job.document_id)
+        stats = IngestStats()
+        ingest = asyncio.create_task(self._ingest(job, stats))
+        heartbeat = asyncio.create_task(self._heartbeat(job, stats, ingest))
+        try:
+            await ingest
+        except asyncio.CancelledError:
+            if not heartbeat.done() or heartbeat.cancelled():
+                raise
+            # The heartbeat found the job requeued and stopped the ingest,
+            # whose transaction was rolled back; another worker owns it now.
+            logger.warning("job %s was requeued while running here; abandoned", job.id)
+        except Exception as e:
+            # Unsupported or unparsable uploads fail the same way every time.
+            retry = not isinstance(e, ValueError)
+            logger.warning("job %s failed: %r", job.id, e, exc_info=retry)
+            async with AsyncSessionLocal() as db:
+                status = await JobService.fail(db, job, self.worker_id, repr(e), retry=retry)
+            logger.info("job %s is %s", job.id, status)
+        else:
+            async with AsyncSessionLocal() as db:
+                await JobService.succeed(db, job.id, self.worker_id, asdict(stats))
+            logger.info("job %s succeeded: %d chunks", job.id, stats.chunks)
+        finally:
+            heartbeat.cancel()
+
+    async def _ingest(self, job: ClaimedJob, stats: IngestStats):
+        async with AsyncSessionLocal() as db:
+            await IngestPipeline().ingest_source(
+                db,
+                document_id=job.document_id,
+                owner_id=job.owner_id,
+                source=job.source,
+                reindex=job.reindex,
+                stats=stats,
+            )
+
+    async def _heartbeat(self, job: ClaimedJob, stats: IngestStats, ingest: asyncio.Task):
+        """Keep the job's lease while `ingest` runs; cancel it once the lease is lost."""
+        while True:
+            await asyncio.sleep(self.heartbeat_s)
+            try:
+                async with AsyncSessionLocal() as db:
+                    held = await JobService.heartbeat(db, job.id, self.worker_id, stats.chunks)
+            except Exception:
+                logger.exception("heartbeat for job %s failed", job.id)
+                continue
+            if not held:
+                ingest.cancel()
+                return
+
+    async def _requeue_stale(self):
+        while not self._stopping.is_set():
+            try:
+                async with AsyncSessionLocal() as db:
+                    requeued = await JobService.requeue_stale(db, self.stale_after_s)
+                if requeued:
+                    logger.warning("requeued %d stale jobs", requeued)
+            except Exception:
+                logger.exception("could not requeue stale jobs")
+            await self._sleep(self.heartbeat_s)
+
+    async def _sleep(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except TimeoutError:
+            pass
+
+
+async def main(concurrency: int):
+    if settings.RESULT_CACHE_MAX_ENTRIES and not settings.RESULT_CACHE_REDIS_URL:
+        logger.warning(
+            "RESULT_CACHE_REDIS_URL is not set: API processes may serve cached results "
+            "of documents this worker ingests for up to %ss",
+            settings.RESULT_CACHE_TTL_S,
+        )
+    await embedding_engine.start()
+    parsing_executor.start()
+    await transcription_engine.start()
+    await init_db()
+    # Loads the model and follows re-embedding migrations, as the API does.
+    await startup.follow_backend()
+    startup.start()
+
+    worker = IngestWorker(concurrency=concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    try:
+        await worker.run()
+    finally:
+        await startup.stop()
+        await transcription_engine.stop()
+        parsing_executor.stop()
+        await embedding_engine.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=settings.JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    asyncio.run(main(args.concurrency))
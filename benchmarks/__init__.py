@@ -0,0 +1,4 @@
+import os
+
+# Benchmarks repeat queries on purpose; measure the searches, not the result cache.
+os.environ.setdefault("RESULT_CACHE_MAX_ENTRIES", "0")
@@ -0,0 +1,112 @@
+"""
+Chunker throughput and chunk sizes on multi-megabyte text, for the legacy
+character chunker (ChunkService.chunk) and the token-aware streaming
+chunker (TokenChunker), measured with the embedding model's tokenizer.
+
+    python -m benchmarks.bench_chunker --megabytes 8 --segment-kb 4
+
+The document is fed in `--segment-kb` pieces, like parser output. Chunk
+sizes are reported in model tokens; chunks above the model's input limit
+are truncated by the embedder, so `over_limit` should be 0 for the
+token chunker.
+"""
+
+import argparse
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.embedding import embbed_model, get_tokenizer
+from app.services.chunk_service import ChunkService, TokenChunker
+from benchmarks.common import emit, timed
+from benchmarks.corpus import SyntheticCorpus
+
+MODEL_MAX_TOKENS = 512
+
+
+def markdown_text(corpus: SyntheticCorpus, megabytes: float) -> str:
+    """Synthetic Markdown: sections of paragraphs, lists and code blocks."""
+    parts, size, n = [], 0, 0
+    while size < megabytes * 1024 * 1024:
+        body = corpus.document_text(n, paragraphs=6)
+        paragraphs = body.split("\n\n")
+        section = "\n\n".join(
+            [
+                f"## Section {n}",
+                *paragraphs[:3],
+                "\n".join(f"- {p[:120]}" for p in paragraphs[3:5]),
+                f"```python\ndef section_{n}():\n    return {n}\n```",
+                *paragraphs[5:],
+            ]
+        )
+        parts.append(section)
+        size += len(section)
+        n += 1
+    return "\n\n".join(parts)
+
+
+def segments_of(text: str, size: int):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def token_sizes(chunks) -> np.ndarray:
+    encodings = get_tokenizer().encode_batch(chunks, add_special_tokens=False)
+    return np.array([len(e.ids) for e in encodings])
+
+
+def report(chunks, seconds: float, chars: int) -> dict:
+    sizes = token_sizes(chunks)
+    return {
+        "chunks": len(chunks),
+        "seconds": seconds,
+        "mb_per_sec": chars / (1024 * 1024) / seconds,
+        "chunks_per_sec": len(chunks) / seconds,
+        "tokens": {
+            "mean": float(sizes.mean()),
+            "p5": float(np.percentile(sizes, 5)),
+            "p50": float(np.percentile(sizes, 50)),
+            "p95": float(np.percentile(sizes, 95)),
+            "max": int(sizes.max()),
+        },
+        "over_limit": int((sizes > MODEL_MAX_TOKENS - 2).sum()),
+    }
+
+
+def main(args):
+    text = markdown_text(SyntheticCorpus(docs=1, chunks_per_doc=1), args.megabytes)
+    segments = segments_of(text, args.segment_kb * 1024)
+    get_tokenizer()  # load the model outside the timings
+
+    with timed() as t:
+        legacy = [chunk for segment in segments for chunk in ChunkService.chunk(segment)]
+    legacy_report = report(legacy, t["seconds"], len(text))
+
+    chunker = TokenChunker(max_tokens=args.max_tokens, overlap_tokens=args.overlap_tokens)
+    with timed() as t:
+        chunks = [chunk for segment in segments for chunk in chunker.feed(segment)]
+        chunks.extend(chunker.flush())
+    token_report = report(chunks, t["seconds"], len(text))
+
+    emit(
+        "chunker",
+        {
+            "model": embbed_model.backend.name,
+            "megabytes": len(text) / (1024 * 1024),
+            "segments": len(segments),
+            "max_tokens": args.max_tokens,
+            "overlap_tokens": args.overlap_tokens,
+            "legacy": legacy_report,
+            "token": token_report,
+        },
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--megabytes", type=float, default=8)
+    parser.add_argument("--segment-kb", type=int, default=4)
+    parser.add_argument("--max-tokens", type=int, default=settings.CHUNK_MAX_TOKENS)
+    parser.add_argument("--overlap-tokens", type=int, default=settings.CHUNK_OVERLAP_TOKENS)
+    parser.add_argument("--output", help="write the JSON report here")
+    main(parser.parse_args())
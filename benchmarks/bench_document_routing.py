@@ -0,0 +1,125 @@
+"""
+Latency and agreement of VectorService.query_similar_documents with
+centroid routing (DOC_ROUTING) against ranking over all chunks.
+
+    python -m benchmarks.bench_document_routing --docs 2000 --chunks-per-doc 100
+
+Each query is a chunk vector of a random document plus a little noise;
+`source_top1` is how often that document ranks first, `overlap_at_k` the
+mean fraction of the unrouted top documents that the routed query also
+returns.
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, init_db
+from app.services.embeddings import VectorService
+from benchmarks.common import emit, percentiles, recall_at_k
+from benchmarks.corpus import SyntheticCorpus
+
+
+def queries_near(corpus: SyntheticCorpus, n: int, noise: float):
+    """`n` (source document index, query vector) pairs."""
+    rng = np.random.default_rng((corpus.seed, corpus.docs, 2))
+    pairs = []
+    for doc_number in rng.integers(0, corpus.docs, size=n):
+        vectors = corpus.vectors(int(doc_number))
+        q = vectors[rng.integers(len(vectors))] + noise * rng.standard_normal(
+            corpus.dim, dtype=np.float32
+        ) / np.sqrt(corpus.dim)
+        pairs.append((int(doc_number), q / np.linalg.norm(q)))
+    return pairs
+
+
+async def rank(session, queries, routing: bool, top_k: int, filters: dict):
+    settings.DOC_ROUTING = routing
+    found, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        docs = await VectorService.query_similar_documents(
+            session, q, top_k_docs=top_k, **filters
+        )
+        latencies.append(time.perf_counter() - start)
+        found.append([d["document_id"] for d in docs])
+    return found, latencies
+
+
+def source_top1(found, sources) -> float:
+    return float(np.mean([bool(f) and f[0] == s for f, s in zip(found, sources)]))
+
+
+async def run_regime(session, corpus, pairs, top_k, filters) -> dict:
+    queries = [q for _, q in pairs]
+    sources = [corpus.document_ids[d] for d, _ in pairs]
+    routing = settings.DOC_ROUTING
+    try:
+        full, full_latencies = await rank(session, queries, False, top_k, filters)
+        routed, routed_latencies = await rank(session, queries, True, top_k, filters)
+    finally:
+        settings.DOC_ROUTING = routing
+    return {
+        "overlap_at_k": recall_at_k(routed, full),
+        "routed": {
+            "source_top1": source_top1(routed, sources),
+            "latency": percentiles(routed_latencies),
+        },
+        "all_chunks": {
+            "source_top1": source_top1(full, sources),
+            "latency": percentiles(full_latencies),
+        },
+    }
+
+
+async def main(args):
+    await init_db()
+    corpus = SyntheticCorpus(
+        docs=args.docs, chunks_per_doc=args.chunks_per_doc, tenants=args.tenants
+    )
+    async with AsyncSessionLocal() as session:
+        await corpus.load(session)
+        try:
+            pairs = queries_near(corpus, args.queries, args.noise)
+            tenant = corpus.owner_of(0)
+            regimes = {
+                "one_tenant": (
+                    [(d, q) for d, q in pairs if corpus.owner_of(d) == tenant],
+                    {"owner_id": tenant},
+                ),
+                "unfiltered": (pairs, {}),
+            }
+            results = {
+                name: await run_regime(session, corpus, regime_pairs, args.top_k, filters)
+                for name, (regime_pairs, filters) in regimes.items()
+            }
+        finally:
+            await corpus.drop(session)
+
+    emit(
+        "document_routing",
+        {
+            "rows": corpus.rows,
+            "documents": corpus.docs,
+            "top_k_docs": args.top_k,
+            "route_documents": settings.DOC_ROUTE_DOCUMENTS,
+            "section_centroids": settings.DOC_SECTION_CENTROIDS,
+            "regimes": results,
+        },
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--chunks-per-doc", type=int, default=100)
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--noise", type=float, default=0.5, help="query noise norm")
+    parser.add_argument("--output", help="write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,81 @@
+"""
+Embedding backends compared: load time, throughput, and how closely
+their nearest neighbours agree with the first backend's.
+
+    python -m benchmarks.bench_embedding_backends \\
+        --backends bge-small-en-v1.5 bge-small-en-v1.5-int8 --docs 20
+
+Chunks of synthetic documents are embedded with each backend in batches
+of the backend's batch size. Agreement is the overlap of each chunk's
+top-k neighbours among the other chunks (exact cosine, in NumPy) with the
+reference's, e.g. to check a quantized variant before migrating to it.
+Models are downloaded on first use.
+"""
+
+import argparse
+from typing import List
+
+import numpy as np
+
+from app.core.embedding import load_text_embedding
+from app.core.embedding_backends import BACKENDS, get_backend
+from app.services.chunk_service import ChunkService
+from benchmarks.common import emit, recall_at_k, timed
+from benchmarks.corpus import SyntheticCorpus
+
+
+def neighbours(vectors: np.ndarray, k: int) -> List[List[int]]:
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, -np.inf)
+    return np.argsort(-similarity, axis=1)[:, :k].tolist()
+
+
+def bench_backend(name: str, chunks: List[str]) -> dict:
+    backend = get_backend(name)
+    with timed() as load:
+        model = load_text_embedding(backend)
+    list(model.embed(chunks[: backend.max_batch_size], batch_size=backend.max_batch_size))
+    with timed() as t:
+        vectors = np.stack(list(model.embed(chunks, batch_size=backend.max_batch_size)))
+    return {
+        "model": backend.model,
+        "dim": backend.dim,
+        "load_seconds": load["seconds"],
+        "chunks_per_sec": len(chunks) / t["seconds"],
+        "vectors": vectors,
+    }
+
+
+def main(args):
+    corpus = SyntheticCorpus(docs=args.docs)
+    chunks = [
+        chunk
+        for n in range(args.docs)
+        for chunk in ChunkService.iter_chunks([corpus.document_text(n)])
+    ]
+    results = {name: bench_backend(name, chunks) for name in args.backends}
+
+    reference = neighbours(results[args.backends[0]]["vectors"], args.k)
+    for result in results.values():
+        vectors = result.pop("vectors")
+        result[f"agreement_at_{args.k}"] = recall_at_k(neighbours(vectors, args.k), reference)
+    emit(
+        "embedding_backends",
+        {"chunks": len(chunks), "reference": args.backends[0], "backends": results},
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=sorted(BACKENDS),
+        default=["bge-small-en-v1.5", "bge-small-en-v1.5-int8"],
+    )
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON report here")
+    main(parser.parse_args())
@@ -0,0 +1,89 @@
+"""
+Recall@k and latency of VectorService.query_similar_chunks for each
+filter-selectivity regime, with the planner's choice and each forced
+strategy, against exact search.
+
+    python -m benchmarks.bench_filtered_search --docs 1000 --chunks-per-doc 100
+
+Regimes: a few documents (small candidate set), one tenant's chunks
+(medium selectivity) and no filter.
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.core.database import AsyncSessionLocal, init_db
+from app.services.embeddings import VectorService
+from app.services.search_planner import search_planner
+from benchmarks.common import emit, percentiles, recall_at_k
+from benchmarks.corpus import SyntheticCorpus
+
+STRATEGIES = [None, "exact", "filtered", "hnsw"]
+
+
+async def run_regime(session, corpus, queries, top_k, filters) -> dict:
+    truth = []
+    for q in queries:
+        hits = await VectorService.query_similar_chunks(
+            session, q, top_k=top_k, strategy="exact", **filters
+        )
+        truth.append([h["id"] for h in hits])
+
+    plan = await search_planner.plan(
+        session, filters.get("owner_id"), filters.get("document_ids"), top_k
+    )
+    report = {"planned": plan.__dict__}
+    for strategy in STRATEGIES:
+        found, latencies = [], []
+        for q in queries:
+            start = time.perf_counter()
+            hits = await VectorService.query_similar_chunks(
+                session, q, top_k=top_k, strategy=strategy, **filters
+            )
+            latencies.append(time.perf_counter() - start)
+            found.append([h["id"] for h in hits])
+        report[strategy or "planner"] = {
+            "recall_at_k": recall_at_k(found, truth),
+            "latency": percentiles(latencies),
+        }
+    return report
+
+
+async def main(args):
+    await init_db()
+    corpus = SyntheticCorpus(
+        docs=args.docs, chunks_per_doc=args.chunks_per_doc, tenants=args.tenants
+    )
+    queries = corpus.queries(args.queries)
+    async with AsyncSessionLocal() as session:
+        await corpus.load(session)
+        try:
+            regimes = {
+                "few_documents": {"document_ids": corpus.document_ids[:3]},
+                "one_tenant": {"owner_id": corpus.owner_of(0)},
+                "unfiltered": {},
+            }
+            results = {
+                name: await run_regime(session, corpus, queries, args.top_k, filters)
+                for name, filters in regimes.items()
+            }
+        finally:
+            await corpus.drop(session)
+
+    emit(
+        "filtered_search",
+        {"rows": corpus.rows, "top_k": args.top_k, "regimes": results},
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--chunks-per-doc", type=int, default=100)
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
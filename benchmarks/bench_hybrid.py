@@ -0,0 +1,114 @@
+"""
+Latency of VectorService.query_hybrid_chunks against the pure vector
+search (query_similar_chunks) on the same corpus, queries and filters,
+for full-text terms of increasing frequency and each --text-matches cap.
+
+    python -m benchmarks.bench_hybrid --docs 1000 --chunks-per-doc 100
+
+Terms: "rare" matches about one chunk, "medium" one chunk per document
+plus one document, "common" every chunk. Each capped run also reports
+recall@k of its fused top-k against the run with the largest cap.
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.core.database import AsyncSessionLocal, init_db
+from app.services.embeddings import VectorService
+from benchmarks.common import emit, percentiles, recall_at_k
+from benchmarks.corpus import SyntheticCorpus
+
+
+def query_texts(corpus: SyntheticCorpus, n: int) -> dict:
+    """Full-text queries per term frequency, `n` of each."""
+    return {
+        "rare": [
+            f"document {i % corpus.docs} chunk {i % corpus.chunks_per_doc}" for i in range(n)
+        ],
+        "medium": [f"chunk {i % corpus.chunks_per_doc}" for i in range(n)],
+        "common": ["lorem ipsum"] * n,
+    }
+
+
+async def measure(session, queries, search) -> tuple:
+    await search(session, *queries[0])  # warm up
+    latencies, found = [], []
+    for q in queries:
+        start = time.perf_counter()
+        hits = await search(session, *q)
+        latencies.append(time.perf_counter() - start)
+        found.append([h["id"] for h in hits])
+    return found, percentiles(latencies)
+
+
+async def run_case(session, vectors, texts, filters, args) -> dict:
+    queries = list(zip(vectors, texts))
+
+    async def vector(session, q, text):
+        return await VectorService.query_similar_chunks(session, q, top_k=args.top_k, **filters)
+
+    _, latency = await measure(session, queries, vector)
+    report = {"vector": {"latency": latency}}
+
+    runs = {}
+    for cap in sorted(args.text_matches, reverse=True):
+
+        async def hybrid(session, q, text, cap=cap):
+            return await VectorService.query_hybrid_chunks(
+                session, q, text, top_k=args.top_k, text_matches=cap, **filters
+            )
+
+        runs[cap] = await measure(session, queries, hybrid)
+    reference = runs[max(runs)][0]
+    for cap, (found, latency) in sorted(runs.items()):
+        report[f"hybrid_{cap}"] = {
+            "latency": latency,
+            "recall_at_k": recall_at_k(found, reference),
+        }
+    return report
+
+
+async def main(args):
+    await init_db()
+    corpus = SyntheticCorpus(
+        docs=args.docs, chunks_per_doc=args.chunks_per_doc, tenants=args.tenants
+    )
+    vectors = corpus.queries(args.queries)
+    filters = {"unfiltered": {}, "one_tenant": {"owner_id": corpus.owner_of(0)}}
+    async with AsyncSessionLocal() as session:
+        await corpus.load(session)
+        try:
+            results = {
+                name: {
+                    terms: await run_case(session, vectors, texts, where, args)
+                    for terms, texts in query_texts(corpus, args.queries).items()
+                }
+                for name, where in filters.items()
+            }
+        finally:
+            await corpus.drop(session)
+
+    emit(
+        "hybrid_search",
+        {"rows": corpus.rows, "top_k": args.top_k, "cases": results},
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--chunks-per-doc", type=int, default=100)
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument(
+        "--text-matches",
+        type=int,
+        nargs="+",
+        default=[1000, 10_000, 1_000_000],
+        help="HYBRID_TEXT_MATCHES caps to compare",
+    )
+    parser.add_argument("--output", help="write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
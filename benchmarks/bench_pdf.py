@@ -0,0 +1,118 @@
+"""
+Compare single-call pdfminer extraction with PDFParser's page-parallel path
+on a synthetic multi-hundred-page PDF.
+
+    python -m benchmarks.bench_pdf --pages 400
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from pdfminer.high_level import extract_text
+
+from app.core.parsing import parsing_executor
+from app.services.document_parser import PDFParser
+from benchmarks.common import emit, timed
+
+WORDS = (
+    "retrieval vector index chunk embedding latency throughput postgres "
+    "document query recall tenant partition cache worker batch stream"
+).split()
+
+
+def write_synthetic_pdf(path: str, pages: int, lines_per_page: int = 45) -> None:
+    """Write a plain-text PDF with `pages` pages of pseudo-random words."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(pages):
+        lines = []
+        for line in range(lines_per_page):
+            words = [
+                WORDS[(page * 7 + line * 3 + i) % len(WORDS)] for i in range(12)
+            ]
+            lines.append(f"({' '.join(words)}) Tj T*")
+        stream = ("BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(lines) + " ET").encode()
+        objects.append(
+            b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        )
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+async def bench_parallel(path: str) -> dict:
+    parsing_executor.start()
+    try:
+        # Spawn the workers outside the measurement.
+        await parsing_executor.run("warmup", len, "")
+        start = time.perf_counter()
+        first_page = None
+        pages = 0
+        async for _ in PDFParser.iter_pages(path):
+            if first_page is None:
+                first_page = time.perf_counter() - start
+            pages += 1
+        total = time.perf_counter() - start
+    finally:
+        parsing_executor.stop()
+    return {"pages": pages, "seconds": total, "first_page_seconds": first_page}
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.pdf")
+        write_synthetic_pdf(path, args.pages)
+
+        with timed() as single:
+            extract_text(path)
+        parallel = asyncio.run(bench_parallel(path))
+
+    emit(
+        "pdf",
+        {
+            "pages": args.pages,
+            "workers": parsing_executor.max_workers or os.cpu_count(),
+            "single_call": {
+                "seconds": single["seconds"],
+                "first_page_seconds": single["seconds"],
+            },
+            "page_parallel": parallel,
+            "speedup": single["seconds"] / parallel["seconds"],
+        },
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--output", help="write the JSON report here")
+    main(parser.parse_args())
@@ -0,0 +1,117 @@
+"""
+Memory and embedding throughput of the prefork server (main.py) by
+worker count.
+
+    python -m benchmarks.bench_prefork --workers 1 2 4 --clients 16
+
+For each count the server is started on `--port`, loaded with `--clients`
+concurrent /embbed requests (distinct texts, so the query cache does not
+answer them) for `--seconds`, and the proportional set size (PSS) of the
+master and its workers is summed: pages shared copy-on-write, like the
+model weights, are counted once. Linux only.
+"""
+
+import argparse
+import itertools
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from typing import List
+
+import httpx
+
+from benchmarks.bench_startup import poll
+from benchmarks.common import emit, percentiles
+
+TEXT = "prefork throughput benchmark sentence number {} about vector search latency"
+
+
+def pss_bytes(pid: int) -> int:
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def children(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def load(base: str, clients: int, seconds: float) -> dict:
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    lock = threading.Lock()
+
+    def client():
+        nonlocal errors
+        with httpx.Client(base_url=base, timeout=60) as http:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = http.post("/embbed", params={"text": TEXT.format(next(counter))})
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if response.status_code == 200:
+                        latencies.append(elapsed)
+                    else:
+                        errors += 1
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "requests_per_sec": len(latencies) / seconds,
+        "errors": errors,
+        "latency": percentiles(latencies),
+    }
+
+
+def run(workers: int, args) -> dict:
+    base = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "main.py", "--workers", str(workers), "--port", str(args.port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.perf_counter() + args.timeout
+        if poll(lambda: httpx.get(base + "/health/ready"), deadline) is None:
+            raise RuntimeError("server did not become ready")
+        while len(children(server.pid)) < workers and time.perf_counter() < deadline:
+            time.sleep(0.1)
+        result = load(base, args.clients, args.seconds)
+        processes = [server.pid, *children(server.pid)]
+        result["pss_mb"] = sum(pss_bytes(pid) for pid in processes) / (1024 * 1024)
+        result["processes"] = len(processes)
+        return result
+    finally:
+        os.kill(server.pid, signal.SIGTERM)
+        server.wait()
+
+
+def main(args):
+    results = {str(workers): run(workers, args) for workers in args.workers}
+    emit(
+        "prefork",
+        {"clients": args.clients, "seconds": args.seconds, "workers": results},
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="write the JSON report here")
+    main(parser.parse_args())
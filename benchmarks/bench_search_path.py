@@ -0,0 +1,117 @@
+"""
+Per-query overhead of the SQLAlchemy search path
+(VectorService.query_similar_chunks) against the raw asyncpg path
+(VectorService.query_similar_chunks_fast) on the same corpus and plans.
+
+    python -m benchmarks.bench_search_path --docs 200 --queries 500
+
+Also checks that both paths return the same chunk ids.
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from app.core.database import AsyncSessionLocal, init_db
+from app.core.search_pool import search_pool
+from app.services.embeddings import VectorService
+from benchmarks.common import emit, percentiles
+from benchmarks.corpus import SyntheticCorpus
+
+
+async def sqlalchemy_path(queries, filters, strategy, concurrency):
+    pending, latencies, results = list(enumerate(queries)), [], {}
+
+    async def worker():
+        async with AsyncSessionLocal() as session:
+            while pending:
+                i, q = pending.pop()
+                start = time.perf_counter()
+                hits = await VectorService.query_similar_chunks(
+                    session, q, top_k=10, strategy=strategy, **filters
+                )
+                latencies.append(time.perf_counter() - start)
+                results[i] = [h["id"] for h in hits]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, results, time.perf_counter() - start
+
+
+async def asyncpg_path(queries, filters, strategy, concurrency):
+    pending, latencies, results = list(enumerate(queries)), [], {}
+
+    async def worker():
+        while pending:
+            i, q = pending.pop()
+            start = time.perf_counter()
+            hits = await VectorService.query_similar_chunks_fast(
+                q, top_k=10, strategy=strategy, **filters
+            )
+            latencies.append(time.perf_counter() - start)
+            results[i] = [h["id"] for h in hits]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, results, time.perf_counter() - start
+
+
+async def compare(queries, filters, strategy, concurrency) -> dict:
+    report = {}
+    ids = {}
+    for name, path in (("sqlalchemy", sqlalchemy_path), ("asyncpg", asyncpg_path)):
+        await path(queries[:10], filters, strategy, concurrency)  # warm up
+        latencies, ids[name], elapsed = await path(queries, filters, strategy, concurrency)
+        report[name] = {
+            "qps": len(latencies) / elapsed,
+            "latency": percentiles(latencies),
+        }
+    saved = report["sqlalchemy"]["latency"]["mean_ms"] - report["asyncpg"]["latency"]["mean_ms"]
+    report["mean_overhead_saved_ms"] = saved
+    report["mean_overhead_saved_pct"] = 100 * saved / report["sqlalchemy"]["latency"]["mean_ms"]
+    report["same_results"] = ids["sqlalchemy"] == ids["asyncpg"]
+    return report
+
+
+async def main(args):
+    await init_db()
+    await search_pool.start()
+    corpus = SyntheticCorpus(
+        docs=args.docs, chunks_per_doc=args.chunks_per_doc, tenants=args.tenants
+    )
+    queries = list(corpus.queries(args.queries).astype(np.float32))
+    async with AsyncSessionLocal() as session:
+        await corpus.load(session)
+    try:
+        cases = {
+            "unfiltered": ({}, None),
+            "one_tenant": ({"owner_id": corpus.owner_of(0)}, None),
+            "one_tenant_filtered_hnsw": ({"owner_id": corpus.owner_of(0)}, "filtered"),
+            "few_documents": ({"document_ids": corpus.document_ids[:3]}, None),
+        }
+        results = {
+            name: {
+                str(concurrency): await compare(queries, filters, strategy, concurrency)
+                for concurrency in args.concurrency
+            }
+            for name, (filters, strategy) in cases.items()
+        }
+    finally:
+        async with AsyncSessionLocal() as session:
+            await corpus.drop(session)
+        await search_pool.stop()
+
+    emit("search_path", {"rows": corpus.rows, "cases": results}, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--chunks-per-doc", type=int, default=100)
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--output", help="write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
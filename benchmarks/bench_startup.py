@@ -0,0 +1,109 @@
+"""
+Cold-start timings of the API server: the import time of app.main, and
+the time from launching `uvicorn app.main:app` until it accepts requests
+(/health/live), answers a first /query, and reports ready (/health/ready).
+
+    python -m benchmarks.bench_startup --runs 3
+
+The server uses the current environment (DB_URL and so on) and listens on
+`--port`, which must be free. The first query is sent as soon as the
+server accepts connections, so it includes waiting for the model. Each
+figure is the median over `--runs` fresh processes.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from typing import Optional
+
+import httpx
+
+from benchmarks.common import emit
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def import_seconds() -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], check=True, capture_output=True, text=True
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def poll(request, deadline: float) -> Optional[float]:
+    """Seconds until `request()` returns a 200 response, None past `deadline`."""
+    while time.perf_counter() < deadline:
+        try:
+            if request().status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def server_run(port: int, timeout: float) -> dict:
+    base = f"http://127.0.0.1:{port}"
+    client = httpx.Client(base_url=base, timeout=timeout)
+    started = time.perf_counter()
+    deadline = started + timeout
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        # Trees without /health/live are only reachable once fully started.
+        live = poll(lambda: client.get("/openapi.json"), deadline)
+        first_query = poll(
+            lambda: client.post("/query", json={"query": "cold start", "doc_ids": [0]}),
+            deadline,
+        )
+        ready = poll(lambda: client.get("/health/ready"), min(deadline, time.perf_counter() + 5))
+    finally:
+        server.terminate()
+        server.wait()
+        client.close()
+
+    def since_start(t: Optional[float]) -> Optional[float]:
+        return None if t is None else t - started
+
+    return {
+        "live": since_start(live),
+        "first_query": since_start(first_query),
+        "ready": since_start(ready),
+    }
+
+
+def median(values) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+
+def main(args):
+    imports = [import_seconds() for _ in range(args.runs)]
+    runs = [server_run(args.port, args.timeout) for _ in range(args.runs)]
+    emit(
+        "startup",
+        {
+            "runs": args.runs,
+            "import_seconds": median(imports),
+            "seconds_to": {key: median(run[key] for run in runs) for key in runs[0]},
+            "samples": runs,
+        },
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="write the JSON report here")
+    main(parser.parse_args())
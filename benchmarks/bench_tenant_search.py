@@ -0,0 +1,82 @@
+"""
+Owner-filtered search latency as the corpus grows with other tenants.
+
+    CHUNK_PARTITIONING=list python -m benchmarks.bench_tenant_search
+
+Loads one tenant, measures its queries, then keeps adding tenants of the
+same size and measures the first tenant again after each step. Run it
+against an empty database once per CHUNK_PARTITIONING value to compare.
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, init_db
+from app.services.embeddings import VectorService
+from benchmarks.common import emit, percentiles, recall_at_k
+from benchmarks.corpus import OWNER_BASE, SyntheticCorpus
+
+
+async def measure(session, owner_id, queries, top_k) -> dict:
+    found, truth, latencies = [], [], []
+    for q in queries:
+        start = time.perf_counter()
+        hits = await VectorService.query_similar_chunks(
+            session, q, top_k=top_k, owner_id=owner_id
+        )
+        latencies.append(time.perf_counter() - start)
+        found.append([h["id"] for h in hits])
+        exact = await VectorService.query_similar_chunks(
+            session, q, top_k=top_k, owner_id=owner_id, strategy="exact"
+        )
+        truth.append([h["id"] for h in exact])
+    return {"recall_at_k": recall_at_k(found, truth), "latency": percentiles(latencies)}
+
+
+async def main(args):
+    await init_db()
+    corpora = []
+    steps = []
+    try:
+        for step in range(args.steps):
+            # Each step adds `tenants_per_step` tenants of `docs` documents.
+            corpus = SyntheticCorpus(
+                docs=args.docs * args.tenants_per_step,
+                chunks_per_doc=args.chunks_per_doc,
+                tenants=args.tenants_per_step,
+                seed=step,
+                owner_base=OWNER_BASE + step * args.tenants_per_step,
+            )
+            async with AsyncSessionLocal() as session:
+                await corpus.load(session)
+            corpora.append(corpus)
+
+            owner_id = corpora[0].owner_of(0)
+            queries = corpora[0].queries(args.queries)
+            async with AsyncSessionLocal() as session:
+                result = await measure(session, owner_id, queries, args.top_k)
+            steps.append({"total_rows": sum(c.rows for c in corpora), **result})
+    finally:
+        async with AsyncSessionLocal() as session:
+            for corpus in corpora:
+                await corpus.drop(session)
+
+    emit(
+        "tenant_search",
+        {"partitioning": settings.CHUNK_PARTITIONING or "none", "steps": steps},
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=100, help="documents per tenant")
+    parser.add_argument("--chunks-per-doc", type=int, default=100)
+    parser.add_argument("--tenants-per-step", type=int, default=2)
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=30)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,72 @@
+"""
+Compare the INSERT and binary COPY write paths of VectorService.upsert_chunks.
+
+    python -m benchmarks.bench_upsert --rows 10000 100000 1000000
+
+Needs DB_URL pointing at a Postgres with pgvector. Rows are written under a
+throwaway document that is dropped afterwards.
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import text as sql_text
+
+from app.core.database import AsyncSessionLocal, init_db
+from app.schema.document import DocumentCreate
+from app.services.document import DocumentService
+from app.services.embeddings import VectorService
+from benchmarks.common import emit, random_embeddings, timed
+
+# Roughly the size of a real 800-character chunk.
+CHUNK_TEXT = ("lorem ipsum dolor sit amet " * 30).strip()
+
+
+async def bench_method(method: str, rows: int, batch_size: int) -> dict:
+    async with AsyncSessionLocal() as session:
+        document = await DocumentService.create(
+            session, DocumentCreate(title=f"bench-upsert-{method}")
+        )
+        elapsed = 0.0
+        try:
+            for start in range(0, rows, batch_size):
+                n = min(batch_size, rows - start)
+                vectors = random_embeddings(n, seed=start)
+                with timed() as t:
+                    await VectorService.upsert_chunks(
+                        session,
+                        document_id=document.id,
+                        owner_id=None,
+                        chunks=[f"{CHUNK_TEXT} {start + i}" for i in range(n)],
+                        embeddings=vectors,
+                        start_index=start,
+                        method=method,
+                    )
+                elapsed += t["seconds"]
+        finally:
+            await session.execute(
+                sql_text("DELETE FROM documents WHERE id = :id"), {"id": document.id}
+            )
+            await session.commit()
+
+    return {"rows": rows, "seconds": elapsed, "rows_per_sec": rows / elapsed}
+
+
+async def main(args):
+    await init_db()
+    results = {}
+    for rows in args.rows:
+        for method in args.methods:
+            results[f"{method}/{rows}"] = await bench_method(
+                method, rows, args.batch_size
+            )
+    emit("upsert", results, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--methods", nargs="+", default=["insert", "copy"])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--output", help="write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
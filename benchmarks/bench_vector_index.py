@@ -0,0 +1,123 @@
+"""
+Index size, build time, query latency and recall@k of each
+VECTOR_INDEX_MODE (full, halfvec, binary) on a synthetic corpus.
+
+    python -m benchmarks.bench_vector_index --docs 1000 --chunks-per-doc 100
+
+Each mode's index is built from scratch on the same rows; recall is
+measured against exact search. The configured mode's index is recreated
+at the end. Compact modes need pgvector >= 0.7 and are skipped otherwise.
+"""
+
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text as sql_text
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine, init_db
+from app.core.vector_index import FULL, INDEX_NAMES, MODES, create_vector_index
+from app.services.embeddings import VectorService
+from benchmarks.common import emit, percentiles, recall_at_k
+from benchmarks.corpus import SyntheticCorpus
+
+
+async def drop_vector_indexes():
+    async with engine.begin() as conn:
+        for name in INDEX_NAMES.values():
+            await conn.execute(sql_text(f"DROP INDEX IF EXISTS {name}"))
+
+
+async def pgvector_version() -> tuple:
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            sql_text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        )
+        return tuple(int(part) for part in result.scalar_one().split("."))
+
+
+async def search(session, queries, top_k, strategy=None):
+    found, latencies = [], []
+    for q in queries:
+        start = time.perf_counter()
+        hits = await VectorService.query_similar_chunks(
+            session, q, top_k=top_k, strategy=strategy
+        )
+        latencies.append(time.perf_counter() - start)
+        found.append([h["id"] for h in hits])
+    return found, latencies
+
+
+async def bench_mode(mode, queries, top_k, truth) -> dict:
+    await drop_vector_indexes()
+    start = time.perf_counter()
+    async with engine.begin() as conn:
+        await create_vector_index(conn, mode)
+    build_s = time.perf_counter() - start
+
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            sql_text("SELECT pg_relation_size(CAST(:name AS regclass))"),
+            {"name": INDEX_NAMES[mode]},
+        )
+        index_bytes = result.scalar_one()
+
+    settings.VECTOR_INDEX_MODE = mode
+    async with AsyncSessionLocal() as session:
+        await search(session, queries[:5], top_k)  # warm the index
+        found, latencies = await search(session, queries, top_k)
+    return {
+        "index_bytes": index_bytes,
+        "build_s": build_s,
+        "recall_at_k": recall_at_k(found, truth),
+        "latency": percentiles(latencies),
+    }
+
+
+async def main(args):
+    await init_db()
+    configured_mode = settings.VECTOR_INDEX_MODE
+    modes = MODES
+    if await pgvector_version() < (0, 7):
+        modes = (FULL,)
+
+    corpus = SyntheticCorpus(docs=args.docs, chunks_per_doc=args.chunks_per_doc)
+    queries = corpus.queries(args.queries)
+    results = {}
+    async with AsyncSessionLocal() as session:
+        await corpus.load(session)
+    try:
+        async with AsyncSessionLocal() as session:
+            truth, _ = await search(session, queries, args.top_k, strategy="exact")
+        for mode in modes:
+            results[mode] = await bench_mode(mode, queries, args.top_k, truth)
+    finally:
+        settings.VECTOR_INDEX_MODE = configured_mode
+        async with AsyncSessionLocal() as session:
+            await corpus.drop(session)
+        await drop_vector_indexes()
+        async with engine.begin() as conn:
+            await create_vector_index(conn, configured_mode)
+
+    emit(
+        "vector_index",
+        {
+            "rows": corpus.rows,
+            "top_k": args.top_k,
+            "rerank_oversample": settings.VECTOR_RERANK_OVERSAMPLE,
+            "skipped": [mode for mode in MODES if mode not in modes],
+            "modes": results,
+        },
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--chunks-per-doc", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
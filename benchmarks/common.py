@@ -0,0 +1,70 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional
+
+import numpy as np
+
+from app.models import EMBEDDING_DIM
+
+
+def random_embeddings(n: int, dim: int = EMBEDDING_DIM, seed: int = 0) -> np.ndarray:
+    """Unit-norm float32 vectors, like the ones the embedding model produces."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def percentiles(samples: List[float]) -> dict:
+    """p50/p95/p99/mean of `samples` (seconds), reported in milliseconds."""
+    if not samples:
+        return {}
+    arr = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+    }
+
+
+@contextmanager
+def timed() -> Iterator[dict]:
+    """Measure the wall-clock time of a block into `result["seconds"]`."""
+    result: dict = {}
+    start = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result["seconds"] = time.perf_counter() - start
+
+
+def emit(name: str, results: dict, output: Optional[str] = None) -> None:
+    """Write a benchmark report as JSON to `output` or stdout."""
+    report = {
+        "benchmark": name,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+def recall_at_k(results: List[List], truth: List[List]) -> float:
+    """Mean fraction of the exact top-k ids found by the approximate search."""
+    if not truth:
+        return 0.0
+    scores = [
+        len(set(found) & set(expected)) / len(expected)
+        for found, expected in zip(results, truth)
+        if expected
+    ]
+    return float(np.mean(scores)) if scores else 0.0
@@ -0,0 +1,129 @@
+"""Synthetic documents, chunks and vectors for benchmarks."""
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.document_index import refresh_document_embeddings
+from app.core.partitioning import partition_manager
+from app.services.embeddings import ChunkIds, VectorService
+from benchmarks.common import EMBEDDING_DIM
+
+# Owner ids used by benchmark tenants, far away from real ones.
+OWNER_BASE = 9_000_000_000
+
+VOCABULARY = (
+    "the a of to and in is for on with as by retrieval vector index chunk "
+    "embedding latency throughput postgres document query recall tenant "
+    "partition cache worker batch stream model search result token page "
+    "server request response storage memory cluster replica schema table"
+).split()
+
+
+@dataclass
+class SyntheticCorpus:
+    """
+    `docs` documents of `chunks_per_doc` chunks, spread round-robin over
+    `tenants` owners. Vectors are clustered per document so nearest
+    neighbours are not uniformly random.
+    """
+
+    docs: int = 1000
+    chunks_per_doc: int = 100
+    tenants: int = 4
+    dim: int = EMBEDDING_DIM
+    seed: int = 0
+    owner_base: int = OWNER_BASE
+    document_ids: List[int] = field(default_factory=list)
+    owners: Dict[int, int] = field(default_factory=dict)
+
+    @property
+    def rows(self) -> int:
+        return self.docs * self.chunks_per_doc
+
+    def owner_of(self, doc_number: int) -> int:
+        return self.owner_base + doc_number % self.tenants
+
+    def vectors(self, doc_number: int) -> np.ndarray:
+        rng = np.random.default_rng((self.seed, doc_number))
+        center = rng.standard_normal(self.dim, dtype=np.float32)
+        vectors = center + 0.8 * rng.standard_normal(
+            (self.chunks_per_doc, self.dim), dtype=np.float32
+        )
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors
+
+    def texts(self, doc_number: int) -> List[str]:
+        return [
+            f"synthetic document {doc_number} chunk {i} " + "lorem ipsum " * 60
+            for i in range(self.chunks_per_doc)
+        ]
+
+    def document_text(self, doc_number: int, paragraphs: int = 20) -> str:
+        """Plain-text document of `paragraphs` paragraphs of pseudo-random prose."""
+        rng = np.random.default_rng((self.seed, doc_number, 2))
+        out = []
+        for _ in range(paragraphs):
+            sentences = []
+            for _ in range(int(rng.integers(3, 8))):
+                words = rng.choice(VOCABULARY, size=int(rng.integers(8, 20)))
+                sentences.append(" ".join(words).capitalize() + ".")
+            out.append(" ".join(sentences))
+        return "\n\n".join(out)
+
+    def queries(self, n: int) -> np.ndarray:
+        rng = np.random.default_rng((self.seed, self.docs, 1))
+        picks = rng.integers(0, self.docs, size=n)
+        queries = np.stack([self.vectors(int(d))[0] for d in picks])
+        queries += 0.3 * rng.standard_normal(queries.shape, dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        return queries
+
+    async def create_document(self, session: AsyncSession, doc_number: int) -> int:
+        """Insert the `documents` row of `doc_number`; `drop` removes it."""
+        owner_id = self.owner_of(doc_number)
+        await partition_manager.ensure_owner(session, owner_id)
+        result = await session.execute(
+            sql_text(
+                "INSERT INTO documents (owner_id, title) "
+                "VALUES (:owner_id, :title) RETURNING id"
+            ),
+            {"owner_id": owner_id, "title": f"bench-{doc_number}"},
+        )
+        document_id = result.scalar_one()
+        self.document_ids.append(document_id)
+        self.owners[document_id] = owner_id
+        return document_id
+
+    async def load(self, session: AsyncSession, method: str = "copy") -> None:
+        """Insert the corpus and ANALYZE so planner estimates are realistic."""
+        for doc_number in range(self.docs):
+            document_id = await self.create_document(session, doc_number)
+            owner_id = self.owners[document_id]
+
+            ids = ChunkIds(document_id)
+            rows = [
+                (ids.next(text), document_id, owner_id, i, text, vector)
+                for i, (text, vector) in enumerate(
+                    zip(self.texts(doc_number), self.vectors(doc_number))
+                )
+            ]
+            await VectorService.write_chunk_rows(session, rows, method)
+            await refresh_document_embeddings(session, [document_id])
+            await session.commit()
+
+        await session.execute(sql_text("ANALYZE chunks"))
+        await session.execute(sql_text("ANALYZE document_embeddings"))
+        await session.commit()
+
+    async def drop(self, session: AsyncSession) -> None:
+        await session.execute(
+            sql_text("DELETE FROM documents WHERE id = ANY(:ids)"),
+            {"ids": self.document_ids},
+        )
+        await session.commit()
+        self.document_ids.clear()
+        self.owners.clear()
@@ -0,0 +1,250 @@
+"""
+Retrieval benchmark suite.
+
+    python -m benchmarks.run --docs 1000 --chunks-per-doc 100 --tenants 4 \\
+        --output results/$(git rev-parse --short HEAD).json
+
+Sections (select with --sections):
+
+- chunking:  ChunkService.iter_chunks throughput on synthetic documents
+             (loads the model's tokenizer).
+- embedding: EmbeddingService.embbed_doc throughput (loads the model).
+- upsert:    VectorService.upsert_chunks rows/sec for the configured method.
+- query:     query_similar_chunks / query_similar_documents latency
+             percentiles and throughput at each --concurrency level.
+- recall:    recall@k of the planned (HNSW) search against exact search.
+
+The query and recall sections run against a synthetic corpus loaded into
+DB_URL and removed afterwards. The report is one JSON document, so runs
+can be diffed over time.
+"""
+
+import argparse
+import asyncio
+import platform
+import subprocess
+import time
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, init_db
+from app.core.embedding import embbed_model, embedding_engine
+from app.services.chunk_service import ChunkService
+from app.services.embeddings import EmbeddingService, VectorService
+from benchmarks.common import emit, percentiles, random_embeddings, recall_at_k, timed
+from benchmarks.corpus import SyntheticCorpus
+
+SECTIONS = ["chunking", "embedding", "upsert", "query", "recall"]
+
+
+def bench_chunking(corpus: SyntheticCorpus, docs: int) -> dict:
+    texts = [corpus.document_text(n) for n in range(docs)]
+    chunks = 0
+    with timed() as t:
+        for text in texts:
+            chunks += sum(1 for _ in ChunkService.iter_chunks([text]))
+    chars = sum(len(text) for text in texts)
+    return {
+        "documents": docs,
+        "chunks": chunks,
+        "seconds": t["seconds"],
+        "chars_per_sec": chars / t["seconds"],
+        "chunks_per_sec": chunks / t["seconds"],
+    }
+
+
+async def bench_embedding(corpus: SyntheticCorpus, docs: int) -> dict:
+    chunks = [
+        chunk
+        for n in range(docs)
+        for chunk in ChunkService.iter_chunks([corpus.document_text(n)])
+    ]
+    embbed_model.init()
+    await embedding_engine.start()
+    try:
+        await EmbeddingService.embbed_doc(chunks[: settings.EMBED_MAX_BATCH_SIZE])
+        with timed() as t:
+            await EmbeddingService.embbed_doc(chunks)
+    finally:
+        await embedding_engine.stop()
+    return {
+        "model": embbed_model.backend.name,
+        "chunks": len(chunks),
+        "seconds": t["seconds"],
+        "chunks_per_sec": len(chunks) / t["seconds"],
+    }
+
+
+async def bench_upsert(corpus: SyntheticCorpus, rows: int, batch_size: int) -> dict:
+    text = corpus.texts(0)[0]
+    async with AsyncSessionLocal() as session:
+        document_id = await corpus.create_document(session, corpus.docs)
+        await session.commit()
+        elapsed = 0.0
+        try:
+            for start in range(0, rows, batch_size):
+                n = min(batch_size, rows - start)
+                with timed() as t:
+                    await VectorService.upsert_chunks(
+                        session,
+                        document_id=document_id,
+                        owner_id=corpus.owners[document_id],
+                        chunks=[f"{text} {start + i}" for i in range(n)],
+                        embeddings=random_embeddings(n, seed=start),
+                        start_index=start,
+                    )
+                elapsed += t["seconds"]
+        finally:
+            await corpus.drop(session)
+    return {
+        "method": settings.UPSERT_METHOD,
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_sec": rows / elapsed,
+    }
+
+
+async def run_concurrently(concurrency: int, queries, search) -> dict:
+    """Run `search(session, q)` for every query over `concurrency` sessions."""
+    pending = list(queries)
+    latencies = []
+
+    async def worker():
+        async with AsyncSessionLocal() as session:
+            while pending:
+                q = pending.pop()
+                start = time.perf_counter()
+                await search(session, q)
+                latencies.append(time.perf_counter() - start)
+
+    with timed() as t:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {
+        "concurrency": concurrency,
+        "qps": len(latencies) / t["seconds"],
+        "latency": percentiles(latencies),
+    }
+
+
+async def bench_query(corpus: SyntheticCorpus, args) -> dict:
+    queries = corpus.queries(args.queries)
+    owner_id = corpus.owner_of(0)
+    searches = {
+        "chunks": lambda s, q: VectorService.query_similar_chunks(s, q, top_k=args.top_k),
+        "chunks_by_owner": lambda s, q: VectorService.query_similar_chunks(
+            s, q, top_k=args.top_k, owner_id=owner_id
+        ),
+        "documents": lambda s, q: VectorService.query_similar_documents(s, q),
+    }
+    results = {}
+    for name, search in searches.items():
+        await run_concurrently(1, queries[:5], search)  # warm up
+        results[name] = [
+            await run_concurrently(concurrency, queries, search)
+            for concurrency in args.concurrency
+        ]
+    return results
+
+
+async def bench_recall(corpus: SyntheticCorpus, args) -> dict:
+    queries = corpus.queries(args.queries)
+    results = {}
+    for name, owner_id in (("all", None), ("by_owner", corpus.owner_of(0))):
+        found, truth = [], []
+        async with AsyncSessionLocal() as session:
+            for q in queries:
+                hits = await VectorService.query_similar_chunks(
+                    session, q, top_k=args.top_k, owner_id=owner_id
+                )
+                exact = await VectorService.query_similar_chunks(
+                    session, q, top_k=args.top_k, owner_id=owner_id, strategy="exact"
+                )
+                found.append([h["id"] for h in hits])
+                truth.append([h["id"] for h in exact])
+        results[name] = recall_at_k(found, truth)
+    return {"k": args.top_k, "recall_at_k": results}
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "settings": {
+            key: getattr(settings, key)
+            for key in (
+                "UPSERT_METHOD",
+                "VECTOR_INDEX_MODE",
+                "CHUNK_PARTITIONING",
+                "HNSW_EF_SEARCH",
+                "EMBED_MAX_BATCH_SIZE",
+                "EMBED_WORKERS",
+            )
+        },
+    }
+
+
+async def main(args):
+    corpus = SyntheticCorpus(
+        docs=args.docs, chunks_per_doc=args.chunks_per_doc, tenants=args.tenants
+    )
+    results: dict = {
+        "environment": environment(),
+        "corpus": {
+            "docs": corpus.docs,
+            "chunks_per_doc": corpus.chunks_per_doc,
+            "tenants": corpus.tenants,
+            "rows": corpus.rows,
+        },
+    }
+
+    if "chunking" in args.sections:
+        results["chunking"] = bench_chunking(corpus, args.text_docs)
+    if "embedding" in args.sections:
+        results["embedding"] = await bench_embedding(corpus, args.text_docs)
+
+    if {"upsert", "query", "recall"} & set(args.sections):
+        await init_db()
+    if "upsert" in args.sections:
+        results["upsert"] = await bench_upsert(corpus, args.upsert_rows, args.batch_size)
+
+    if {"query", "recall"} & set(args.sections):
+        async with AsyncSessionLocal() as session:
+            with timed() as t:
+                await corpus.load(session)
+        results["corpus"]["load_seconds"] = t["seconds"]
+        try:
+            if "query" in args.sections:
+                results["query"] = await bench_query(corpus, args)
+            if "recall" in args.sections:
+                results["recall"] = await bench_recall(corpus, args)
+        finally:
+            async with AsyncSessionLocal() as session:
+                await corpus.drop(session)
+
+    emit("retrieval", results, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=SECTIONS)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--chunks-per-doc", type=int, default=100)
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument(
+        "--text-docs", type=int, default=50, help="documents chunked and embedded"
+    )
+    parser.add_argument("--upsert-rows", type=int, default=50_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
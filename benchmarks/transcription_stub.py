@@ -0,0 +1,31 @@
+"""
+Local stand-in for the Groq transcription API.
+
+    uvicorn benchmarks.transcription_stub:app --port 8100
+    GROQ_TRANSCRIPTION_URL=http://127.0.0.1:8100/openai/v1/audio/transcriptions
+
+Each request sleeps STUB_LATENCY_SEC per MB of audio (minimum 0.2 s), fails
+with a 503 at STUB_FAILURE_RATE to exercise retries and answers with a
+transcript naming the upload's size.
+"""
+
+import asyncio
+import os
+import random
+
+from fastapi import FastAPI, File, Form, UploadFile
+from fastapi.responses import JSONResponse
+
+LATENCY_SEC_PER_MB = float(os.environ.get("STUB_LATENCY_SEC", "1.0"))
+FAILURE_RATE = float(os.environ.get("STUB_FAILURE_RATE", "0.0"))
+
+app = FastAPI()
+
+
+@app.post("/openai/v1/audio/transcriptions")
+async def transcribe(file: UploadFile = File(...), model: str = Form(...)):
+    size = len(await file.read())
+    await asyncio.sleep(max(0.2, LATENCY_SEC_PER_MB * size / (1024 * 1024)))
+    if random.random() < FAILURE_RATE:
+        return JSONResponse({"error": "overloaded"}, status_code=503)
+    return {"text": f"{model} transcript of {size} bytes"}
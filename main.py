@@ -1,6 +1,6 @@
-def main():
-    print("Hello from rag!")
+"""Production entry point: the prefork API server (see app/server.py)."""
 
+from app.server import main
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,167 @@
+"""
+Shared fixtures.
+
+Most tests run against Postgres with pgvector. Point TEST_DB_URL at a
+database they may wipe, e.g.
+
+    TEST_DB_URL=postgresql+asyncpg://postgres@localhost/context_machine_test pytest
+
+Without it those tests are skipped. The embedding model is replaced by a
+deterministic bag-of-words embedder, so no model is downloaded.
+"""
+
+import hashlib
+import io
+import os
+import re
+from types import SimpleNamespace
+from typing import List, Optional
+
+import pytest
+
+TEST_DB_URL = os.environ.get("TEST_DB_URL")
+
+# Settings are read on import, so these go first.
+os.environ["DB_URL"] = TEST_DB_URL or "postgresql+asyncpg://localhost/unused"
+os.environ.setdefault("GROQ_API", "test")
+
+import numpy as np  # noqa: E402
+from fastapi import UploadFile  # noqa: E402
+from sqlalchemy import text as sql_text  # noqa: E402
+from starlette.datastructures import Headers  # noqa: E402
+from tokenizers import Tokenizer  # noqa: E402
+from tokenizers.models import WordLevel  # noqa: E402
+from tokenizers.pre_tokenizers import BertPreTokenizer  # noqa: E402
+
+from app.core import embedding  # noqa: E402
+from app.core.embedding import embbed_model, embedding_engine, query_embedding_cache  # noqa: E402
+from app.core.result_cache import result_cache  # noqa: E402
+from app.services.search_planner import search_planner  # noqa: E402
+
+TABLES = "documents, chunks, document_embeddings, ingest_jobs, embedding_migrations"
+
+
+class BagOfWordsEmbedding:
+    """
+    Stands in for fastembed's TextEmbedding: each word hashes to one
+    dimension, so texts sharing words are near each other. Its tokenizer
+    counts words and punctuation as tokens.
+    """
+
+    def __init__(self, model_name: str, dim: int) -> None:
+        self.model_name = model_name
+        self.dim = dim
+        tokenizer = Tokenizer(WordLevel({"[UNK]": 0}, unk_token="[UNK]"))
+        tokenizer.pre_tokenizer = BertPreTokenizer()
+        self.model = SimpleNamespace(tokenizer=tokenizer)
+
+    def embed(self, texts: List[str], batch_size: int = 256, **kwargs):
+        for text in texts:
+            vector = np.zeros(self.dim, dtype=np.float32)
+            for word in re.findall(r"\w+", text.lower()):
+                digest = hashlib.md5(f"{self.model_name}:{word}".encode()).digest()
+                vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0
+            norm = np.linalg.norm(vector)
+            yield vector / norm if norm else np.full(self.dim, self.dim**-0.5, np.float32)
+
+
+def embed_text(text: str) -> np.ndarray:
+    """The active backend's test embedding of `text`."""
+    backend = embbed_model.backend
+    return next(BagOfWordsEmbedding(backend.model, backend.dim).embed([text]))
+
+
+def upload_file(
+    data: bytes, content_type: str = "text/plain", filename: str = "a.txt", sized: bool = True
+) -> UploadFile:
+    """An UploadFile as FastAPI hands it over; `sized=False` leaves its size unknown."""
+    return UploadFile(
+        io.BytesIO(data),
+        size=len(data) if sized else None,
+        filename=filename,
+        headers=Headers({"content-type": content_type}),
+    )
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def fake_embedding_model():
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(
+            embedding,
+            "load_text_embedding",
+            lambda backend: BagOfWordsEmbedding(backend.model, backend.dim),
+        )
+        embbed_model.embed_model = None
+        embbed_model.tokenizer = None
+        yield
+
+
+@pytest.fixture
+async def embedder():
+    """The embedding engine, started; stopped again unless it was already running."""
+    running = embedding_engine.running
+    await embedding_engine.start()
+    yield embedding_engine
+    if not running:
+        await embedding_engine.stop()
+
+
+@pytest.fixture(scope="session")
+async def database(fake_embedding_model):
+    if not TEST_DB_URL:
+        pytest.skip("TEST_DB_URL is not set")
+    from app.core.database import engine, init_db
+
+    await init_db()
+    await embedding_engine.start()
+    yield engine
+    await embedding_engine.stop()
+    await engine.dispose()
+
+
+@pytest.fixture
+async def db(database):
+    """A session on an empty database; everything it wrote is wiped afterwards."""
+    from app.core.database import AsyncSessionLocal
+
+    try:
+        async with AsyncSessionLocal() as session:
+            yield session
+    finally:
+        async with database.begin() as conn:
+            await conn.execute(sql_text(f"TRUNCATE {TABLES} RESTART IDENTITY CASCADE"))
+        result_cache._local.clear()
+        query_embedding_cache.clear()
+        search_planner._estimates.clear()
+
+
+@pytest.fixture
+async def fast_path(database):
+    """The asyncpg search pool, started."""
+    from app.core.search_pool import search_pool
+
+    await search_pool.start()
+    yield search_pool
+    await search_pool.stop()
+
+
+@pytest.fixture
+def make_document(db):
+    """Add a document with one chunk per text, embedded by the test model."""
+    from app.models import Document
+    from app.services.embeddings import EmbeddingService, VectorService
+
+    async def make(texts: List[str], owner_id: Optional[int] = None, title: str = "doc") -> int:
+        document = Document(title=title, owner_id=owner_id)
+        db.add(document)
+        await db.commit()
+        embeddings = await EmbeddingService.embbed_doc(texts)
+        await VectorService.upsert_chunks(db, document.id, owner_id, texts, embeddings)
+        return document.id
+
+    return make
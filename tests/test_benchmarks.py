@@ -0,0 +1,109 @@
+import argparse
+import json
+
+import numpy as np
+import pytest
+from sqlalchemy import text as sql_text
+
+from benchmarks import run
+from benchmarks.common import emit, percentiles, random_embeddings, recall_at_k, timed
+from benchmarks.corpus import SyntheticCorpus
+
+pytestmark = pytest.mark.anyio
+
+
+def test_recall_at_k():
+    assert recall_at_k([[1, 2], [3, 4]], [[1, 2], [3, 4]]) == 1.0
+    assert recall_at_k([[1, 9], [9, 9]], [[1, 2], [3, 4]]) == 0.25
+    # Queries without any true neighbour are left out.
+    assert recall_at_k([[1], []], [[1], []]) == 1.0
+    assert recall_at_k([], []) == 0.0
+
+
+def test_percentiles_are_reported_in_milliseconds():
+    report = percentiles([i / 1000 for i in range(1, 101)])
+    assert report["count"] == 100
+    assert report["mean_ms"] == pytest.approx(50.5)
+    assert report["p50_ms"] == pytest.approx(50.5)
+    assert report["p99_ms"] == pytest.approx(99.01)
+    assert percentiles([]) == {}
+
+
+def test_timed_records_even_when_the_block_fails():
+    with pytest.raises(ValueError):
+        with timed() as t:
+            raise ValueError
+    assert t["seconds"] >= 0
+
+
+def test_reports_are_json(tmp_path, capsys):
+    emit("unit", {"value": 1})
+    printed = json.loads(capsys.readouterr().out)
+    path = tmp_path / "report.json"
+    emit("unit", {"value": 1}, str(path))
+    written = json.loads(path.read_text())
+    for report in (printed, written):
+        assert report["benchmark"] == "unit" and report["results"] == {"value": 1}
+
+
+def test_random_embeddings_are_unit_vectors():
+    vectors = random_embeddings(10, dim=8, seed=3)
+    assert vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert np.array_equal(vectors, random_embeddings(10, dim=8, seed=3))
+
+
+def test_synthetic_corpus_is_deterministic_and_clustered():
+    corpus = SyntheticCorpus(docs=20, chunks_per_doc=5, tenants=3, dim=16)
+    assert corpus.rows == 100
+    assert [corpus.owner_of(n) - corpus.owner_base for n in range(4)] == [0, 1, 2, 0]
+    assert np.array_equal(corpus.vectors(4), SyntheticCorpus(dim=16).vectors(4)[:5])
+    # Chunks of one document are nearer each other than to another document's.
+    a, b = corpus.vectors(0), corpus.vectors(1)
+    assert (a @ a.T).mean() > (a @ b.T).mean() + 0.2
+    queries = corpus.queries(8)
+    assert queries.shape == (8, 16)
+    assert np.allclose(np.linalg.norm(queries, axis=1), 1.0)
+
+
+async def test_corpus_loads_and_drops(db):
+    corpus = SyntheticCorpus(docs=6, chunks_per_doc=4, tenants=2)
+    await corpus.load(db)
+    counts = await db.execute(
+        sql_text(
+            "SELECT (SELECT count(*) FROM chunks), "
+            "(SELECT count(DISTINCT document_id) FROM document_embeddings)"
+        )
+    )
+    assert tuple(counts.one()) == (24, 6)
+
+    await corpus.drop(db)
+    remaining = await db.execute(sql_text("SELECT count(*) FROM chunks"))
+    assert remaining.scalar_one() == 0 and corpus.document_ids == []
+
+
+async def test_suite_writes_one_report(db, tmp_path):
+    output = tmp_path / "report.json"
+    args = argparse.Namespace(
+        sections=["chunking", "upsert", "query", "recall"],
+        docs=8,
+        chunks_per_doc=10,
+        tenants=2,
+        text_docs=2,
+        upsert_rows=30,
+        batch_size=10,
+        queries=6,
+        concurrency=[1, 2],
+        top_k=5,
+        output=str(output),
+    )
+    await run.main(args)
+    results = json.loads(output.read_text())["results"]
+    assert results["chunking"]["chunks"] > 0
+    assert results["upsert"]["rows"] == 30
+    assert [r["concurrency"] for r in results["query"]["chunks"]] == [1, 2]
+    assert results["query"]["chunks_by_owner"][0]["latency"]["count"] == 6
+    assert results["recall"]["recall_at_k"]["all"] > 0.5
+    # The corpus was removed again.
+    remaining = await db.execute(sql_text("SELECT count(*) FROM documents"))
+    assert remaining.scalar_one() == 0
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from sqlalchemy import text as sql_text
+
+from app.models import Document, EMBEDDING_DIM
+from app.services import embeddings
+from app.services.embeddings import VectorService
+
+pytestmark = pytest.mark.anyio
+
+OWNER = 4
+METHODS = ["copy", "insert"]
+
+
+def vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, EMBEDDING_DIM), np.float32)
+
+
+async def new_document(db) -> int:
+    document = Document(title="doc", owner_id=OWNER)
+    db.add(document)
+    await db.commit()
+    return document.id
+
+
+async def stored(db, document_id: int) -> list:
+    result = await db.execute(
+        sql_text(
+            "SELECT id, owner_id, chunk_index, text, embedding::text AS embedding, "
+            "embedding_model FROM chunks WHERE document_id = :id ORDER BY chunk_index"
+        ),
+        {"id": document_id},
+    )
+    return [tuple(row) for row in result]
+
+
+async def test_copy_and_insert_write_the_same_rows(db):
+    texts = [f"chunk {i}" for i in range(50)]
+    rows = {}
+    for method in METHODS:
+        document_id = await new_document(db)
+        await VectorService.upsert_chunks(
+            db, document_id, OWNER, texts, vectors(50), method=method
+        )
+        # Ids start with the document id; compare what follows.
+        rows[method] = [
+            (id.split(":", 1)[1], *rest) for id, *rest in await stored(db, document_id)
+        ]
+    assert rows["copy"] == rows["insert"]
+    assert [text for _, _, _, text, _, _ in rows["copy"]] == texts
+
+
+@pytest.mark.parametrize("method", METHODS)
+async def test_upserts_replace_rows_with_the_same_id(db, method):
+    document_id = await new_document(db)
+    texts = ["alpha", "beta"]
+    await VectorService.upsert_chunks(db, document_id, OWNER, texts, vectors(2), method=method)
+    first = await stored(db, document_id)
+
+    await VectorService.upsert_chunks(
+        db, document_id, OWNER, texts[::-1], vectors(2, seed=1), method=method
+    )
+    second = await stored(db, document_id)
+    assert len(second) == 2
+    assert {row[0] for row in first} == {row[0] for row in second}
+    assert [row[3] for row in second] == ["beta", "alpha"]
+    assert second[0][4] != first[1][4]
+
+
+async def test_copy_can_run_several_times_in_one_transaction(db):
+    document_id = await new_document(db)
+    for batch in range(3):
+        texts = [f"batch {batch} chunk {i}" for i in range(10)]
+        await VectorService.upsert_chunks(
+            db,
+            document_id,
+            OWNER,
+            texts,
+            vectors(10, seed=batch),
+            start_index=10 * batch,
+            commit=False,
+            method="copy",
+        )
+    await db.commit()
+    assert [row[2] for row in await stored(db, document_id)] == list(range(30))
+
+
+async def test_insert_splits_batches_at_the_bind_parameter_limit(db, monkeypatch):
+    monkeypatch.setattr(embeddings, "_INSERT_MAX_ROWS", 7)
+    document_id = await new_document(db)
+    texts = [f"chunk {i}" for i in range(20)]
+    await VectorService.upsert_chunks(db, document_id, OWNER, texts, vectors(20), method="insert")
+    assert [row[3] for row in await stored(db, document_id)] == texts
+
+
+async def test_unknown_upsert_methods_are_rejected(db):
+    document_id = await new_document(db)
+    with pytest.raises(ValueError):
+        await VectorService.upsert_chunks(
+            db, document_id, OWNER, ["text"], vectors(1), method="merge"
+        )
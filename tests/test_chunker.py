@@ -0,0 +1,108 @@
+import asyncio
+import re
+import threading
+from typing import AsyncIterator, List
+
+import pytest
+
+from app.core.embedding import get_tokenizer
+from app.services.chunk_service import ChunkService, TokenChunker
+from app.services.ingest import IngestPipeline, IngestStats
+
+pytestmark = pytest.mark.anyio
+
+
+def tokens(text: str) -> int:
+    return len(get_tokenizer().encode(text, add_special_tokens=False).ids)
+
+
+def sentences(n: int, prefix: str = "Sentence") -> str:
+    return " ".join(f"{prefix} {i} has six tokens." for i in range(n))
+
+
+def split_sentences(text: str) -> List[str]:
+    return re.split(r"(?<=\.) ", text)
+
+
+def chunk(segments: List[str], **kwargs) -> List[str]:
+    return list(ChunkService.iter_chunks(segments, **kwargs))
+
+
+def test_chunks_stay_within_the_token_budget():
+    chunks = chunk([sentences(40)], max_tokens=32, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert all(tokens(c) <= 32 for c in chunks)
+    # Sentences are packed whole: 5 of 6 tokens per chunk.
+    assert chunks[0] == sentences(5)
+    assert " ".join(chunks) == sentences(40)
+
+
+def test_chunks_repeat_trailing_sentences_as_overlap():
+    chunks = chunk([sentences(20)], max_tokens=32, overlap_tokens=12)
+    assert all(tokens(c) <= 32 for c in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        # Two sentences fit the 12 overlap tokens.
+        assert split_sentences(current)[:2] == split_sentences(previous)[-2:]
+
+
+def test_an_oversized_sentence_is_cut_at_token_boundaries():
+    long = " ".join(f"w{i}" for i in range(70)) + "."
+    chunks = chunk([long], max_tokens=32, overlap_tokens=0)
+    assert [tokens(c) for c in chunks] == [32, 32, 7]
+    assert " ".join(chunks) == long
+
+
+def test_headings_start_a_chunk_with_their_section():
+    text = "\n\n".join(
+        [sentences(3), "# Setup", sentences(3, "Step"), "## Usage", sentences(2, "Use")]
+    )
+    chunks = chunk([text], max_tokens=32, overlap_tokens=0)
+    assert not any(c.endswith(("# Setup", "## Usage")) for c in chunks)
+    assert any(c.startswith("# Setup\n\nStep 0") for c in chunks)
+
+
+def test_code_fences_are_kept_whole():
+    code = "```python\ndef f(x):\n\n    return x\n```"
+    chunks = chunk([f"{sentences(2)}\n\n{code}\n\n{sentences(2)}"], max_tokens=64)
+    assert any(code in c for c in chunks)
+
+
+def test_paragraphs_split_across_segments_are_rejoined():
+    text = f"{sentences(6)}\n\n{sentences(6, 'Next')}"
+    cut = text.index("Next 2")
+    whole = chunk([text], max_tokens=48, overlap_tokens=8)
+    assert chunk([text[:cut], text[cut:]], max_tokens=48, overlap_tokens=8) == whole
+
+
+def test_overlap_must_be_smaller_than_the_budget():
+    with pytest.raises(ValueError):
+        TokenChunker(max_tokens=16, overlap_tokens=16)
+
+
+async def test_ingest_chunks_off_the_event_loop(monkeypatch):
+    loop_thread = threading.get_ident()
+    threads = set()
+    feed = TokenChunker.feed
+
+    def recording_feed(self, segment):
+        threads.add(threading.get_ident())
+        yield from feed(self, segment)
+
+    monkeypatch.setattr(TokenChunker, "feed", recording_feed)
+
+    async def pages() -> AsyncIterator[str]:
+        for page in range(3):
+            yield sentences(30, f"Page {page}") + "\n\n"
+
+    out: asyncio.Queue = asyncio.Queue()
+    stats = IngestStats()
+    await IngestPipeline()._chunk(1, pages(), out, stats)
+
+    assert threads and loop_thread not in threads
+    assert stats.seconds["chunk"] > 0
+
+    items = []
+    while (item := out.get_nowait()) is not None:
+        items.append(item)
+    assert [index for index, _, _ in items] == list(range(len(items)))
+    assert [text for _, _, text in items] == chunk([page async for page in pages()])
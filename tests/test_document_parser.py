@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import List
+
+import pytest
+
+from app.core.config import settings
+from app.core.parsing import ParsingExecutor, parsing_executor
+from app.services.document_parser import DocumentParserService, PDFParser
+from tests.conftest import upload_file
+
+pytestmark = pytest.mark.anyio
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """A minimal PDF with one line of Helvetica text per page."""
+    count = len(pages)
+    font = 3 + 2 * count
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>"
+        % (" ".join(f"{3 + 2 * i} 0 R" for i in range(count)), count),
+    ]
+    for i, text in enumerate(pages):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Contents {4 + 2 * i} 0 R /Resources << /Font << /F1 {font} 0 R >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    objects.append("<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n".encode()
+    out += f"startxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+PAGES = [f"Page number {n} says hello" for n in range(1, 8)]
+
+
+@pytest.fixture
+def record_pdf_tasks(monkeypatch):
+    """The `source` argument of every page-range task dispatched to the parsing pool."""
+    sources = []
+    run = parsing_executor.run
+
+    async def recording_run(kind, func, *args):
+        sources.append(args[0])
+        if isinstance(args[0], str):
+            assert os.path.exists(args[0])
+        return await run(kind, func, *args)
+
+    monkeypatch.setattr(parsing_executor, "run", recording_run)
+    monkeypatch.setattr(settings, "PDF_PAGES_PER_TASK", 2)
+    return sources
+
+
+async def test_pages_stream_in_order():
+    pages = [page async for page in PDFParser.iter_pages(make_pdf(PAGES))]
+    assert [number for number, _ in pages] == list(range(1, 8))
+    assert [text.strip() for _, text in pages] == PAGES
+
+
+async def test_in_memory_pdf_is_spooled_once_for_its_tasks(record_pdf_tasks):
+    pages = [page async for page in PDFParser.iter_pages(make_pdf(PAGES))]
+    assert len(pages) == 7
+
+    assert len(record_pdf_tasks) == 4
+    assert all(isinstance(source, str) for source in record_pdf_tasks)
+    assert len(set(record_pdf_tasks)) == 1
+    assert not os.path.exists(record_pdf_tasks[0])
+
+
+async def test_single_task_pdf_stays_in_memory(record_pdf_tasks):
+    pages = [page async for page in PDFParser.iter_pages(make_pdf(PAGES[:2]))]
+    assert len(pages) == 2
+    assert [type(source) for source in record_pdf_tasks] == [bytes]
+
+
+async def test_spool_file_is_removed_when_the_reader_stops_early(record_pdf_tasks):
+    pages = PDFParser.iter_pages(make_pdf(PAGES))
+    assert (await anext(pages))[0] == 1
+    await pages.aclose()
+    assert not os.path.exists(record_pdf_tasks[0])
+
+
+async def test_pages_are_extracted_in_worker_processes(monkeypatch):
+    monkeypatch.setattr(settings, "PDF_PAGES_PER_TASK", 3)
+    parsing_executor.start()
+    try:
+        text = await PDFParser.parse(make_pdf(PAGES))
+    finally:
+        parsing_executor.stop()
+    assert [line.strip() for line in text.split("\n") if line.strip()] == PAGES
+
+
+@pytest.fixture
+def slow_parser(monkeypatch):
+    """Text uploads take as many seconds to parse as their text says."""
+    parse_source = DocumentParserService.parse_source
+
+    async def delayed(source):
+        await asyncio.sleep(float(source.content))
+        return await parse_source(source)
+
+    monkeypatch.setattr(DocumentParserService, "parse_source", staticmethod(delayed))
+
+
+async def test_parse_multiple_streams_results_as_they_complete(slow_parser):
+    files = [
+        upload_file(b"0.3", filename="slow.txt"),
+        upload_file(b"0.0", filename="fast.txt"),
+        upload_file(b"0.1", filename="medium.txt"),
+    ]
+    start = time.perf_counter()
+    raw = [line async for line in DocumentParserService.parse_multiple(files)]
+    # Every record, the last one too, is a complete NDJSON line.
+    assert all(line.endswith(b"\n") and line.count(b"\n") == 1 for line in raw)
+    lines = [json.loads(line) for line in raw]
+    assert [line["file_name"] for line in lines] == ["fast.txt", "medium.txt", "slow.txt", ""]
+    assert [line["status"] for line in lines] == ["Success"] * 3 + ["Finished"]
+    # Parsed concurrently, not one after another.
+    assert time.perf_counter() - start < 0.35
+
+
+async def test_parse_multiple_reports_failures_per_file():
+    files = [
+        upload_file(b"\x00", content_type="application/zip", filename="a.zip"),
+        upload_file(b"hello", filename="a.txt"),
+    ]
+    lines = [json.loads(line) async for line in DocumentParserService.parse_multiple(files)]
+    results = {line["file_name"]: line for line in lines[:-1]}
+    assert results["a.zip"]["status"] == "Failed"
+    assert "Unsupported file type" in results["a.zip"]["error"]
+    assert results["a.txt"]["text"] == "hello"
+
+
+async def test_parsing_jobs_of_one_kind_are_capped():
+    executor = ParsingExecutor(max_workers=None, limits={"pdf": 2})
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def job(kind):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    await asyncio.gather(*(executor.run("pdf", job, "pdf") for _ in range(6)))
+    assert peak[0] == 2
+    peak[0] = 0
+    await asyncio.gather(*(executor.run("text", job, "text") for _ in range(6)))
+    assert peak[0] > 2
@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from sqlalchemy import text as sql_text
+
+from app.core.config import settings
+from app.core.document_index import refresh_document_embeddings
+from app.core.result_cache import result_cache
+from app.models import Document, EMBEDDING_DIM
+from app.services.embeddings import VectorService
+from app.services.search_planner import EXACT
+
+pytestmark = pytest.mark.anyio
+
+
+def unit(v: np.ndarray) -> np.ndarray:
+    return v / np.linalg.norm(v, axis=-1, keepdims=True)
+
+
+def around(center: np.ndarray, n: int, rng, spread: float = 0.5) -> np.ndarray:
+    """`n` unit vectors at about `spread` from the unit vector `center`."""
+    noise = unit(rng.standard_normal((n, EMBEDDING_DIM), np.float32))
+    return unit(center + spread * noise)
+
+
+@pytest.fixture
+def settings_for_routing(monkeypatch):
+    # Settings change between calls, so results must not come from the cache.
+    monkeypatch.setattr(result_cache, "enabled", False)
+    monkeypatch.setattr(settings, "DOC_SECTION_MIN_CHUNKS", 8)
+    monkeypatch.setattr(settings, "DOC_SECTION_CENTROIDS", 4)
+    return monkeypatch
+
+
+async def add_document(db, vectors: np.ndarray) -> int:
+    document = Document(title="doc")
+    db.add(document)
+    await db.commit()
+    await VectorService.upsert_chunks(
+        db, document.id, None, [f"chunk {i}" for i in range(len(vectors))], vectors
+    )
+    return document.id
+
+
+async def centroids(db, document_id: int) -> dict:
+    """{section: (chunk_count, embedding)}"""
+    result = await db.execute(
+        sql_text(
+            "SELECT section, chunk_count, embedding FROM document_embeddings "
+            "WHERE document_id = :id"
+        ),
+        {"id": document_id},
+    )
+    return {r.section: (r.chunk_count, np.asarray(r.embedding)) for r in result}
+
+
+async def test_documents_get_a_centroid_and_long_ones_section_centroids(
+    db, settings_for_routing
+):
+    rng = np.random.default_rng(0)
+    short_center, long_center = unit(rng.standard_normal((2, EMBEDDING_DIM), np.float32))
+    short_vectors, long_vectors = around(short_center, 4, rng), around(long_center, 16, rng)
+    short, long = await add_document(db, short_vectors), await add_document(db, long_vectors)
+
+    short_centroids = await centroids(db, short)
+    assert list(short_centroids) == [0]
+    count, embedding = short_centroids[0]
+    assert count == 4 and np.allclose(embedding, short_vectors.mean(axis=0), atol=1e-5)
+
+    long_centroids = await centroids(db, long)
+    assert sorted(long_centroids) == [0, 1, 2, 3, 4]
+    # Sections are contiguous runs of chunks.
+    assert np.allclose(long_centroids[2][1], long_vectors[4:8].mean(axis=0), atol=1e-5)
+
+    await VectorService.delete_chunks_by_document(db, long)
+    assert await centroids(db, long) == {}
+
+
+async def test_routing_finds_the_same_documents_as_a_full_scan(db, settings_for_routing):
+    settings_for_routing.setattr(settings, "DOC_ROUTE_DOCUMENTS", 5)
+    rng = np.random.default_rng(1)
+    centers = unit(rng.standard_normal((40, EMBEDDING_DIM), np.float32))
+    documents = [await add_document(db, around(center, 6, rng)) for center in centers]
+
+    for n in range(0, 40, 4):
+        q = around(centers[n], 1, rng)[0]
+        routed = await VectorService.query_similar_documents(db, q, top_k_docs=3)
+        exact = await VectorService.query_similar_documents(db, q, top_k_docs=3, strategy=EXACT)
+        assert routed[0]["document_id"] == exact[0]["document_id"] == documents[n]
+
+
+async def test_section_centroids_find_a_long_document_matching_in_one_place(
+    db, settings_for_routing
+):
+    settings_for_routing.setattr(settings, "DOC_ROUTE_DOCUMENTS", 1)
+    rng = np.random.default_rng(2)
+    q, elsewhere, other = unit(rng.standard_normal((3, EMBEDDING_DIM), np.float32))
+    # Three quarters about something else, the last quarter about q.
+    long = await add_document(
+        db, np.concatenate([around(elsewhere, 30, rng), around(q, 10, rng)])
+    )
+    # Half-way towards q throughout, so its centroid is nearer q than the long one's.
+    await add_document(db, around(unit(q + other), 8, rng))
+
+    async def top_document():
+        hits = await VectorService.query_similar_documents(
+            db, q, top_k_docs=1, chunks_to_consider=10
+        )
+        return hits[0]["document_id"]
+
+    assert await top_document() == long
+
+    settings_for_routing.setattr(settings, "DOC_SECTION_CENTROIDS", 0)
+    await refresh_document_embeddings(db, None)
+    await db.commit()
+    assert await top_document() != long
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from typing import List
+
+import numpy as np
+import pytest
+
+from app.core.embedding import EmbeddingBatcher
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeModel:
+    """Records each batch and embeds a text as [len(text)]."""
+
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.batches: List[List[str]] = []
+        self.threads = set()
+
+    def __call__(self, texts: List[str]):
+        self.threads.add(threading.get_ident())
+        self.batches.append(texts)
+        if self.fail:
+            raise ValueError("model failed")
+        return [np.array([len(text)], np.float32) for text in texts]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(EmbeddingBatcher, "_infer", staticmethod(model))
+    return model
+
+
+@pytest.fixture
+async def batcher(model):
+    batcher = EmbeddingBatcher(max_batch_size=8, max_wait_ms=50)
+    await batcher.start()
+    yield batcher
+    await batcher.stop()
+
+
+async def test_concurrent_callers_share_one_batch(batcher, model):
+    texts = [["a"], ["bb", "ccc"], ["dddd"]]
+    results = await asyncio.gather(*(batcher.embed(t) for t in texts))
+    assert model.batches == [["a", "bb", "ccc", "dddd"]]
+    # Every caller gets its own texts' vectors back, in order.
+    assert [[int(v[0]) for v in vectors] for vectors in results] == [[1], [2, 3], [4]]
+
+
+async def test_large_inputs_are_fed_in_slices(batcher, model):
+    texts = [str(i) for i in range(20)]
+    vectors = await batcher.embed(texts)
+    assert [len(batch) for batch in model.batches] == [8, 8, 4]
+    assert len(vectors) == 20
+
+
+async def test_a_request_that_would_overflow_the_batch_leads_the_next(batcher, model):
+    await asyncio.gather(batcher.embed(["x"] * 5), batcher.embed(["y"] * 5))
+    assert model.batches == [["x"] * 5, ["y"] * 5]
+
+
+async def test_inference_runs_off_the_event_loop(batcher, model):
+    await batcher.embed(["text"])
+    assert model.threads and threading.get_ident() not in model.threads
+
+
+async def test_a_lone_request_waits_at_most_max_wait(batcher, model):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await batcher.embed(["text"])
+    assert loop.time() - start < 0.5
+
+
+async def test_model_errors_reach_every_caller_of_the_batch(batcher, model):
+    model.fail = True
+    results = await asyncio.gather(
+        batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True
+    )
+    assert len(model.batches) == 1
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+async def test_embedding_needs_a_started_engine(model):
+    batcher = EmbeddingBatcher()
+    assert await batcher.embed([]) == []
+    with pytest.raises(RuntimeError):
+        await batcher.embed(["text"])
+
+
+async def test_stop_fails_waiting_requests(model):
+    batcher = EmbeddingBatcher(max_batch_size=8, max_wait_ms=1000)
+    await batcher.start()
+    waiting = asyncio.create_task(batcher.embed(["text"]))
+    await asyncio.sleep(0.05)
+    await batcher.stop()
+    with pytest.raises(RuntimeError):
+        await waiting
+    assert model.batches == []
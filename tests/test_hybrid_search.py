@@ -0,0 +1,52 @@
+import pytest
+
+from app.services.embeddings import VectorService
+from tests.conftest import embed_text
+
+pytestmark = pytest.mark.anyio
+
+OWNER = 4
+
+
+@pytest.fixture
+async def corpus(make_document):
+    zebras = await make_document(
+        ["zebra stripes", "zebra herd at dusk", "a zebra foal", "zebra crossing"], owner_id=OWNER
+    )
+    postgres = await make_document(
+        [f"postgres vacuum run {n}" for n in range(5)] + ["apples and bananas"],
+        owner_id=OWNER,
+    )
+    return {"zebras": zebras, "postgres": postgres}
+
+
+async def hybrid(db, vector_text: str, query_text: str, **kwargs):
+    return await VectorService.query_hybrid_chunks(
+        db, embed_text(vector_text), query_text, owner_id=OWNER, **kwargs
+    )
+
+
+async def test_text_and_vector_hits_are_fused(db, corpus):
+    hits = await hybrid(db, "apples", "vacuum", top_k=6)
+    # Every chunk is a vector candidate; the "vacuum" ones also rank on text,
+    # so they outscore the best pure vector hit.
+    assert all(hit["text"].startswith("postgres vacuum") for hit in hits[:5])
+    assert hits[5]["text"] == "apples and bananas"
+    assert hits[5]["score"] == pytest.approx(1 / 61)
+
+
+async def test_hybrid_search_keeps_the_owner_filter(db, corpus, make_document):
+    await make_document(["postgres vacuum elsewhere"], owner_id=OWNER + 1)
+    hits = await hybrid(db, "postgres vacuum", "vacuum", top_k=20)
+    assert {hit["document_id"] for hit in hits} <= set(corpus.values())
+
+
+@pytest.mark.parametrize("text_matches, ranked", [(2, 2), (10_000, 4)])
+async def test_only_text_matches_up_to_the_cap_are_ranked(db, corpus, text_matches, ranked):
+    # The vector candidates are the four zebras, so every postgres hit came
+    # from the text list: `candidates` of the five matches, or fewer if capped.
+    hits = await hybrid(
+        db, "zebra", "vacuum", top_k=20, candidates=4, text_matches=text_matches
+    )
+    assert sum("zebra" in hit["text"] for hit in hits) == 4
+    assert sum(hit["document_id"] == corpus["postgres"] for hit in hits) == ranked
@@ -0,0 +1,179 @@
+import hashlib
+from typing import AsyncIterator, Optional
+
+import pytest
+from sqlalchemy import text as sql_text
+
+from app.core.config import settings
+from app.core.uploads import UploadSource
+from app.models import Document
+from app.services.embeddings import VectorService
+from app.services.ingest import IngestPipeline
+
+pytestmark = pytest.mark.anyio
+
+OWNER = 7
+
+TEXT = "\n\n".join(
+    f"Paragraph {i}. Team {i} runs postgres clusters and answers pages about disk {i}."
+    for i in range(120)
+)
+
+
+def upload(text: str, filename: str = "a.txt") -> UploadSource:
+    data = text.encode()
+    return UploadSource(
+        filename, "text/plain", len(data), data=data, sha256=hashlib.sha256(data).hexdigest()
+    )
+
+
+async def new_document(db) -> int:
+    document = Document(title="doc")
+    db.add(document)
+    await db.commit()
+    return document.id
+
+
+async def ingest(
+    db, document_id: int, source: UploadSource, owner_id: Optional[int] = OWNER, **kw
+):
+    return await IngestPipeline().ingest_source(db, document_id, owner_id, source, **kw)
+
+
+async def chunk_rows(db, document_id: int) -> list:
+    result = await db.execute(
+        sql_text(
+            "SELECT id, chunk_index, text, embedding::text AS embedding, owner_id "
+            "FROM chunks WHERE document_id = :id ORDER BY chunk_index"
+        ),
+        {"id": document_id},
+    )
+    return result.all()
+
+
+async def upload_record(db, document_id: int) -> tuple:
+    result = await db.execute(
+        sql_text("SELECT content_sha256, parser_version FROM documents WHERE id = :id"),
+        {"id": document_id},
+    )
+    return tuple(result.one())
+
+
+async def nothing() -> AsyncIterator[str]:
+    return
+    yield
+
+
+async def test_identical_upload_is_cloned(db):
+    first, second = await new_document(db), await new_document(db)
+    parsed = await ingest(db, first, upload(TEXT))
+    assert parsed.cloned_from is None and parsed.embedded == parsed.chunks > 1
+
+    cloned = await ingest(db, second, upload(TEXT, filename="copy.txt"))
+    assert cloned.cloned_from == first
+    assert cloned.chunks == parsed.chunks
+    assert cloned.embedded == 0
+
+    original, copy = await chunk_rows(db, first), await chunk_rows(db, second)
+    assert [r.id.split(":", 1)[1] for r in copy] == [r.id.split(":", 1)[1] for r in original]
+    assert all(r.id.startswith(f"{second}:") for r in copy)
+    assert [(r.chunk_index, r.text, r.embedding) for r in copy] == [
+        (r.chunk_index, r.text, r.embedding) for r in original
+    ]
+    assert (await upload_record(db, second))[0] == upload(TEXT).sha256
+    centroids = await db.scalar(
+        sql_text("SELECT count(*) FROM document_embeddings WHERE document_id = :id"),
+        {"id": second},
+    )
+    assert centroids >= 1
+
+
+async def test_reindex_from_the_same_upload_is_a_noop(db):
+    document_id = await new_document(db)
+    await ingest(db, document_id, upload(TEXT))
+    before = await chunk_rows(db, document_id)
+
+    stats = await ingest(db, document_id, upload(TEXT), reindex=True)
+    assert stats.cloned_from == document_id
+    assert (stats.chunks, stats.embedded, stats.moved, stats.deleted) == (len(before), 0, 0, 0)
+    assert await chunk_rows(db, document_id) == before
+
+
+async def test_changed_upload_is_reindexed(db):
+    document_id = await new_document(db)
+    await ingest(db, document_id, upload(TEXT))
+
+    edited = TEXT.replace("Team 60 runs", "Team sixty runs")
+    stats = await ingest(db, document_id, upload(edited), reindex=True)
+    assert stats.cloned_from is None
+    # The edited paragraph is in one chunk, or two where chunks overlap.
+    assert 1 <= stats.embedded == stats.deleted <= 2 < stats.chunks
+    assert (await upload_record(db, document_id))[0] == upload(edited).sha256
+
+
+async def test_chunks_of_another_embedding_backend_are_not_cloned(db):
+    first, second = await new_document(db), await new_document(db)
+    await ingest(db, first, upload(TEXT))
+    await db.execute(sql_text("UPDATE chunks SET embedding_model = 'older-model'"))
+    await db.commit()
+
+    stats = await ingest(db, second, upload(TEXT))
+    assert stats.cloned_from is None and stats.embedded == stats.chunks
+
+
+async def test_another_owners_upload_is_not_cloned(db):
+    first, second = await new_document(db), await new_document(db)
+    await ingest(db, first, upload(TEXT), owner_id=OWNER)
+
+    stats = await ingest(db, second, upload(TEXT), owner_id=OWNER + 1)
+    assert stats.cloned_from is None and stats.embedded == stats.chunks
+    assert {r.owner_id for r in await chunk_rows(db, second)} == {OWNER + 1}
+
+
+async def test_another_ingest_version_is_not_cloned(db, monkeypatch):
+    first, second = await new_document(db), await new_document(db)
+    await ingest(db, first, upload(TEXT))
+
+    monkeypatch.setattr(settings, "CHUNK_MAX_TOKENS", settings.CHUNK_MAX_TOKENS // 2)
+    stats = await ingest(db, second, upload(TEXT))
+    assert stats.cloned_from is None and stats.embedded == stats.chunks
+
+
+async def test_empty_parse_is_not_recorded_for_cloning(db):
+    first, second = await new_document(db), await new_document(db)
+    empty = await ingest(db, first, upload(TEXT), segments=nothing())
+    assert empty.chunks == 0
+    assert (await upload_record(db, first))[0] is None
+
+    stats = await ingest(db, second, upload(TEXT))
+    assert stats.cloned_from is None and stats.chunks > 0
+
+
+async def test_documents_without_chunks_are_not_cloned(db):
+    first, second = await new_document(db), await new_document(db)
+    await ingest(db, first, upload(TEXT))
+    # A hash left behind without chunks (e.g. recorded before chunks > 0 was required).
+    await db.execute(sql_text("DELETE FROM chunks"))
+    await db.commit()
+
+    stats = await ingest(db, second, upload(TEXT))
+    assert stats.cloned_from is None and stats.chunks > 0
+
+
+async def test_deleting_chunks_forgets_the_upload(db):
+    first, second = await new_document(db), await new_document(db)
+    await ingest(db, first, upload(TEXT))
+    await VectorService.delete_chunks_by_document(db, first)
+    assert (await upload_record(db, first))[0] is None
+
+    stats = await ingest(db, second, upload(TEXT))
+    assert stats.cloned_from is None
+
+
+async def test_dedup_can_be_turned_off(db, monkeypatch):
+    first, second = await new_document(db), await new_document(db)
+    await ingest(db, first, upload(TEXT))
+
+    monkeypatch.setattr(settings, "INGEST_DEDUP", False)
+    stats = await ingest(db, second, upload(TEXT))
+    assert stats.cloned_from is None and stats.embedded == stats.chunks
@@ -0,0 +1,124 @@
+import asyncio
+from typing import AsyncIterator, List
+
+import pytest
+from sqlalchemy import text as sql_text
+
+from app.models import Document
+from app.services.chunk_service import ChunkService
+from app.services.embeddings import ChunkIds, EmbeddingService, VectorService
+from app.services import ingest
+from app.services.ingest import IngestPipeline
+
+pytestmark = pytest.mark.anyio
+
+OWNER = 5
+
+
+def paragraph(n: int, sentences: int = 40) -> str:
+    """About 240 tokens, one chunk's worth."""
+    return " ".join(f"Paragraph {n} sentence {i}." for i in range(sentences)) + "\n\n"
+
+
+async def stream(segments: List[str]) -> AsyncIterator[str]:
+    for segment in segments:
+        yield segment
+        await asyncio.sleep(0)
+
+
+async def new_document(db) -> int:
+    document = Document(title="doc", owner_id=OWNER)
+    db.add(document)
+    await db.commit()
+    return document.id
+
+
+async def stored_texts(db, document_id: int) -> List[str]:
+    result = await db.execute(
+        sql_text("SELECT text FROM chunks WHERE document_id = :id ORDER BY chunk_index"),
+        {"id": document_id},
+    )
+    return list(result.scalars())
+
+
+async def test_chunks_are_written_in_order(db):
+    document_id = await new_document(db)
+    segments = [paragraph(n) for n in range(12)]
+    stats = await IngestPipeline(batch_size=4).run(db, document_id, OWNER, stream(segments))
+
+    expected = list(ChunkService.iter_chunks(segments))
+    assert await stored_texts(db, document_id) == expected
+    assert stats.chunks == stats.embedded == len(expected)
+    assert {"parse", "chunk", "embed", "upsert", "total"} <= set(stats.seconds)
+
+
+async def test_chunks_are_embedded_in_batches(db, monkeypatch):
+    sizes = []
+    embbed_doc = EmbeddingService.embbed_doc
+
+    async def recording_embbed_doc(chunks):
+        sizes.append(len(chunks))
+        return await embbed_doc(chunks)
+
+    monkeypatch.setattr(EmbeddingService, "embbed_doc", staticmethod(recording_embbed_doc))
+    document_id = await new_document(db)
+    stats = await IngestPipeline(batch_size=4).run(
+        db, document_id, OWNER, stream([paragraph(n) for n in range(10)])
+    )
+    assert max(sizes) == 4 and sum(sizes) == stats.chunks
+
+
+async def test_chunking_stays_a_few_batches_ahead_of_the_writes(db, monkeypatch):
+    chunked, written, leads = [0], [0], []
+    next_id = ChunkIds.next
+    write_chunk_rows = VectorService.write_chunk_rows
+
+    def counting_next(self, text):
+        chunked[0] += 1
+        return next_id(self, text)
+
+    async def slow_write(session, rows, method=None):
+        leads.append(chunked[0] - written[0])
+        await asyncio.sleep(0.01)
+        await write_chunk_rows(session, rows, method)
+        written[0] += len(rows)
+
+    monkeypatch.setattr(ChunkIds, "next", counting_next)
+    monkeypatch.setattr(VectorService, "write_chunk_rows", staticmethod(slow_write))
+    document_id = await new_document(db)
+    stats = await IngestPipeline(batch_size=4, queue_size=1).run(
+        db, document_id, OWNER, stream([paragraph(n) for n in range(100)])
+    )
+    assert written[0] == stats.chunks > 50
+    # The chunk queue and one chunk waiting for it, a batch being embedded,
+    # the queued batch and the one being written.
+    assert max(leads) <= 4 + 1 + 4 + 4 + 4
+
+
+async def test_a_failed_stage_rolls_the_document_back(db, monkeypatch):
+    document_id = await new_document(db)
+    await IngestPipeline().run(db, document_id, OWNER, stream([paragraph(0)]))
+
+    async def failing_segments():
+        yield paragraph(1)
+        raise ValueError("parser failed")
+
+    with pytest.raises(ValueError, match="parser failed"):
+        await IngestPipeline(batch_size=1).run(
+            db, document_id, OWNER, failing_segments(), reindex=True
+        )
+    # The first ingest is untouched, the failed one left nothing behind.
+    assert await stored_texts(db, document_id) == [paragraph(0).strip()]
+
+
+async def test_a_failure_after_the_stages_rolls_the_document_back_too(db, monkeypatch):
+    document_id = await new_document(db)
+
+    async def failing_refresh(session, document_ids):
+        raise RuntimeError("centroids failed")
+
+    monkeypatch.setattr(ingest, "refresh_document_embeddings", failing_refresh)
+    with pytest.raises(RuntimeError, match="centroids failed"):
+        await IngestPipeline().run(db, document_id, OWNER, stream([paragraph(0)]))
+    # Nothing was written, and the session is usable again.
+    assert await stored_texts(db, document_id) == []
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+from sqlalchemy import text as sql_text
+
+from app.core.config import settings
+from app.core.uploads import UploadSource
+from app.services.ingest import IngestPipeline
+from app.services.jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobService
+from app.worker import IngestWorker
+
+pytestmark = pytest.mark.anyio
+
+OWNER = 3
+TEXT = "\n\n".join(f"Section {i}. The queue keeps job {i} durable." for i in range(40))
+
+
+@pytest.fixture(autouse=True)
+def payload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_PAYLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+def upload(text: str = TEXT) -> UploadSource:
+    data = text.encode()
+    return UploadSource(
+        "notes.txt", "text/plain", len(data), data=data, sha256=hashlib.sha256(data).hexdigest()
+    )
+
+
+async def job_row(db, job_id: int):
+    result = await db.execute(
+        sql_text("SELECT status, attempts, locked_by, error FROM ingest_jobs WHERE id = :id"),
+        {"id": job_id},
+    )
+    return result.one()
+
+
+async def make_stale(db, job_id: int):
+    await db.execute(
+        sql_text(
+            "UPDATE ingest_jobs SET heartbeat_at = now() - interval '1 hour' WHERE id = :id"
+        ),
+        {"id": job_id},
+    )
+    await db.commit()
+
+
+async def test_claim_takes_the_oldest_job_with_its_upload(db):
+    first = await JobService.enqueue(db, upload(), owner_id=OWNER)
+    await JobService.enqueue(db, upload("other"), owner_id=OWNER)
+
+    job = await JobService.claim(db, "w1")
+    assert job.id == first.id and job.document_id == first.document_id
+    assert (job.owner_id, job.reindex, job.attempts) == (OWNER, False, 1)
+    assert job.source.read_bytes() == TEXT.encode()
+    assert job.source.sha256 == upload().sha256
+    assert (await job_row(db, job.id)).status == RUNNING
+
+
+async def test_uploads_wait_on_disk_not_in_the_table(db, payload_dir, tmp_path_factory):
+    spooled = tmp_path_factory.mktemp("spool") / "upload.txt"
+    spooled.write_bytes(TEXT.encode())
+    source = UploadSource(
+        "notes.txt", "text/plain", len(TEXT), path=str(spooled), sha256=upload().sha256
+    )
+    queued = await JobService.enqueue(db, source, owner_id=OWNER)
+    # The spool file may be removed once the request is done.
+    spooled.unlink()
+
+    stored = payload_dir / queued.payload_file
+    assert stored.read_bytes() == TEXT.encode() and stored.suffix == ".txt"
+    job = await JobService.claim(db, "w1")
+    assert job.source.path == str(stored) and job.source.data is None
+    assert (job.source.size, job.source.sha256) == (len(TEXT), upload().sha256)
+
+    await JobService.succeed(db, job.id, "w1", {"chunks": 1})
+    assert os.listdir(payload_dir) == []
+    assert await db.scalar(sql_text("SELECT payload_file FROM ingest_jobs")) is None
+
+
+async def test_jobs_of_one_document_run_one_at_a_time_in_order(db):
+    first = await JobService.enqueue(db, upload(), owner_id=OWNER)
+    reindex = await JobService.enqueue(
+        db, upload(TEXT + " more"), owner_id=OWNER, document_id=first.document_id
+    )
+    assert reindex.reindex
+
+    job = await JobService.claim(db, "w1")
+    assert job.id == first.id
+    assert await JobService.claim(db, "w2") is None
+
+    await JobService.succeed(db, job.id, "w1", {"chunks": 1})
+    follow_up = await JobService.claim(db, "w2")
+    assert follow_up.id == reindex.id and follow_up.reindex
+
+
+async def test_failed_attempts_back_off_then_fail_for_good(db, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_S", 3600)
+    queued = await JobService.enqueue(db, upload(), owner_id=OWNER)
+    job = await JobService.claim(db, "w1")
+
+    assert await JobService.fail(db, job, "w1", "boom") == QUEUED
+    # Not runnable again before its backoff.
+    assert await JobService.claim(db, "w1") is None
+
+    await db.execute(sql_text("UPDATE ingest_jobs SET run_after = now(), attempts = max_attempts"))
+    await db.commit()
+    job = await JobService.claim(db, "w1")
+    assert job.id == queued.id
+    assert await JobService.fail(db, job, "w1", "boom again") == FAILED
+    row = await job_row(db, job.id)
+    assert (row.status, row.error) == (FAILED, "boom again")
+    # Its upload is no longer needed.
+    assert os.listdir(settings.JOB_PAYLOAD_DIR) == []
+
+
+async def test_unparsable_uploads_are_not_retried(db):
+    await JobService.enqueue(db, upload(), owner_id=OWNER)
+    job = await JobService.claim(db, "w1")
+    assert await JobService.fail(db, job, "w1", "bad file", retry=False) == FAILED
+
+
+async def test_stale_jobs_are_requeued_and_their_old_worker_loses_the_lease(db):
+    await JobService.enqueue(db, upload(), owner_id=OWNER)
+    job = await JobService.claim(db, "w1")
+    assert await JobService.heartbeat(db, job.id, "w1", 5)
+
+    assert await JobService.requeue_stale(db, 60) == 0
+    await make_stale(db, job.id)
+    assert await JobService.requeue_stale(db, 60) == 1
+    row = await job_row(db, job.id)
+    assert (row.status, row.locked_by) == (QUEUED, None)
+    assert "w1 stopped responding" in row.error
+
+    assert not await JobService.heartbeat(db, job.id, "w1", 10)
+    retried = await JobService.claim(db, "w2")
+    assert retried.id == job.id and retried.attempts == 2
+    assert retried.source.read_bytes() == TEXT.encode()
+    # The old worker's outcome no longer counts.
+    await JobService.succeed(db, job.id, "w1", {"chunks": 10})
+    assert (await job_row(db, job.id)).status == RUNNING
+
+
+async def test_worker_ingests_a_claimed_job(db):
+    queued = await JobService.enqueue(db, upload(), owner_id=OWNER)
+    worker = IngestWorker(worker_id="w1", heartbeat_s=0.05)
+    await worker._run_job(await JobService.claim(db, "w1"))
+
+    job = await JobService.get(db, queued.id)
+    assert job["status"] == SUCCEEDED
+    assert job["chunks_done"] == job["stats"]["chunks"] > 0
+    chunks = await db.scalar(
+        sql_text("SELECT count(*) FROM chunks WHERE document_id = :id AND owner_id = :owner"),
+        {"id": queued.document_id, "owner": OWNER},
+    )
+    assert chunks == job["stats"]["chunks"]
+
+
+async def test_worker_records_a_failed_ingest(db):
+    source = UploadSource("x.bin", "application/x-unknown", 3, data=b"abc", sha256="0" * 64)
+    queued = await JobService.enqueue(db, source, owner_id=OWNER)
+    worker = IngestWorker(worker_id="w1", heartbeat_s=0.05)
+    await worker._run_job(await JobService.claim(db, "w1"))
+
+    row = await job_row(db, queued.id)
+    assert row.status == FAILED and "Unsupported file type" in row.error
+
+
+async def test_worker_abandons_a_job_whose_lease_was_lost(db, monkeypatch):
+    started, cancelled = asyncio.Event(), asyncio.Event()
+
+    async def hang(self, *args, **kwargs):
+        started.set()
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    monkeypatch.setattr(IngestPipeline, "ingest_source", hang)
+    queued = await JobService.enqueue(db, upload(), owner_id=OWNER)
+    job = await JobService.claim(db, "w1")
+    worker = IngestWorker(worker_id="w1", heartbeat_s=0.05)
+
+    running = asyncio.create_task(worker._run_job(job))
+    await started.wait()
+    # Any heartbeat is older than this transaction's now().
+    assert await JobService.requeue_stale(db, 0) == 1
+
+    await asyncio.wait_for(running, 5)
+    assert cancelled.is_set()
+    # Left queued for the next worker, neither failed nor succeeded here.
+    row = await job_row(db, queued.id)
+    assert (row.status, row.locked_by) == (QUEUED, None)
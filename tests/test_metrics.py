@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import os
+import subprocess
+
+import httpx
+import pytest
+from sqlalchemy import text as sql_text
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.metrics import MetricsRegistry, timed_aiter
+from app.main import app
+from app.models import Document
+from app.services.embeddings import VectorService
+from app.services.ingest import IngestPipeline
+from app.services.search_planner import HNSW
+from tests.conftest import embed_text
+
+pytestmark = pytest.mark.anyio
+
+
+def make_registry(entries: float = 0.0) -> MetricsRegistry:
+    registry = MetricsRegistry()
+    registry.histogram("query_seconds", "Query latency.", ["query"], buckets=(0.1, 1.0))
+    registry.counter("requests", "Requests.", ["path"])
+    registry.gauge("cache_entries", "Cached entries.", lambda: entries)
+    return registry
+
+
+def record(registry: MetricsRegistry, seconds: float, path: str = "/query"):
+    registry._metrics["query_seconds"].labels("chunks").observe(seconds)
+    registry._metrics["requests"].labels(path).inc()
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
+
+
+def test_renders_the_text_exposition_format():
+    registry = make_registry(entries=3)
+    record(registry, 0.05)
+    record(registry, 0.5, path='/a"b')
+    assert registry.render().splitlines() == [
+        "# HELP query_seconds Query latency.",
+        "# TYPE query_seconds histogram",
+        'query_seconds_bucket{query="chunks",le="0.1"} 1',
+        'query_seconds_bucket{query="chunks",le="1.0"} 2',
+        'query_seconds_bucket{query="chunks",le="+Inf"} 2',
+        'query_seconds_sum{query="chunks"} 0.55',
+        'query_seconds_count{query="chunks"} 2',
+        "# HELP requests Requests.",
+        "# TYPE requests counter",
+        'requests_total{path="/a\\"b"} 1.0',
+        'requests_total{path="/query"} 1.0',
+        "# HELP cache_entries Cached entries.",
+        "# TYPE cache_entries gauge",
+        "cache_entries 3",
+    ]
+
+
+def test_labels_must_match_the_metric():
+    with pytest.raises(ValueError):
+        make_registry()._metrics["requests"].labels("a", "b")
+
+
+async def test_timed_aiter_measures_the_producer_only():
+    async def produce():
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield i
+
+    spent = []
+    async for _ in timed_aiter(produce(), spent.append):
+        await asyncio.sleep(0.02)
+    assert 0.03 <= spent[0] < 0.06
+
+
+def test_shared_registries_render_every_workers_values(tmp_path):
+    this = make_registry(entries=1)
+    this.share(str(tmp_path))
+    record(this, 0.05)
+
+    # A live worker (our parent process stands in for it) and one that exited.
+    for pid, seconds, entries in [(os.getppid(), 0.5, 2), (dead_pid(), 5.0, 4)]:
+        other = make_registry(entries=entries)
+        record(other, seconds)
+        (tmp_path / f"{pid}.json").write_text(json.dumps(other.snapshot()))
+
+    lines = this.render().splitlines()
+    assert 'query_seconds_bucket{query="chunks",le="0.1"} 1' in lines
+    assert 'query_seconds_bucket{query="chunks",le="1.0"} 2' in lines
+    assert 'query_seconds_count{query="chunks"} 3' in lines
+    assert 'requests_total{path="/query"} 3.0' in lines
+    # Gauges only of live workers, one series each.
+    gauges = [line for line in lines if line.startswith("cache_entries{")]
+    assert gauges == sorted(
+        [f'cache_entries{{pid="{os.getpid()}"}} 1', f'cache_entries{{pid="{os.getppid()}"}} 2']
+    )
+    # Rendering published this worker's own values.
+    assert (tmp_path / f"{os.getpid()}.json").exists()
+
+
+def test_share_removes_snapshots_of_an_earlier_run(tmp_path):
+    (tmp_path / "123.json").write_text("{}")
+    make_registry().share(str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_workers_publish_periodically_and_on_stop(tmp_path):
+    registry = make_registry()
+    registry.share(str(tmp_path))
+    snapshot = tmp_path / f"{os.getpid()}.json"
+
+    registry.start_publishing(0.01)
+    await asyncio.sleep(0.05)
+    assert snapshot.exists()
+
+    record(registry, 0.05)
+    await registry.stop_publishing()
+    assert json.loads(snapshot.read_text())["requests"] == [[["/query"], 1.0]]
+
+
+def test_unshared_registries_do_not_publish(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    registry = make_registry()
+    registry.publish()
+    registry.render()
+    assert list(tmp_path.iterdir()) == []
+
+
+def observed(histogram, *labels) -> int:
+    return histogram.labels(*labels).count
+
+
+async def test_ingest_records_each_stage(db):
+    document = Document(title="doc")
+    db.add(document)
+    await db.commit()
+    stages = ["parse", "chunk", "embed", "upsert", "total"]
+    before = [observed(metrics.INGEST_STAGE_SECONDS, stage) for stage in stages]
+    chunks_before = observed(metrics.INGEST_CHUNKS)
+
+    async def segments():
+        yield "Postgres stores rows in pages. Vacuum reclaims dead rows."
+
+    await IngestPipeline().run(db, document.id, None, segments())
+    after = [observed(metrics.INGEST_STAGE_SECONDS, stage) for stage in stages]
+    assert [a - b for a, b in zip(after, before)] == [1] * len(stages)
+    assert observed(metrics.INGEST_CHUNKS) == chunks_before + 1
+
+
+async def test_searches_record_their_strategy(db, make_document):
+    await make_document(["postgres vacuum"])
+    before = observed(metrics.ANN_QUERY_SECONDS, "chunks", HNSW)
+    await VectorService.query_similar_chunks(db, embed_text("vacuum"))
+    assert observed(metrics.ANN_QUERY_SECONDS, "chunks", HNSW) == before + 1
+
+
+async def test_slow_statements_are_counted_and_logged(db, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "DB_SLOW_QUERY_MS", 50)
+    slow = metrics.DB_SLOW_STATEMENTS.labels("SELECT")
+    before = slow.value
+    await db.execute(sql_text("SELECT 1"))
+    assert slow.value == before
+
+    with caplog.at_level(logging.WARNING, logger="app.core.database"):
+        await db.execute(sql_text("SELECT pg_sleep(0.06)"))
+    assert slow.value == before + 1
+    assert any("slow query" in r.message and "pg_sleep" in r.message for r in caplog.records)
+
+
+async def test_metrics_endpoint(db):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/metrics")
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    assert "# TYPE ingest_stage_seconds histogram" in response.text
+    assert "db_pool_size " in response.text
@@ -0,0 +1,156 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import text as sql_text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core import partitioning
+from app.core.config import settings
+from app.core.partitioning import create_partitions, partition_manager, partition_name
+from tests.conftest import TEST_DB_URL
+
+pytestmark = pytest.mark.anyio
+
+# The chunks table layout is fixed when app.models is imported, so each
+# layout is checked in its own process against its own database.
+CHECK = """
+import asyncio, json
+import numpy as np
+from sqlalchemy import text as sql_text
+from app.core.database import AsyncSessionLocal, engine, init_db
+from app.core.partitioning import partition_manager
+from app.models import Document, EMBEDDING_DIM
+from app.services.embeddings import VectorService
+
+async def main():
+    await init_db()
+    rng = np.random.default_rng(0)
+    out = {}
+    async with AsyncSessionLocal() as session:
+        for owner_id in (1, 2, 3):
+            document = Document(title=str(owner_id), owner_id=owner_id)
+            session.add(document)
+            await session.commit()
+            texts = [f"owner {owner_id} chunk {i}" for i in range(20)]
+            # The second write upserts the same ids.
+            for _ in range(2):
+                vectors = rng.standard_normal((20, EMBEDDING_DIM), np.float32)
+                await VectorService.upsert_chunks(session, document.id, owner_id, texts, vectors)
+        result = await session.execute(sql_text(
+            "SELECT owner_id, tableoid::regclass::text, count(*) FROM chunks "
+            "GROUP BY 1, 2 ORDER BY 1"
+        ))
+        out["partitions"] = [list(row) for row in result]
+        q = rng.standard_normal(EMBEDDING_DIM).astype(np.float32)
+        result = await session.execute(
+            sql_text(
+                "EXPLAIN SELECT id FROM chunks WHERE owner_id = 2 "
+                "ORDER BY embedding <=> CAST(:q AS vector) LIMIT 5"
+            ),
+            {"q": str(q.tolist())},
+        )
+        out["plan"] = "\\n".join(result.scalars())
+        hits = await VectorService.query_similar_chunks(session, q, top_k=50, owner_id=2)
+        out["hits"] = sorted({hit["text"].split(" chunk")[0] for hit in hits})
+        try:
+            await partition_manager.reindex_owner(session, 2)
+        except RuntimeError:
+            out["reindex_needs_no_transaction"] = True
+        await session.commit()
+        out["reindexed"] = await partition_manager.reindex_owner(session, 2)
+        try:
+            await partition_manager.ensure_owner(session, None)
+        except ValueError:
+            out["owner_required"] = True
+    await engine.dispose()
+    print(json.dumps(out))
+
+asyncio.run(main())
+"""
+
+
+@pytest.fixture
+async def scratch_database(database):
+    """The URL of an empty database, dropped afterwards."""
+    url = make_url(TEST_DB_URL)
+    name = f"{url.database}_partitioned"
+    admin = create_async_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT")
+    async with admin.connect() as conn:
+        await conn.execute(sql_text(f"DROP DATABASE IF EXISTS {name}"))
+        await conn.execute(sql_text(f"CREATE DATABASE {name}"))
+    try:
+        yield url.set(database=name).render_as_string(hide_password=False)
+    finally:
+        async with admin.connect() as conn:
+            await conn.execute(sql_text(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)"))
+        await admin.dispose()
+
+
+def run_check(db_url: str, partitioning: str) -> dict:
+    env = {
+        **os.environ,
+        "DB_URL": db_url,
+        "CHUNK_PARTITIONING": partitioning,
+        "CHUNK_HASH_PARTITIONS": "4",
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", CHECK], env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+async def test_list_partitions_hold_one_tenant_each(scratch_database):
+    out = run_check(scratch_database, "list")
+    assert out["partitions"] == [
+        [owner_id, partition_name(owner_id), 20] for owner_id in (1, 2, 3)
+    ]
+    # Queries filtering on the owner only read its partition.
+    assert "chunks_owner_2" in out["plan"]
+    assert "chunks_owner_1" not in out["plan"] and "chunks_owner_3" not in out["plan"]
+    assert out["hits"] == ["owner 2"]
+    assert out["reindexed"] and all(
+        index.startswith("chunks_owner_2_") for index in out["reindexed"]
+    )
+    assert out["owner_required"] and out["reindex_needs_no_transaction"]
+
+
+async def test_hash_partitions_are_pruned_too(scratch_database):
+    out = run_check(scratch_database, "hash")
+    assert [count for _, _, count in out["partitions"]] == [20, 20, 20]
+    partition = next(part for owner_id, part, _ in out["partitions"] if owner_id == 2)
+    assert partition in out["plan"]
+    assert sum(f"chunks_p{n}" in out["plan"] for n in range(4)) == 1
+    assert out["hits"] == ["owner 2"]
+    assert out["reindexed"] and all(
+        index.startswith(f"{partition}_") for index in out["reindexed"]
+    )
+
+
+def test_partition_names_are_valid_identifiers():
+    assert partition_name(42) == "chunks_owner_42"
+    assert partition_name(-42) == "chunks_owner_n42"
+
+
+async def test_unknown_partitioning_is_rejected(db, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_PARTITIONING", "range")
+    async with db.bind.connect() as conn:
+        with pytest.raises(ValueError):
+            await create_partitions(conn)
+
+
+async def test_a_layout_mismatch_is_reported(db, monkeypatch):
+    # The test database's chunks table is not partitioned.
+    monkeypatch.setattr(settings, "CHUNK_PARTITIONING", "list")
+    monkeypatch.setattr(partitioning, "CHUNKS_PARTITIONED", True)
+    async with db.bind.connect() as conn:
+        with pytest.raises(RuntimeError):
+            await create_partitions(conn)
+
+
+async def test_unpartitioned_writes_need_no_owner(db):
+    await partition_manager.ensure_owner(db, None)
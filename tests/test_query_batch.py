@@ -0,0 +1,79 @@
+import httpx
+import pytest
+
+from app.core.embedding import embedding_engine, query_embedding_cache
+from app.main import app
+from app.services.embeddings import EmbeddingService, VectorService
+from tests.conftest import embed_text
+
+pytestmark = pytest.mark.anyio
+
+QUERIES = ["postgres vacuum", "cats and dogs", "zebra crossing", "nothing matches"]
+
+
+@pytest.fixture
+async def corpus(make_document):
+    return [
+        await make_document(["postgres vacuum", "postgres pages", "autovacuum settings"]),
+        await make_document(["cats purr", "dogs bark", "cats and dogs"]),
+        await make_document(["zebra stripes", "zebra crossing"]),
+    ]
+
+
+@pytest.fixture
+def model_batches(monkeypatch):
+    """The texts of every call into the embedding engine."""
+    batches = []
+    embed = embedding_engine.embed
+
+    async def recording_embed(texts):
+        batches.append(texts)
+        return await embed(texts)
+
+    monkeypatch.setattr(embedding_engine, "embed", recording_embed)
+    return batches
+
+
+@pytest.mark.parametrize("filtered", [False, True], ids=["all", "two-documents"])
+async def test_batch_matches_one_search_per_query(db, corpus, filtered):
+    document_ids = corpus[:2] if filtered else None
+    vectors = [embed_text(q) for q in QUERIES]
+    batch = await VectorService.query_similar_chunks_batch(
+        db, vectors, top_k=3, document_ids=document_ids
+    )
+    assert len(batch) == len(QUERIES)
+    for vector, hits in zip(vectors, batch):
+        single = await VectorService.query_similar_chunks(
+            db, vector, top_k=3, document_ids=document_ids
+        )
+        assert [hit["id"] for hit in hits] == [hit["id"] for hit in single]
+        assert [hit["distance"] for hit in hits] == pytest.approx(
+            [hit["distance"] for hit in single], abs=1e-5
+        )
+    if filtered:
+        assert all(hit["document_id"] in document_ids for hits in batch for hit in hits)
+
+
+async def test_empty_batches_run_no_query(db):
+    assert await VectorService.query_similar_chunks_batch(db, []) == []
+
+
+async def test_query_misses_are_embedded_in_one_model_batch(embedder, model_batches):
+    query_embedding_cache.clear()
+    await EmbeddingService.embbed_string("cats purr")
+    model_batches.clear()
+    vectors = await EmbeddingService.embbed_strings(["cats purr", "dogs bark", "dogs  bark", "x"])
+    # One call for both misses; the cached and repeated queries are reused.
+    assert model_batches == [["dogs bark", "x"]]
+    assert vectors[1] is vectors[2]
+
+
+async def test_batch_endpoint(db, corpus):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/query/batch", json={"queries": QUERIES[:2], "doc_ids": corpus}
+        )
+    assert response.status_code == 200
+    results = response.json()["success"]
+    assert [hits[0]["text"] for hits in results] == ["postgres vacuum", "cats and dogs"]
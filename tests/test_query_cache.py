@@ -0,0 +1,114 @@
+import asyncio
+from dataclasses import replace
+
+import pytest
+
+from app.core.cache import TTLCache
+from app.core.embedding import embbed_model, query_embedding_cache
+from app.services.embeddings import EmbeddingService
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    assert cache.evictions == 1
+
+
+def test_capacity_is_capped_in_bytes():
+    cache = TTLCache(max_entries=10, max_bytes=100)
+    cache.set("a", "x", size=60)
+    cache.set("b", "y", size=60)
+    assert (cache.get("a"), cache.get("b")) == (None, "y")
+    # Larger than the whole cache: not stored, nothing evicted for it.
+    cache.set("c", "z", size=101)
+    assert (cache.get("b"), cache.get("c")) == ("y", None)
+    assert cache.stats()["bytes"] == 60
+
+
+def test_entries_expire_after_their_ttl():
+    clock = Clock()
+    cache = TTLCache(ttl_seconds=10, clock=clock)
+    cache.set("a", 1)
+    clock.now = 9.9
+    assert cache.get("a") == 1
+    clock.now = 10
+    assert cache.get("a") is None
+    assert (cache.expirations, len(cache)) == (1, 0)
+
+
+async def test_concurrent_misses_share_one_computation():
+    cache = TTLCache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "value"
+
+    results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+    assert results == ["value"] * 5
+    assert calls == 1
+
+
+async def test_failed_computations_are_not_cached():
+    cache = TTLCache()
+
+    async def fail():
+        raise ValueError("boom")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            await cache.get_or_compute("k", fail)
+    assert len(cache) == 0
+
+
+@pytest.fixture
+def model_inputs(embedder, monkeypatch):
+    """Texts sent to the model, on an empty query cache."""
+    texts = []
+    embed = embedder.embed
+
+    async def recording_embed(batch):
+        texts.extend(batch)
+        return await embed(batch)
+
+    monkeypatch.setattr(embedder, "embed", recording_embed)
+    query_embedding_cache.clear()
+    yield texts
+    query_embedding_cache.clear()
+
+
+async def test_whitespace_variants_share_one_embedding(model_inputs):
+    first = await EmbeddingService.embbed_string("  where is\tthe\n  cache ")
+    second = await EmbeddingService.embbed_string("where is the cache")
+    assert first is second
+    assert model_inputs == ["where is the cache"]
+
+
+async def test_uncased_backends_fold_case(model_inputs):
+    assert embbed_model.backend.uncased
+    await EmbeddingService.embbed_strings(["Paris in May", "paris in may"])
+    assert model_inputs == ["paris in may"]
+
+
+async def test_cased_backends_keep_case(model_inputs, monkeypatch):
+    monkeypatch.setattr(embbed_model, "_backend", replace(embbed_model.backend, uncased=False))
+    await EmbeddingService.embbed_strings(["Paris in May", "paris in may"])
+    assert await EmbeddingService.embbed_string("Paris  in May") is not None
+    assert model_inputs == ["Paris in May", "paris in may"]
+    assert len(query_embedding_cache) == 2
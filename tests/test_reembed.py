@@ -0,0 +1,274 @@
+import argparse
+
+import numpy as np
+import pytest
+from sqlalchemy import text as sql_text
+
+from app import reembed
+from app.core.config import settings
+from app.core.embedding_backends import active_backend, get_backend
+from app.core.document_index import INDEX_NAME as DOCUMENT_INDEX_NAME
+from app.core.vector_index import INDEX_NAMES
+from app.services import reembed as reembed_service
+from app.services.embeddings import EmbeddingService, VectorService
+from app.services.reembed import (
+    ABORTED,
+    DIRTY_TABLE,
+    NEXT_COLUMN,
+    RUNNING,
+    STAGE_TABLE,
+    SWAPPED,
+    ReembedMigration,
+)
+from tests.conftest import BagOfWordsEmbedding
+
+pytestmark = pytest.mark.anyio
+
+TARGET = "all-minilm-l6-v2"
+TEXTS = [
+    ["postgres vacuum", "postgres pages", "autovacuum settings"],
+    ["cats purr", "dogs bark", "cats and dogs"],
+    ["zebra stripes", "zebra crossing"],
+]
+
+
+def target_embedding(text: str) -> np.ndarray:
+    target = get_backend(TARGET)
+    return next(BagOfWordsEmbedding(target.model, target.dim).embed([text]))
+
+
+@pytest.fixture
+async def corpus(db, make_document, monkeypatch):
+    """Three documents; a migration left running is aborted afterwards."""
+    monkeypatch.setattr(settings, "EMBED_BACKEND_POLL_S", 0)
+    assert active_backend().name != TARGET
+    assert get_backend(TARGET).dim == active_backend().dim
+    document_ids = [await make_document(texts) for texts in TEXTS]
+    # The migration locks `chunks`; the session must not hold it.
+    await db.commit()
+    yield document_ids
+    await db.commit()
+    await ReembedMigration.abort()
+    # Drop connections whose prepared statements saw the old columns.
+    await db.bind.dispose()
+
+
+def migration() -> ReembedMigration:
+    return ReembedMigration(get_backend(TARGET), batch_size=2, pause_s=0)
+
+
+async def chunks(db) -> dict:
+    """{text: (embedding_model, embedding)}"""
+    result = await db.execute(sql_text("SELECT text, embedding_model, embedding FROM chunks"))
+    rows = {row.text: (row.embedding_model, np.asarray(row.embedding)) for row in result}
+    await db.commit()
+    return rows
+
+
+async def migration_row(db):
+    result = await db.execute(
+        sql_text("SELECT status, rows_done, rows_total, target FROM embedding_migrations")
+    )
+    row = result.one()
+    await db.commit()
+    return row
+
+
+async def centroid(db, document_id: int):
+    result = await db.execute(
+        sql_text(
+            "SELECT embedding FROM document_embeddings WHERE document_id = :id AND section = 0"
+        ),
+        {"id": document_id},
+    )
+    embedding = result.scalar_one_or_none()
+    await db.commit()
+    return None if embedding is None else np.asarray(embedding)
+
+
+async def write_with_the_old_backend(db, document_id: int, texts):
+    await VectorService.upsert_chunks(
+        db, document_id, None, texts, await EmbeddingService.embbed_doc(texts)
+    )
+
+
+def assert_all_migrated(rows: dict):
+    for text, (model, embedding) in rows.items():
+        assert model == TARGET
+        assert np.allclose(embedding, target_embedding(text), atol=1e-6), text
+
+
+async def test_the_corpus_is_swapped_to_the_target(db, corpus):
+    assert await migration().run() == SWAPPED
+
+    assert_all_migrated(await chunks(db))
+    row = await migration_row(db)
+    assert (row.status, row.rows_done, row.rows_total, row.target) == (SWAPPED, 8, 8, TARGET)
+    # Centroids are those of the new vectors.
+    expected = np.mean([target_embedding(text) for text in TEXTS[2]], axis=0)
+    assert np.allclose(await centroid(db, corpus[2]), expected, atol=1e-5)
+    # The new column, centroid table and their indexes took the old ones' places.
+    result = await db.execute(
+        sql_text(
+            "SELECT (SELECT count(*) FROM pg_attribute WHERE attrelid = 'chunks'::regclass "
+            "AND attname = :column AND NOT attisdropped), to_regclass(:index) IS NOT NULL, "
+            "(SELECT array_agg(relname::text ORDER BY relname) FROM pg_class "
+            "WHERE oid IN (SELECT indexrelid FROM pg_index "
+            "WHERE indrelid = 'document_embeddings'::regclass)), "
+            "(SELECT array_agg(conname::text ORDER BY conname) FROM pg_constraint "
+            "WHERE conrelid = 'document_embeddings'::regclass), "
+            "to_regclass(:stage) IS NULL AND to_regclass(:dirty) IS NULL"
+        ),
+        {
+            "column": NEXT_COLUMN,
+            "index": INDEX_NAMES[settings.VECTOR_INDEX_MODE],
+            "stage": STAGE_TABLE,
+            "dirty": DIRTY_TABLE,
+        },
+    )
+    assert tuple(result.one()) == (
+        0,
+        True,
+        ["document_embeddings_pkey", DOCUMENT_INDEX_NAME, "ix_document_embeddings_owner_id"],
+        ["document_embeddings_document_id_fkey", "document_embeddings_pkey"],
+        True,
+    )
+    await db.commit()
+
+
+async def test_the_swap_only_recomputes_documents_written_after_staging(
+    db, corpus, make_document, monkeypatch
+):
+    stage = ReembedMigration._stage_centroids
+    written = []
+
+    async def stage_then_write(self):
+        await stage(self)
+        # Written by the API while the staged centroids were indexed.
+        written.append(await make_document(["late document"]))
+        await write_with_the_old_backend(db, corpus[1], ["another cat"])
+        async with db.bind.begin() as conn:
+            await conn.execute(sql_text("DELETE FROM documents WHERE id = :id"), {"id": corpus[2]})
+
+    refreshed = []
+    refresh = reembed_service.refresh_document_embeddings
+
+    async def recording_refresh(conn, document_ids, **kwargs):
+        refreshed.append(None if document_ids is None else sorted(document_ids))
+        await refresh(conn, document_ids, **kwargs)
+
+    monkeypatch.setattr(ReembedMigration, "_stage_centroids", stage_then_write)
+    monkeypatch.setattr(reembed_service, "refresh_document_embeddings", recording_refresh)
+    assert await migration().run() == SWAPPED
+
+    # Staging covers every document; the swap only those written since.
+    assert refreshed[:2] == [None, sorted([corpus[1], corpus[2], written[0]])]
+    assert_all_migrated(await chunks(db))
+    expected = np.mean([target_embedding(t) for t in TEXTS[1] + ["another cat"]], axis=0)
+    assert np.allclose(await centroid(db, corpus[1]), expected, atol=1e-5)
+    assert np.allclose(
+        await centroid(db, written[0]), target_embedding("late document"), atol=1e-5
+    )
+    assert await centroid(db, corpus[2]) is None
+
+
+async def test_chunks_edited_during_the_migration_are_embedded_again(db, corpus, monkeypatch):
+    embed = ReembedMigration._embed
+    edited = []
+
+    async def embed_then_edit(self, rows):
+        vectors = await embed(self, rows)
+        if not edited:
+            # Written by the API while this batch was being embedded.
+            async with db.bind.begin() as conn:
+                await conn.execute(
+                    sql_text("UPDATE chunks SET text = 'edited text' WHERE id = :id"),
+                    {"id": rows[0].id},
+                )
+            edited.append(rows[0].id)
+        return vectors
+
+    monkeypatch.setattr(ReembedMigration, "_embed", embed_then_edit)
+    assert await migration().run() == SWAPPED
+    rows = await chunks(db)
+    assert "edited text" in rows
+    assert_all_migrated(rows)
+
+
+async def test_chunks_written_with_the_old_backend_after_the_swap_are_repaired(
+    db, corpus, monkeypatch
+):
+    monkeypatch.setattr(settings, "EMBED_BACKEND_POLL_S", 0.2)
+    swap, repair = ReembedMigration._swap, ReembedMigration._repair
+    passes = []
+
+    async def swap_then_write(self):
+        await swap(self)
+        # This process has not switched backends yet.
+        await write_with_the_old_backend(db, corpus[0], ["late chunk"])
+
+    async def repair_then_write(self):
+        repaired = await repair(self)
+        passes.append(repaired)
+        if len(passes) == 2:
+            # Another process is still on the old backend after a pass found nothing.
+            await write_with_the_old_backend(db, corpus[1], ["later chunk"])
+        return repaired
+
+    monkeypatch.setattr(ReembedMigration, "_swap", swap_then_write)
+    monkeypatch.setattr(ReembedMigration, "_repair", repair_then_write)
+    assert await migration().run() == SWAPPED
+    assert passes[:3] == [1, 0, 1] and passes[-1] == 0
+    rows = await chunks(db)
+    assert {"late chunk", "later chunk"} <= rows.keys()
+    assert_all_migrated(rows)
+
+
+async def test_a_stopped_migration_resumes(db, corpus, monkeypatch):
+    first = migration()
+    embed = ReembedMigration._embed
+
+    async def embed_then_stop(self, rows):
+        self.stop()
+        return await embed(self, rows)
+
+    monkeypatch.setattr(first, "_embed", embed_then_stop.__get__(first))
+    assert await first.run() == RUNNING
+    row = await migration_row(db)
+    assert (row.status, row.rows_done) == (RUNNING, 2)
+
+    # Only one migration runs at a time.
+    with pytest.raises(RuntimeError):
+        await ReembedMigration(get_backend("snowflake-arctic-embed-xs")).run()
+
+    second = migration()
+    assert await second.run() == SWAPPED
+    assert second.id == first.id
+    assert (await migration_row(db)).rows_done == 8
+    assert_all_migrated(await chunks(db))
+
+
+async def test_an_aborted_migration_drops_its_column(db, corpus):
+    first = migration()
+    first.stop()
+    assert await first.run() == RUNNING
+
+    args = argparse.Namespace(abort=True, to=None)
+    await reembed.main(args)
+    assert (await migration_row(db)).status == ABORTED
+    result = await db.execute(
+        sql_text(
+            "SELECT count(*) FROM pg_attribute WHERE attrelid = 'chunks'::regclass "
+            "AND attname = :column AND NOT attisdropped"
+        ),
+        {"column": NEXT_COLUMN},
+    )
+    assert result.scalar_one() == 0
+    await db.commit()
+    # The live vectors were left alone.
+    assert {model for model, _ in (await chunks(db)).values()} == {active_backend().name}
+
+
+async def test_migrating_to_the_current_backend_is_refused(db, corpus):
+    with pytest.raises(ValueError):
+        await ReembedMigration(active_backend()).run()
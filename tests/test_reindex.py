@@ -0,0 +1,109 @@
+from typing import AsyncIterator, List
+
+import pytest
+from sqlalchemy import text as sql_text
+
+from app.models import Document
+from app.services.embeddings import ChunkIds, EmbeddingService
+from app.services.ingest import IngestPipeline
+
+pytestmark = pytest.mark.anyio
+
+OWNER = 6
+
+
+def section(n: int, word: str = "original") -> str:
+    """A section; headings start a new chunk, so sections chunk independently."""
+    return f"# Section {n}\n\n" + " ".join(
+        f"Section {n} {word} sentence {i}." for i in range(40)
+    )
+
+
+async def segments(sections: List[str]) -> AsyncIterator[str]:
+    for text in sections:
+        yield text + "\n\n"
+
+
+async def new_document(db) -> int:
+    document = Document(title="doc", owner_id=OWNER)
+    db.add(document)
+    await db.commit()
+    return document.id
+
+
+async def stored(db, document_id: int) -> dict:
+    """{chunk id: (chunk_index, embedding)}"""
+    result = await db.execute(
+        sql_text(
+            "SELECT id, chunk_index, embedding::text AS embedding FROM chunks "
+            "WHERE document_id = :id"
+        ),
+        {"id": document_id},
+    )
+    return {row.id: (row.chunk_index, row.embedding) for row in result}
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """The texts sent to the embedding model."""
+    texts = []
+    embbed_doc = EmbeddingService.embbed_doc
+
+    async def recording_embbed_doc(chunks):
+        texts.extend(chunks)
+        return await embbed_doc(chunks)
+
+    monkeypatch.setattr(EmbeddingService, "embbed_doc", staticmethod(recording_embbed_doc))
+    return texts
+
+
+async def ingest(db, document_id: int, sections: List[str], reindex: bool = True):
+    return await IngestPipeline().run(db, document_id, OWNER, segments(sections), reindex=reindex)
+
+
+def test_chunk_ids_address_content():
+    first, second = ChunkIds(1), ChunkIds(1)
+    ids = [first.next(text) for text in ["a", "b", "a"]]
+    assert ids == [second.next(text) for text in ["a", "b", "a"]]
+    # Repeated texts stay distinct.
+    assert len(set(ids)) == 3 and ids[0].rsplit(":", 1)[0] == ids[2].rsplit(":", 1)[0]
+    assert ChunkIds(2).next("a") != ids[0]
+
+
+async def test_reindexing_unchanged_content_embeds_nothing(db, embedded):
+    document_id = await new_document(db)
+    sections = [section(n) for n in range(6)]
+    await ingest(db, document_id, sections, reindex=False)
+    before = await stored(db, document_id)
+    embedded.clear()
+
+    stats = await ingest(db, document_id, sections)
+    assert (stats.embedded, stats.moved, stats.deleted) == (0, 0, 0)
+    assert embedded == []
+    assert await stored(db, document_id) == before
+
+
+async def test_reindexing_embeds_only_changed_chunks(db, embedded):
+    document_id = await new_document(db)
+    sections = [section(n) for n in range(6)]
+    await ingest(db, document_id, sections, reindex=False)
+    before = await stored(db, document_id)
+    embedded.clear()
+
+    # A new first section, one edited and one removed.
+    edited = [section(99), *sections[:2], section(2, "edited"), *sections[4:]]
+    stats = await ingest(db, document_id, edited)
+    after = await stored(db, document_id)
+
+    kept = set(after) & set(before)
+    assert stats.embedded == len(embedded) == len(set(after) - kept)
+    assert embedded and all(
+        text.startswith(("# Section 99", "# Section 2")) for text in embedded
+    )
+    assert stats.deleted == len(set(before) - kept) == 2
+    # Sections 0 and 1 moved down behind the new one; 4 and 5 kept their place.
+    moved = {chunk_id for chunk_id in kept if after[chunk_id][0] != before[chunk_id][0]}
+    assert stats.moved == len(moved) == 2 and len(kept) == 4
+    # Kept chunks keep their vectors.
+    assert all(after[chunk_id][1] == before[chunk_id][1] for chunk_id in kept)
+    assert sorted(index for index, _ in after.values()) == list(range(len(after)))
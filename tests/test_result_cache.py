@@ -0,0 +1,116 @@
+from typing import Dict, List, Optional, Sequence
+
+import pytest
+
+from app.core.result_cache import ResultCache, SharedCache, query_scopes
+from app.services.embeddings import EmbeddingService, VectorService
+from tests.conftest import embed_text
+
+pytestmark = pytest.mark.anyio
+
+
+class MemoryCache(SharedCache):
+    """A `SharedCache` in a dict, standing in for Redis between two caches."""
+
+    def __init__(self) -> None:
+        self.values: Dict[str, bytes] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.values.get(key)
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float):
+        self.values[key] = value
+
+    async def counters(self, keys: Sequence[str]) -> List[int]:
+        return [int(self.values.get(key, 0)) for key in keys]
+
+    async def incr(self, keys: Sequence[str]):
+        for key in keys:
+            self.values[key] = str(int(self.values.get(key, 0)) + 1).encode()
+
+
+class Counted:
+    """A compute function that counts its calls."""
+
+    def __init__(self, value="result") -> None:
+        self.value = value
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+async def lookup(cache: ResultCache, compute: Counted, owner_id=None, document_ids=None):
+    key = (owner_id, tuple(document_ids or ()))
+    return await cache.get_or_compute(
+        "chunks", key, query_scopes(owner_id, document_ids), compute
+    )
+
+
+async def test_results_are_cached_until_a_searched_document_changes():
+    cache = ResultCache()
+    by_doc, by_owner, everything, other = Counted(), Counted(), Counted(), Counted()
+    for _ in range(2):
+        await lookup(cache, by_doc, document_ids=[1])
+        await lookup(cache, by_owner, owner_id=10)
+        await lookup(cache, everything)
+        await lookup(cache, other, document_ids=[2])
+    assert [c.calls for c in (by_doc, by_owner, everything, other)] == [1, 1, 1, 1]
+
+    await cache.invalidate(1, owner_id=10)
+    for compute, filters in [
+        (by_doc, {"document_ids": [1]}),
+        (by_owner, {"owner_id": 10}),
+        (everything, {}),
+        (other, {"document_ids": [2]}),
+    ]:
+        await lookup(cache, compute, **filters)
+    assert [c.calls for c in (by_doc, by_owner, everything, other)] == [2, 2, 2, 1]
+
+
+async def test_a_disabled_cache_always_computes():
+    cache, compute = ResultCache(max_entries=0), Counted()
+    await lookup(cache, compute)
+    await lookup(cache, compute)
+    assert compute.calls == 2
+
+
+async def test_invalidations_reach_workers_sharing_a_store():
+    shared = MemoryCache()
+    first, second = ResultCache(shared=shared), ResultCache(shared=shared)
+    compute = Counted()
+    await lookup(first, compute, document_ids=[1])
+    # Served from the shared tier.
+    assert await lookup(second, compute, document_ids=[1]) == "result"
+    assert compute.calls == 1
+
+    await first.invalidate(1, owner_id=None)
+    await lookup(second, compute, document_ids=[1])
+    assert compute.calls == 2
+
+
+@pytest.mark.parametrize(
+    "processes, shared, enabled",
+    [(1, None, True), (4, None, False), (4, MemoryCache(), True)],
+    ids=["one-worker", "workers-without-store", "workers-with-store"],
+)
+def test_several_workers_need_a_shared_store(processes, shared, enabled):
+    cache = ResultCache(shared=shared)
+    cache.require_shared(processes)
+    assert cache.enabled is enabled
+
+
+async def test_search_results_follow_document_writes(db, make_document):
+    document_id = await make_document(["postgres vacuum"])
+    query = await EmbeddingService.embbed_string("autovacuum settings")
+
+    before = await VectorService.query_similar_chunks(db, query, document_ids=[document_id])
+    assert [hit["text"] for hit in before] == ["postgres vacuum"]
+
+    text = "autovacuum settings"
+    await VectorService.upsert_chunks(
+        db, document_id, None, [text], [embed_text(text)], start_index=1
+    )
+    after = await VectorService.query_similar_chunks(db, query, document_ids=[document_id])
+    assert after[0]["text"] == text
@@ -0,0 +1,73 @@
+import pytest
+
+from app.core.config import settings
+from app.core.search_pool import to_positional
+from app.services.embeddings import VectorService
+from app.services.search_planner import EXACT, FILTERED, fetch_scalar, search_planner
+from tests.conftest import embed_text
+
+pytestmark = pytest.mark.anyio
+
+OWNER_A, OWNER_B = 1, 2
+
+
+def test_to_positional_numbers_binds_in_order_of_first_use():
+    query, args = to_positional(
+        "SELECT :b, :a, :b, x::text FROM t WHERE y = :a", {"a": 1, "b": 2}
+    )
+    assert query == "SELECT $1, $2, $1, x::text FROM t WHERE y = $2"
+    assert args == [2, 1]
+
+
+async def test_fetch_scalar_binds_every_argument(fast_path):
+    async with fast_path.acquire() as conn:
+        value = await fetch_scalar(conn, "SELECT :a::int + :b::int", {"a": 2, "b": 3})
+    assert value == 5
+
+
+@pytest.fixture
+async def corpus(make_document):
+    a1 = await make_document(
+        ["postgres stores rows in pages", "vacuum reclaims dead rows"], owner_id=OWNER_A
+    )
+    a2 = await make_document(["cats sleep most of the day"], owner_id=OWNER_A)
+    b1 = await make_document(
+        ["postgres replication streams the wal", "cats chase mice"], owner_id=OWNER_B
+    )
+    return {"a1": a1, "a2": a2, "b1": b1}
+
+
+@pytest.mark.parametrize("exact_max_rows", [20_000, 0], ids=["exact", "filtered"])
+async def test_fast_path_owner_filter(db, fast_path, corpus, monkeypatch, exact_max_rows):
+    # With no room for an exact scan the planner falls back to EXPLAIN estimates,
+    # which depend on whatever statistics earlier tests left behind; any
+    # selectivity they give must plan a filtered search.
+    monkeypatch.setattr(settings, "SEARCH_EXACT_MAX_ROWS", exact_max_rows)
+    monkeypatch.setattr(settings, "SEARCH_FILTERED_MAX_SELECTIVITY", 1.0)
+    query = embed_text("postgres rows")
+
+    plan = await _plan(fast_path, OWNER_A, None)
+    assert plan.strategy == (EXACT if exact_max_rows else FILTERED)
+
+    fast = await VectorService.query_similar_chunks_fast(query, top_k=10, owner_id=OWNER_A)
+    assert {hit["document_id"] for hit in fast} == {corpus["a1"], corpus["a2"]}
+    assert fast[0]["text"] == "postgres stores rows in pages"
+
+    search_planner._estimates.clear()
+    slow = await VectorService._query_similar_chunks(db, query, 10, OWNER_A, None, None)
+    assert [hit["id"] for hit in fast] == [hit["id"] for hit in slow]
+
+
+async def test_fast_path_document_filter(db, fast_path, corpus):
+    query = embed_text("cats")
+    hits = await VectorService.query_similar_chunks_fast(
+        query, top_k=10, owner_id=OWNER_B, document_ids=[corpus["b1"], corpus["a2"]]
+    )
+    assert [hit["document_id"] for hit in hits] == [corpus["b1"], corpus["b1"]]
+    assert hits[0]["text"] == "cats chase mice"
+
+
+async def _plan(pool, owner_id, document_ids):
+    search_planner._estimates.clear()
+    async with pool.acquire() as conn:
+        return await search_planner.plan(conn, owner_id, document_ids, 10)
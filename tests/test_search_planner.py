@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+from sqlalchemy import text as sql_text
+
+from app.core.config import settings
+from app.models import Document, EMBEDDING_DIM
+from app.services.embeddings import VectorService
+from app.services.search_planner import EXACT, FILTERED, HNSW, search_planner
+
+pytestmark = pytest.mark.anyio
+
+CHUNKS_PER_DOC = 30
+# Documents per owner: 2% (exact scan), 20% (filtered HNSW) and 78% of the rows.
+TENANTS = {1: 2, 2: 20, 3: 78}
+TOP_K = 10
+
+
+def clustered_vectors(seed: int) -> np.ndarray:
+    """Unit vectors around one random center, like the chunks of one document."""
+    rng = np.random.default_rng(seed)
+    center = rng.standard_normal(EMBEDDING_DIM, dtype=np.float32)
+    vectors = center + 0.8 * rng.standard_normal((CHUNKS_PER_DOC, EMBEDDING_DIM), np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+async def tenants(db, monkeypatch):
+    """{owner_id: document ids}, with small thresholds so each tenant plans differently."""
+    monkeypatch.setattr(settings, "SEARCH_EXACT_MAX_ROWS", 100)
+    monkeypatch.setattr(settings, "SEARCH_FILTERED_MAX_SELECTIVITY", 0.5)
+    documents = {}
+    for owner_id, docs in TENANTS.items():
+        documents[owner_id] = []
+        for n in range(docs):
+            document = Document(title=f"{owner_id}-{n}", owner_id=owner_id)
+            db.add(document)
+            await db.commit()
+            await VectorService.upsert_chunks(
+                db,
+                document.id,
+                owner_id,
+                [f"owner {owner_id} document {n} chunk {i}" for i in range(CHUNKS_PER_DOC)],
+                clustered_vectors(document.id),
+            )
+            documents[owner_id].append(document.id)
+    await db.execute(sql_text("ANALYZE chunks"))
+    await db.commit()
+    return documents
+
+
+def queries(documents: list, n: int = 20) -> list:
+    """Perturbed chunk vectors of the given documents."""
+    rng = np.random.default_rng(n)
+    picks = rng.choice(documents, size=n)
+    out = []
+    for document_id in picks:
+        q = clustered_vectors(int(document_id))[0] + 0.3 * rng.standard_normal(
+            EMBEDDING_DIM, np.float32
+        )
+        out.append(q / np.linalg.norm(q))
+    return out
+
+
+async def recall(db, owner_id: int, documents: list, strategy=None) -> float:
+    """Recall@k of `strategy` (or the planned one) against exact search."""
+    found = truth = 0
+    for q in queries(documents):
+        hits = await VectorService.query_similar_chunks(
+            db, q, top_k=TOP_K, owner_id=owner_id, strategy=strategy
+        )
+        exact = await VectorService.query_similar_chunks(
+            db, q, top_k=TOP_K, owner_id=owner_id, strategy=EXACT
+        )
+        assert {hit["document_id"] for hit in hits} <= set(documents)
+        found += len({hit["id"] for hit in hits} & {hit["id"] for hit in exact})
+        truth += len(exact)
+    return found / truth
+
+
+async def test_each_plan_keeps_recall_against_exact_search(db, tenants):
+    # Loading the corpus dominates, so one test covers every selectivity.
+    for owner_id, strategy, min_recall in [
+        (1, EXACT, 1.0),
+        (2, FILTERED, 0.95),
+        (3, HNSW, 0.8),
+    ]:
+        plan = await search_planner.plan(db, owner_id, None, TOP_K)
+        assert plan.strategy == strategy
+        assert await recall(db, owner_id, tenants[owner_id]) >= min_recall
+
+
+async def test_filtered_plan_beats_plain_hnsw_on_a_selective_filter(db, tenants):
+    # A fifth of the rows pass the filter, so about five times the default
+    # candidates are needed for as many to survive it.
+    plan = await search_planner.plan(db, 2, None, TOP_K)
+    assert plan.ef_search >= 4 * settings.HNSW_EF_SEARCH
+    assert await recall(db, 2, tenants[2]) > await recall(db, 2, tenants[2], strategy=HNSW)
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import httpx
+import pytest
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import settings
+from app.core.embedding import embbed_model, embedding_engine, query_embedding_cache
+from app.core.embedding_backends import active_backend, get_backend, set_active_backend
+from app.core.startup import WARMUP_TEXTS, Startup, startup
+from app.main import app
+from app.models import EmbeddingMigration
+
+pytestmark = pytest.mark.anyio
+
+HEAVY_MODULES = ["pdfminer", "docx", "PIL", "pytesseract", "pydub", "bs4", "httpx", "fastembed"]
+
+
+def test_importing_the_app_loads_no_parser_or_model_backends():
+    script = (
+        "import sys, app.main; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    env = {**os.environ, "DB_URL": "postgresql+asyncpg://localhost/unused"}
+    result = subprocess.run(
+        [sys.executable, "-c", script], env=env, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+@pytest.mark.parametrize("warmup", [True, False])
+def test_preload_loads_and_warms_up_the_model(monkeypatch, warmup):
+    monkeypatch.setattr(settings, "EMBED_WARMUP", warmup)
+    state = Startup()
+    state.preload()
+    assert state.model_ready and embbed_model.loaded
+    expected = {"model_load", "warmup", "ready"} if warmup else {"model_load", "ready"}
+    assert set(state.seconds) == expected
+
+
+@pytest.fixture
+def model_batches(monkeypatch):
+    """The texts of every call into the embedding engine."""
+    batches = []
+    embed = embedding_engine.embed
+
+    async def recording_embed(texts):
+        batches.append(texts)
+        return await embed(texts)
+
+    monkeypatch.setattr(embedding_engine, "embed", recording_embed)
+    return batches
+
+
+async def wait_for(condition, timeout: float = 5.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+async def test_the_model_warms_up_in_the_background(embedder, model_batches):
+    state = Startup()
+    state.start()
+    try:
+        await wait_for(lambda: state.model_ready)
+        assert model_batches == [WARMUP_TEXTS]
+        assert {"model_load", "warmup", "ready"} <= set(state.seconds)
+    finally:
+        await state.stop()
+    assert state._task is None
+
+
+async def test_a_model_that_fails_to_load_is_reported(monkeypatch):
+    def fail():
+        raise OSError("no model files")
+
+    monkeypatch.setattr(embbed_model, "init", fail)
+    state = Startup()
+    state.start()
+    # The task ends instead of following migrations with no model.
+    await asyncio.wait_for(state._task, 5)
+    assert not state.model_ready and "no model files" in state.error
+
+
+async def test_readiness_needs_the_database(monkeypatch):
+    unreachable = create_async_engine("postgresql+asyncpg://postgres@127.0.0.1:1/none")
+    monkeypatch.setattr("app.core.startup.engine", unreachable)
+    monkeypatch.setattr(settings, "HEALTH_DB_TIMEOUT_S", 1.0)
+    state = Startup()
+    state.model_ready = True
+    try:
+        report = await state.check()
+    finally:
+        await unreachable.dispose()
+    assert report["ready"] is False
+    assert report["checks"] == {"model": True, "database": False}
+
+
+async def test_liveness_and_readiness_endpoints(database, monkeypatch):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.get("/health/live")).status_code == 200
+
+        monkeypatch.setattr(startup, "model_ready", False)
+        response = await client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["checks"] == {"model": False, "database": True}
+
+        monkeypatch.setattr(startup, "model_ready", True)
+        response = await client.get("/health/ready")
+        assert response.status_code == 200 and response.json()["ready"] is True
+
+
+@pytest.fixture
+def restore_backend():
+    """Switch back to the backend the tests started with."""
+    backend = active_backend()
+    yield backend
+    embbed_model.switch(backend)
+    set_active_backend(backend)
+    embedding_engine.max_batch_size = backend.max_batch_size
+
+
+async def swap_to(db, source: str, target: str):
+    db.add(
+        EmbeddingMigration(
+            source=source, target=target, status="swapped", swapped_at=func.now()
+        )
+    )
+    await db.commit()
+
+
+async def test_processes_follow_a_swapped_migration(db, restore_backend):
+    state = Startup()
+    assert await state.follow_backend() is False
+
+    target = get_backend("all-minilm-l6-v2")
+    assert target.dim == restore_backend.dim and target != restore_backend
+    await swap_to(db, restore_backend.name, target.name)
+    embbed_model.init()
+    query_embedding_cache.set("query", [1.0])
+    assert await state.follow_backend() is True
+    assert active_backend() == embbed_model.backend == target
+    assert query_embedding_cache.get("query") is None
+    # Already following it.
+    assert await state.follow_backend() is False
+
+
+async def test_a_swap_to_another_dimension_needs_a_restart(db, restore_backend):
+    await swap_to(db, restore_backend.name, "bge-base-en-v1.5")
+    state = Startup()
+    state.model_ready = True
+    assert await state.follow_backend() is False
+    assert active_backend() == restore_backend
+    assert not state.model_ready and "EMBED_BACKEND=bge-base-en-v1.5" in state.error
@@ -0,0 +1,139 @@
+import io
+import math
+import shutil
+import struct
+import wave
+
+import httpx
+import pytest
+
+from app.services.transcription import TranscriptionEngine, stitch
+
+pytestmark = pytest.mark.anyio
+
+needs_ffmpeg = pytest.mark.skipif(
+    not (shutil.which("ffmpeg") and shutil.which("ffprobe")), reason="needs ffmpeg and ffprobe"
+)
+
+
+def make_engine(**kwargs) -> TranscriptionEngine:
+    return TranscriptionEngine(
+        url="http://transcription.test/v1", api_key="key", model="whisper", **kwargs
+    )
+
+
+def tone(seconds: float, rate: int = 16000, silent_from: float = math.inf) -> bytes:
+    """A 440 Hz WAV, silent after `silent_from` seconds."""
+    step = 2 * math.pi * 440 / rate
+    frames = b"".join(
+        struct.pack("<h", 0 if i >= silent_from * rate else int(8000 * math.sin(i * step)))
+        for i in range(int(seconds * rate))
+    )
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(frames)
+    return buffer.getvalue()
+
+
+def recording_client(engine: TranscriptionEngine, requests: list):
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request.read())
+        return httpx.Response(200, json={"text": f"part {len(requests)}"})
+
+    engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def test_short_audio_is_sent_as_its_flac_reencode(monkeypatch):
+    engine = make_engine()
+    requests: list = []
+    recording_client(engine, requests)
+    monkeypatch.setattr(engine, "split", lambda audio: [b"fLaC-encoded"])
+
+    assert await engine.transcribe(b"RIFF" + b"\0" * 1_000_000, "audio/wav") == "part 1"
+    assert len(requests) == 1
+    assert b"fLaC-encoded" in requests[0]
+    assert b"RIFF" not in requests[0]
+    assert b"audio/flac" in requests[0]
+    await engine.stop()
+
+
+async def test_segments_are_transcribed_and_stitched_in_order(monkeypatch):
+    engine = make_engine(concurrency=2)
+    requests: list = []
+    recording_client(engine, requests)
+    monkeypatch.setattr(engine, "split", lambda audio: [b"one", b"two", b"three"])
+
+    text = await engine.transcribe(b"audio", "audio/mpeg")
+    assert sorted(text.split()[1::2]) == ["1", "2", "3"]
+    assert len(requests) == 3
+    await engine.stop()
+
+
+async def test_retries_throttled_requests(monkeypatch):
+    engine = make_engine(max_retries=2, backoff_sec=0)
+    statuses = iter([429, 503, 200])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        status = next(statuses)
+        return httpx.Response(status, json={"text": "done"} if status == 200 else {})
+
+    engine._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(engine, "split", lambda audio: [b"flac"])
+    assert await engine.transcribe(b"audio", "audio/wav") == "done"
+    await engine.stop()
+
+
+def test_cuts_land_in_silence_or_overlap():
+    from pydub import AudioSegment
+
+    engine = make_engine(segment_sec=10, overlap_sec=1)
+    with_silence = AudioSegment.from_wav(io.BytesIO(tone(25, silent_from=9.2)))
+    cuts = engine.plan_cuts(with_silence)
+    assert 9200 < cuts[0][1] < 10000
+    assert cuts[-1][1] == len(with_silence)
+
+    continuous = AudioSegment.from_wav(io.BytesIO(tone(25)))
+    cuts = engine.plan_cuts(continuous)
+    assert cuts[0] == (0, 10000)
+    assert cuts[1][0] == 9000
+
+
+@pytest.mark.parametrize("overlap_sec", [-1, 10, 12])
+def test_overlaps_must_be_shorter_than_a_segment(overlap_sec):
+    with pytest.raises(ValueError):
+        make_engine(segment_sec=10, overlap_sec=overlap_sec)
+
+
+def test_cuts_always_move_forward():
+    from pydub import AudioSegment
+
+    engine = make_engine(segment_sec=1, overlap_sec=0)
+    engine.overlap_ms = engine.segment_ms
+    cuts = engine.plan_cuts(AudioSegment.from_wav(io.BytesIO(tone(1.005))))
+    assert [start for start, _ in cuts] == [0, 1, 2, 3, 4, 5]
+
+
+@needs_ffmpeg
+def test_split_reencodes_short_audio_to_flac():
+    segments = make_engine(segment_sec=10).split(tone(2, rate=44100))
+    assert len(segments) == 1
+    assert segments[0].startswith(b"fLaC")
+
+
+@needs_ffmpeg
+def test_split_cuts_long_audio():
+    segments = make_engine(segment_sec=10).split(tone(25))
+    assert len(segments) == 3
+    assert all(segment.startswith(b"fLaC") for segment in segments)
+
+
+def test_stitch_drops_words_repeated_across_an_overlap():
+    assert (
+        stitch(["the quick brown fox", "Brown fox jumps over"])
+        == "the quick brown fox jumps over"
+    )
+    assert stitch(["no overlap", "here at all"]) == "no overlap here at all"
+    assert stitch(["", "only", ""]) == "only"
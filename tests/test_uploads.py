@@ -0,0 +1,105 @@
+import hashlib
+import os
+import tempfile
+
+import httpx
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+
+from app.core import uploads
+from app.core.uploads import RequestSizeLimitMiddleware, spool_upload
+from tests.conftest import upload_file
+
+pytestmark = pytest.mark.anyio
+
+DATA = bytes(range(256)) * 64  # 16 KiB
+
+
+@pytest.mark.parametrize("sized", [True, False], ids=["sized", "unsized"])
+async def test_small_uploads_stay_in_memory(sized):
+    async with spool_upload(upload_file(DATA, sized=sized), spool_threshold=len(DATA)) as source:
+        assert source.path is None
+        assert source.data == DATA and source.size == len(DATA)
+        assert source.sha256 == hashlib.sha256(DATA).hexdigest()
+
+
+async def test_large_uploads_are_spooled_to_one_removed_file():
+    file = upload_file(DATA, content_type="application/pdf")
+    async with spool_upload(file, spool_threshold=1024) as source:
+        assert source.data is None and source.path.endswith(".pdf")
+        assert source.read_bytes() == DATA and source.content == source.path
+        assert source.sha256 == hashlib.sha256(DATA).hexdigest()
+    assert not os.path.exists(source.path)
+
+
+async def test_declared_sizes_over_the_limit_are_rejected_before_reading():
+    file = upload_file(DATA)
+    with pytest.raises(HTTPException) as e:
+        async with spool_upload(file, max_bytes=len(DATA) - 1):
+            pass
+    assert e.value.status_code == 413
+    assert file.file.tell() == 0
+
+
+async def test_unsized_uploads_are_cut_off_at_the_limit(monkeypatch):
+    spools = []
+    named_temporary_file = tempfile.NamedTemporaryFile
+
+    def recording(*args, **kwargs):
+        spools.append(named_temporary_file(*args, **kwargs))
+        return spools[-1]
+
+    monkeypatch.setattr(uploads.tempfile, "NamedTemporaryFile", recording)
+    monkeypatch.setattr(uploads, "_READ_SIZE", 1024)
+    file = upload_file(DATA, sized=False)
+    with pytest.raises(HTTPException) as e:
+        async with spool_upload(file, max_bytes=len(DATA) - 1, spool_threshold=1024):
+            pass
+    assert e.value.status_code == 413
+    assert len(spools) == 1 and not os.path.exists(spools[0].name)
+
+
+def app_with_limit(max_bytes: int) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(RequestSizeLimitMiddleware, max_bytes=max_bytes)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return app
+
+
+async def post(app: FastAPI, **kwargs) -> httpx.Response:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post("/upload", **kwargs)
+
+
+async def test_requests_within_the_limit_pass():
+    response = await post(app_with_limit(len(DATA) + 1024), files={"file": ("a.bin", DATA)})
+    assert response.json() == {"size": len(DATA)}
+
+
+async def test_requests_declaring_too_large_a_body_are_rejected():
+    response = await post(app_with_limit(1024), files={"file": ("a.bin", DATA)})
+    assert response.status_code == 413
+
+
+async def test_streamed_bodies_are_cut_off_at_the_limit():
+    async def body():
+        # A multipart upload of four times DATA, without a Content-Length.
+        yield (
+            b'--x\r\nContent-Disposition: form-data; name="file"; filename="a.bin"\r\n'
+            b"Content-Type: application/octet-stream\r\n\r\n"
+        )
+        for _ in range(4):
+            yield DATA
+        yield b"\r\n--x--\r\n"
+
+    response = await post(
+        app_with_limit(len(DATA) * 2),
+        content=body(),
+        headers={"content-type": "multipart/form-data; boundary=x"},
+    )
+    assert response.status_code == 413
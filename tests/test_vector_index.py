@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from sqlalchemy import text as sql_text
+
+from app.core.config import settings
+from app.core.vector_index import (
+    BINARY,
+    FULL,
+    HALFVEC,
+    INDEX_NAMES,
+    candidate_distance,
+    index_sql,
+)
+from app.models import Document, EMBEDDING_DIM
+from app.services.embeddings import VectorService
+from app.services.search_planner import EXACT, FILTERED, HNSW, SearchPlan, search_planner
+
+pytestmark = pytest.mark.anyio
+
+
+def test_index_ddl_per_mode():
+    assert index_sql(FULL) == (
+        "CREATE INDEX IF NOT EXISTS idx_chunks_embedding_hnsw ON chunks "
+        "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);"
+    )
+    assert f"((embedding)::halfvec({EMBEDDING_DIM})) halfvec_cosine_ops" in index_sql(HALFVEC)
+    assert f"(binary_quantize(embedding)::bit({EMBEDDING_DIM})) bit_hamming_ops" in index_sql(
+        BINARY
+    )
+    with pytest.raises(ValueError):
+        index_sql("pq")
+
+
+def test_candidates_are_ordered_by_the_indexed_expression():
+    assert candidate_distance(FULL, "embedding", ":q") == "embedding <=> :q"
+    assert candidate_distance(HALFVEC, "embedding", ":q") == (
+        f"(embedding)::halfvec({EMBEDDING_DIM}) <=> (:q)::halfvec({EMBEDDING_DIM})"
+    )
+    assert candidate_distance(BINARY, "embedding", ":q") == (
+        f"binary_quantize(embedding)::bit({EMBEDDING_DIM}) <~> binary_quantize(:q)"
+    )
+
+
+@pytest.mark.parametrize("mode", [HALFVEC, BINARY])
+def test_compact_modes_oversample_approximate_plans(mode, monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_INDEX_MODE", mode)
+    monkeypatch.setattr(settings, "VECTOR_RERANK_OVERSAMPLE", 10)
+    plan = search_planner.with_rerank(SearchPlan(HNSW), 20)
+    assert plan.candidates == 200 and plan.ef_search == 200
+    # A filtered plan keeps its larger ef_search; it never passes the cap.
+    filtered = search_planner.with_rerank(SearchPlan(FILTERED, ef_search=400), 20)
+    assert filtered.ef_search == 400
+    capped = search_planner.with_rerank(SearchPlan(HNSW), settings.HNSW_MAX_EF_SEARCH)
+    assert capped.ef_search == settings.HNSW_MAX_EF_SEARCH
+    # Exact scans read the full vectors anyway.
+    assert search_planner.with_rerank(SearchPlan(EXACT), 20) == SearchPlan(EXACT)
+
+
+def test_the_full_index_is_not_oversampled(monkeypatch):
+    monkeypatch.setattr(settings, "VECTOR_INDEX_MODE", FULL)
+    assert search_planner.with_rerank(SearchPlan(HNSW), 20) == SearchPlan(HNSW)
+
+
+@pytest.fixture
+async def compact_index(db, request, monkeypatch):
+    """The HNSW index of the `mode` parameter, dropped again afterwards."""
+    mode = request.param
+    version = (
+        await db.execute(sql_text("SELECT extversion FROM pg_extension WHERE extname = 'vector'"))
+    ).scalar_one()
+    if tuple(int(part) for part in version.split(".")[:2]) < (0, 7):
+        pytest.skip(f"{mode} indexes need pgvector >= 0.7, not {version}")
+    await db.execute(sql_text(index_sql(mode)))
+    await db.commit()
+    monkeypatch.setattr(settings, "VECTOR_INDEX_MODE", mode)
+    yield mode
+    await db.execute(sql_text(f"DROP INDEX IF EXISTS {INDEX_NAMES[mode]}"))
+    await db.commit()
+
+
+@pytest.mark.parametrize("compact_index", [HALFVEC, BINARY], indirect=True)
+async def test_compact_index_hits_are_reranked_at_full_precision(db, compact_index):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, EMBEDDING_DIM), np.float32)
+    document = Document(title="doc")
+    db.add(document)
+    await db.commit()
+    await VectorService.upsert_chunks(
+        db, document.id, None, [f"chunk {i}" for i in range(500)], vectors
+    )
+
+    found = 0
+    for q in vectors[:10] + 0.1 * rng.standard_normal((10, EMBEDDING_DIM), np.float32):
+        hits = await VectorService.query_similar_chunks(db, q, top_k=10, strategy=HNSW)
+        exact = await VectorService.query_similar_chunks(db, q, top_k=10, strategy=EXACT)
+        # Distances are the float32 ones, so hits are ordered like exact search.
+        exact_distance = {hit["id"]: hit["distance"] for hit in exact}
+        for hit in hits:
+            if hit["id"] in exact_distance:
+                assert hit["distance"] == pytest.approx(exact_distance[hit["id"]], abs=1e-6)
+        assert [hit["distance"] for hit in hits] == sorted(hit["distance"] for hit in hits)
+        found += len(exact_distance.keys() & {hit["id"] for hit in hits})
+    assert found / 100 >= 0.8